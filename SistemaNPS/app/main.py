@@ -1,13 +1,46 @@
+import time
+
+_import_start = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from app.routers import public, respostas, termo, ressalvas, finalizacao, nps, processos
+from app.routers import (
+    public, respostas, termo, ressalvas, finalizacao, nps, processos, analytics, busca, metrics, offline
+)
+from app.services import client_ids, http, profiling, replica, search
+from app.services.admission import AdmissionMiddleware
+from app.services.compression import CompressionMiddleware
+from app.services.metrics import MetricsMiddleware, set_gauge
+from app.services.profiling import ProfilingMiddleware
+from app.staticfiles import CachedStaticFiles
+
 
-app = FastAPI(title="Sistema de Termos")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Segredo dos ids offline: sem ele o worker não sobe
+    client_ids.verificar_segredo()
+    # Pool HTTP do worker: criado após o fork, fechado no shutdown
+    http.get_client()
+    # Réplica local de processos: sincronização em thread por worker
+    replica.iniciar()
+    # Índice de busca novo: construído em segundo plano, não na 1ª busca
+    search.garantir_indice()
+    yield
+    replica.parar()
+    http.close()
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-templates = Jinja2Templates(directory="app/templates")
+app = FastAPI(title="Sistema de Termos", lifespan=lifespan)
+
+# Profiling por dentro da admissão: mede só a execução, não a fila.
+# Admissão por dentro das métricas: os 503 também são contados
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")
 
 app.include_router(public.router)
 app.include_router(respostas.router)
@@ -16,3 +49,15 @@ app.include_router(ressalvas.router)
 app.include_router(finalizacao.router)
 app.include_router(nps.router)
 app.include_router(processos.router)
+app.include_router(analytics.router)
+app.include_router(busca.router)
+app.include_router(metrics.router)
+app.include_router(offline.router)
+
+profiling.instrumentar(app)
+
+set_gauge(
+    "sistemanps_import_seconds",
+    time.perf_counter() - _import_start,
+    help_text="Tempo de importação de app.main (routers incluídos)",
+)
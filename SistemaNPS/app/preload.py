@@ -0,0 +1,34 @@
+"""
+Aquecimento do processo antes de atender requisições.
+
+Com `gunicorn -c gunicorn.conf.py` (preload_app=True) roda uma única vez no
+master: ReportLab/PyPDF2 importados, métricas de fonte e logos decodificados
+e templates compilados ficam em páginas compartilhadas com os workers após o
+fork. O cliente Supabase NÃO é criado aqui (conexões não sobrevivem ao fork).
+"""
+import time
+
+from app.services.metrics import set_gauge
+
+
+def warm() -> float:
+    inicio = time.perf_counter()
+
+    import PyPDF2  # noqa: F401
+    from reportlab.pdfgen import canvas  # noqa: F401
+    from app.services import analytics  # noqa: F401  (NumPy)
+
+    from app.services.pdf_layout import preload_assets
+    from app.templating import templates
+
+    preload_assets()
+    for nome in templates.env.list_templates():
+        templates.env.get_template(nome)
+
+    elapsed = time.perf_counter() - inicio
+    set_gauge(
+        "sistemanps_preload_seconds",
+        elapsed,
+        help_text="Tempo de aquecimento (PDF stack, fontes, logos, templates)",
+    )
+    return elapsed
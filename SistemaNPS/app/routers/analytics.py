@@ -0,0 +1,59 @@
+from datetime import date, datetime
+from typing import Literal
+
+from fastapi import APIRouter
+
+router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
+
+# NumPy é importado só na primeira consulta (não pesa no startup dos workers)
+
+
+def _resposta(itens: list, snap) -> dict:
+    return {
+        "itens": itens,
+        "respostas": len(snap),
+        "gerado_em": datetime.utcfromtimestamp(snap.gerado_em).isoformat(),
+    }
+
+
+@router.get("/tendencia")
+def tendencia(
+    periodo: Literal["semana", "mes"] = "mes",
+    empresa: str | None = None,
+    responsavel: str | None = None,
+    desde: date | None = None,
+    ate: date | None = None,
+):
+    from app.services import analytics
+
+    itens, snap = analytics.tendencia(
+        periodo, empresa=empresa, responsavel=responsavel, desde=desde, ate=ate
+    )
+    return _resposta(itens, snap)
+
+
+@router.get("/grupos")
+def grupos(
+    por: Literal["empresa", "responsavel"] = "empresa",
+    desde: date | None = None,
+    ate: date | None = None,
+):
+    from app.services import analytics
+
+    itens, snap = analytics.agrupar(por, desde=desde, ate=ate)
+    return _resposta(itens, snap)
+
+
+@router.get("/avaliacoes")
+def avaliacoes(
+    empresa: str | None = None,
+    responsavel: str | None = None,
+    desde: date | None = None,
+    ate: date | None = None,
+):
+    from app.services import analytics
+
+    itens, snap = analytics.distribuicao(
+        empresa=empresa, responsavel=responsavel, desde=desde, ate=ate
+    )
+    return _resposta(itens, snap)
@@ -0,0 +1,39 @@
+import time
+from typing import Literal
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from app.services import search
+
+router = APIRouter(prefix="/api/busca", tags=["Busca"])
+
+
+@router.get("")
+def buscar(
+    q: str = Query(..., min_length=2),
+    fonte: Literal["nps", "ressalvas"] | None = None,
+    limite: int = Query(20, ge=1, le=100),
+):
+    inicio = time.perf_counter()
+    # Índice novo: a construção roda em segundo plano; responde com o que há
+    search.garantir_indice()
+    itens = search.buscar(q, fonte=fonte, limite=limite)
+    return {
+        "itens": itens,
+        "indice_completo": search.indice_pronto(),
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2),
+    }
+
+
+@router.post("/reindexar", status_code=202)
+def reindexar(
+    x_reindex_token: str | None = Header(None),
+    token: str | None = Query(None)
+):
+    # Varre a tabela inteira: só com SEARCH_REINDEX_TOKEN (404 sem ele,
+    # como /admin/profiles)
+    if not search.token_valido(x_reindex_token or token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not search.iniciar_reindexacao():
+        raise HTTPException(status_code=409, detail="Reindexação já em andamento")
+    return {"status": "iniciada"}
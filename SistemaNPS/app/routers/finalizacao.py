@@ -1,49 +1,39 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.templating import Jinja2Templates
-import os, json
+import json
+from io import BytesIO
+from datetime import datetime
 from app.services.supabase_client import supabase
-from app.services.upload import upload_pdf
-
-
-from PyPDF2 import PdfWriter, PdfReader
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from app.services.storage import ObjectNotFound, storage
+from app.services.upload import upload_bytes
 
 from app.services.pdf_layout import draw_header_footer, content_top, content_bottom
+from app.services import replica, text_layout
 
 router = APIRouter(prefix="/finalizacao")
-templates = Jinja2Templates(directory="app/templates")
 
 @router.post("/gerar-pdf-final")
 def gerar_pdf_final(processo_id: str):
+    from PyPDF2 import PdfWriter, PdfReader
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
 
-    base_dir = os.path.join("pdfs", processo_id)
-
-    termo_pdf = os.path.join(base_dir, "termo", "termo.pdf")
-    ressalvas_pdf = os.path.join(base_dir, "ressalvas", "ressalvas.pdf")
-    nps_json = os.path.join(base_dir, "nps", "nps.json")
-    final_dir = os.path.join(base_dir, "nps-final")
-
-    if not os.path.exists(termo_pdf):
-        raise HTTPException(404, "Termo não encontrado")
+    # Arquivos do processo no storage: <processo_id>/termo, /ressalvas, /nps
+    def ler(path: str, erro: str) -> bytes:
+        try:
+            return storage.get(f"{processo_id}/{path}")
+        except ObjectNotFound:
+            raise HTTPException(404, erro)
 
-    if not os.path.exists(ressalvas_pdf):
-        raise HTTPException(404, "Ressalvas não encontradas")
-
-    if not os.path.exists(nps_json):
-        raise HTTPException(404, "NPS não encontrado")
-
-    os.makedirs(final_dir, exist_ok=True)
+    termo_pdf = ler("termo/termo.pdf", "Termo não encontrado")
+    ressalvas_pdf = ler("ressalvas/ressalvas.pdf", "Ressalvas não encontradas")
+    nps = json.loads(ler("nps/nps.json", "NPS não encontrado"))
 
     # ===============================
     # CRIA PDF DO NPS
     # ===============================
-    nps_pdf_path = os.path.join(final_dir, "nps_temp.pdf")
+    nps_pdf = BytesIO()
 
-    with open(nps_json, "r", encoding="utf-8") as f:
-        nps = json.load(f)
-
-    c = canvas.Canvas(nps_pdf_path, pagesize=A4)
+    c = canvas.Canvas(nps_pdf, pagesize=A4)
     width, height = A4
 
     draw_header_footer(c, width, height)
@@ -69,9 +59,11 @@ def gerar_pdf_final(processo_id: str):
         c.setFont("Helvetica-Bold", 12)
         c.drawString(40, y, titulo.capitalize())
         y -= 18
-        c.setFont("Helvetica", 10)
-        c.drawString(40, y, texto[:300])
-        y -= 30
+        y = text_layout.draw_lines(
+            c, 40, y, text_layout.wrap(texto, width - 80, "Helvetica", 10),
+            "Helvetica", 10, 14, (width, height),
+        )
+        y -= 16
         if y < content_bottom():
             c.showPage()
             draw_header_footer(c, width, height)
@@ -83,52 +75,33 @@ def gerar_pdf_final(processo_id: str):
     # ===============================
     # MERGE FINAL
     # ===============================
-    pdf_final = os.path.join(final_dir, "entrega_final.pdf")
-
     merger = PdfWriter()
 
-    # Add pages from termo_pdf
-    with open(termo_pdf, 'rb') as f:
-        termo_reader = PdfReader(f)
-        for page in termo_reader.pages:
+    for pdf in (BytesIO(termo_pdf), BytesIO(ressalvas_pdf), nps_pdf):
+        for page in PdfReader(pdf).pages:
             merger.add_page(page)
 
-    # Add pages from ressalvas_pdf
-    with open(ressalvas_pdf, 'rb') as f:
-        ressalvas_reader = PdfReader(f)
-        for page in ressalvas_reader.pages:
-            merger.add_page(page)
-
-    # Add pages from nps_pdf_path
-    with open(nps_pdf_path, 'rb') as f:
-        nps_reader = PdfReader(f)
-        for page in nps_reader.pages:
-            merger.add_page(page)
-
-    with open(pdf_final, 'wb') as f:
-        merger.write(f)
+    pdf_final = BytesIO()
+    merger.write(pdf_final)
 
     # ===============================
-    # UPLOAD SUPABASE
+    # UPLOAD
     # ===============================
     remote_path = f"{processo_id}/final.pdf"
-    final_url = upload_pdf(pdf_final, remote_path)
+    final_url = upload_bytes(pdf_final.getvalue(), remote_path)
 
     # ===============================
     # UPDATE FINAL NO BANCO
     # ===============================
-    supabase.table("processos") \
+    atualizado = supabase.table("processos") \
         .update({
             "pdf_final": final_url,
-            "status": "finalizado"
+            "status": "finalizado",
+            "atualizado_em": datetime.utcnow().isoformat()
         }) \
         .eq("processo_id", processo_id) \
         .execute()
-
-    # ===============================
-    # LIMPEZA
-    # ===============================
-    os.remove(nps_pdf_path)
+    replica.gravar(atualizado.data)
 
     return {
         "status": "ok",
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from app.services import profiling
+from app.services.metrics import render_prometheus
+
+router = APIRouter(tags=["Metricas"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
+# ============================================================
+# PROFILES (app/services/profiling.py) — só com PROFILE_TOKEN
+# ============================================================
+
+def _exigir_token(header: str | None, query: str | None) -> None:
+    if not profiling.token_valido(header or query):
+        # 404 em vez de 403: sem token a rota nem aparenta existir
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/admin/profiles")
+def listar_profiles(
+    x_profile_token: str | None = Header(None),
+    token: str | None = Query(None)
+):
+    _exigir_token(x_profile_token, token)
+    return {"arquivos": profiling.listar()}
+
+
+@router.get("/admin/profiles/{nome}")
+def baixar_profile(
+    nome: str,
+    x_profile_token: str | None = Header(None),
+    token: str | None = Query(None)
+):
+    _exigir_token(x_profile_token, token)
+    caminho = profiling.caminho_artefato(nome)
+    if not caminho:
+        raise HTTPException(status_code=404, detail="Profile não encontrado")
+    return FileResponse(caminho, media_type="application/json", filename=nome)
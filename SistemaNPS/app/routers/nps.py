@@ -1,17 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 from io import BytesIO
-import base64
 
-import httpx
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from PyPDF2 import PdfMerger
-
-from app.services.upload import upload_pdf
+from app.services.upload import upload_bytes
+from app.services.pdf_output import linearizar
 from app.services.supabase_client import supabase
-from app.services.pdf_layout import draw_header_footer, content_top, content_bottom
+from app.services.pdf_layout import draw_header_footer, content_top
+from app.services import text_layout
+from app.services.metrics import stage
+from app.services import render_cache, replica, search, singleflight, thumbnails
+from app.services.storage import StorageError, path_from_url, storage
 
 router = APIRouter(prefix="/nps", tags=["NPS"])
 
@@ -33,27 +32,115 @@ class NPSUpdateRequest(BaseModel):
     feedback: dict
 
 
+# ===============================
+# PDF
+# ===============================
+def gerar_pdf_nps(data: NPSRequest) -> BytesIO:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    draw_header_footer(c, width, height)
+    y = content_top(height)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(40, y, "Pesquisa de Satisfação (NPS)")
+    y -= 40
+
+    c.setFont("Helvetica", 12)
+    c.drawString(40, y, f"NPS informado: {data.nps}")
+    y -= 30
+
+    # Avaliações
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, y, "Avaliações")
+    y -= 20
+
+    page_size = (width, height)
+    for k, v in data.avaliacoes.items():
+        y = text_layout.draw_lines(
+            c, 40, y, text_layout.wrap(f"{k}: {v}", width - 80, "Helvetica", 10),
+            "Helvetica", 10, 15, page_size,
+        )
+
+    # Feedback
+    y -= 20
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, y, "Feedback")
+    y -= 20
+
+    for titulo, texto in data.feedback.items():
+        y = text_layout.draw_lines(
+            c, 40, y, text_layout.wrap(f"{titulo}:", width - 80, "Helvetica", 10),
+            "Helvetica", 10, 14, page_size,
+        )
+        y = text_layout.draw_lines(
+            c, 50, y, text_layout.wrap(texto, width - 90, "Helvetica", 10),
+            "Helvetica", 10, 14, page_size,
+        )
+        y -= 10
+
+    c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def mesclar_pdfs(*partes) -> BytesIO:
+    from PyPDF2 import PdfMerger
+
+    merger = PdfMerger()
+    for parte in partes:
+        if not parte:
+            continue
+        merger.append(parte if isinstance(parte, BytesIO) else BytesIO(parte))
+    final_buffer = BytesIO()
+    merger.write(final_buffer)
+    merger.close()
+    final_buffer.seek(0)
+    return final_buffer
+
+
+def _invalidar_analytics() -> None:
+    from app.services import analytics
+
+    analytics.invalidate()
+
+
 # ===============================
 # ROTA
 # ===============================
+# Envios iguais simultâneos (duplo clique, fila offline reenviando) fazem
+# um só download + merge + upload; os demais recebem a mesma resposta
+_finalizacoes = singleflight.Group("finalizar_nps")
+
+
 @router.post("/finalizar")
-def finalizar_nps(data: NPSRequest):
-    try:
-        processo_id = data.processo_id.strip()
-        if not processo_id:
-            raise HTTPException(status_code=400, detail="processo_id ausente")
+def finalizar_nps(data: NPSRequest, background_tasks: BackgroundTasks):
+    processo_id = data.processo_id.strip()
+    if not processo_id:
+        raise HTTPException(status_code=400, detail="processo_id ausente")
+
+    chave = f"{processo_id}:{render_cache.render_hash('nps', data)}"
+    return _finalizacoes.do(chave, lambda: _finalizar(data, processo_id, background_tasks))
+
 
+def _finalizar(data: NPSRequest, processo_id: str, background_tasks: BackgroundTasks) -> dict:
+    try:
         # ===============================
         # BUSCA PROCESSO + PDFs
         # ===============================
-        proc = (
-            supabase
-            .table("processos")
-            .select("id,termo_pdf,pdf_ressalvas")
-            .eq("codigo", processo_id)
-            .single()
-            .execute()
-        )
+        with stage("db_select", errors="database"):
+            proc = (
+                supabase
+                .table("processos")
+                .select("id,termo_pdf,pdf_ressalvas")
+                .eq("codigo", processo_id)
+                .single()
+                .execute()
+            )
 
         if not proc.data:
             raise HTTPException(status_code=404, detail="Processo não encontrado")
@@ -65,140 +152,66 @@ def finalizar_nps(data: NPSRequest):
         if not termo_pdf_url:
             raise HTTPException(status_code=404, detail="Termo não encontrado")
 
-        def extract_storage_path(public_url: str) -> str | None:
-            marker = "/storage/v1/object/public/processos/"
-            if marker not in public_url:
-                return None
-            return public_url.split(marker, 1)[1]
-
         def download_pdf(url: str) -> bytes:
-            resp = httpx.get(url, timeout=30)
-            resp.raise_for_status()
-            return resp.content
+            path = path_from_url(url)
+            if not path:
+                raise StorageError("URL de storage inválida")
+            with stage("download", errors="storage"):
+                return storage.get(path)
 
         try:
             termo_bytes = download_pdf(termo_pdf_url)
             ressalvas_bytes = None
             if ressalvas_pdf_url:
                 ressalvas_bytes = download_pdf(ressalvas_pdf_url)
-        except Exception:
-            # Fallback para bucket privado: usa download via Supabase
-            termo_path = extract_storage_path(termo_pdf_url)
-            ressalvas_path = extract_storage_path(ressalvas_pdf_url) if ressalvas_pdf_url else None
-            try:
-                if not termo_path:
-                    raise Exception("URL de storage inválida")
-                termo_res = supabase.storage.from_("processos").download(termo_path)
-                if hasattr(termo_res, "error") and termo_res.error:
-                    raise Exception(termo_res.error.message)
-
-                termo_bytes = termo_res
-                ressalvas_bytes = None
-                if ressalvas_path:
-                    ressalvas_res = supabase.storage.from_("processos").download(ressalvas_path)
-                    if hasattr(ressalvas_res, "error") and ressalvas_res.error:
-                        raise Exception(ressalvas_res.error.message)
-                    ressalvas_bytes = ressalvas_res
-            except Exception as e:
-                raise HTTPException(status_code=502, detail=f"Falha ao baixar PDFs: {str(e)}")
+        except StorageError as e:
+            raise HTTPException(status_code=502, detail=f"Falha ao baixar PDFs: {str(e)}")
 
         # ===============================
         # GERAR PDF NPS (EM MEMORIA)
         # ===============================
-        nps_buffer = BytesIO()
-        c = canvas.Canvas(nps_buffer, pagesize=A4)
-        width, height = A4
-
-        draw_header_footer(c, width, height)
-        y = content_top(height)
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(40, y, "Pesquisa de Satisfação (NPS)")
-        y -= 40
-
-        c.setFont("Helvetica", 12)
-        c.drawString(40, y, f"NPS informado: {data.nps}")
-        y -= 30
-
-        # Avaliações
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(40, y, "Avaliações")
-        y -= 20
-
-        c.setFont("Helvetica", 10)
-        for k, v in data.avaliacoes.items():
-            c.drawString(40, y, f"{k}: {v}")
-            y -= 15
-            if y < content_bottom():
-                c.showPage()
-                draw_header_footer(c, width, height)
-                y = content_top(height)
-                c.setFont("Helvetica", 10)
-
-        # Feedback
-        y -= 20
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(40, y, "Feedback")
-        y -= 20
-
-        c.setFont("Helvetica", 10)
-        for titulo, texto in data.feedback.items():
-            c.drawString(40, y, f"{titulo}:")
-            y -= 14
-
-            for linha in texto.split("\n"):
-                c.drawString(50, y, linha[:110])
-                y -= 14
-                if y < content_bottom():
-                    c.showPage()
-                    draw_header_footer(c, width, height)
-                    y = content_top(height)
-                    c.setFont("Helvetica", 10)
-
-            y -= 10
-
-        c.showPage()
-        c.save()
-        nps_buffer.seek(0)
+        with stage("render"):
+            nps_buffer = gerar_pdf_nps(data)
 
         # ===============================
         # MERGE FINAL (2 OU 3 PDFs)
         # ===============================
-        merger = PdfMerger()
-        merger.append(BytesIO(termo_bytes))
-        if ressalvas_bytes:
-            merger.append(BytesIO(ressalvas_bytes))
-        merger.append(nps_buffer)
-        final_buffer = BytesIO()
-        merger.write(final_buffer)
-        merger.close()
-        final_buffer.seek(0)
+        with stage("merge"):
+            final_buffer = mesclar_pdfs(termo_bytes, ressalvas_bytes, nps_buffer)
+
+        # Linearizado: o navegador mostra a 1ª página antes do download completo
+        final_bytes = linearizar(final_buffer)
 
         # ===============================
         # UPLOAD
         # ===============================
-        final_base64 = (
-            "data:application/pdf;base64,"
-            + base64.b64encode(final_buffer.read()).decode()
-        )
-        final_url = upload_pdf(final_base64, f"{processo_uuid}/final")
+        final_url = upload_bytes(final_bytes, f"{processo_uuid}/final")
 
         if not final_url:
             raise HTTPException(500, "Falha no upload do PDF final")
+        background_tasks.add_task(thumbnails.gerar, final_url, final_bytes)
 
         # ===============================
         # UPDATE BANCO
         # ===============================
-        supabase.table("processos").update({
-            "status": "finalizado",
-            "pdf_final": final_url,
-            "nps_dados": {
-                "nps": data.nps,
-                "avaliacoes": data.avaliacoes,
-                "feedback": data.feedback
-            },
-            "nps_nota": data.nps,
-            "finalizado_em": date.today().isoformat()
-        }).eq("id", processo_uuid).execute()
+        nps_dados = {
+            "nps": data.nps,
+            "avaliacoes": data.avaliacoes,
+            "feedback": data.feedback
+        }
+        with stage("db_update", errors="database"):
+            atualizado = supabase.table("processos").update({
+                "status": "finalizado",
+                "pdf_final": final_url,
+                "nps_dados": nps_dados,
+                "nps_nota": data.nps,
+                "finalizado_em": date.today().isoformat(),
+                "atualizado_em": datetime.utcnow().isoformat()
+            }).eq("id", processo_uuid).execute()
+        replica.gravar(atualizado.data)
+
+        _invalidar_analytics()
+        search.indexar_processo(processo_id, nps_dados=nps_dados)
 
         return {
             "status": "ok",
@@ -216,28 +229,35 @@ def atualizar_nps(data: NPSUpdateRequest):
     if not processo_id:
         raise HTTPException(status_code=400, detail="processo_id ausente")
 
-    proc = (
-        supabase
-        .table("processos")
-        .select("id")
-        .eq("codigo", processo_id)
-        .single()
-        .execute()
-    )
+    with stage("db_select", errors="database"):
+        proc = (
+            supabase
+            .table("processos")
+            .select("id")
+            .eq("codigo", processo_id)
+            .single()
+            .execute()
+        )
 
     if not proc.data:
         raise HTTPException(status_code=404, detail="Processo nÃ£o encontrado")
 
     processo_uuid = proc.data["id"]
 
-    supabase.table("processos").update({
-        "nps_dados": {
-            "nps": data.nps,
-            "avaliacoes": data.avaliacoes,
-            "feedback": data.feedback
-        },
-        "nps_nota": data.nps,
-        "atualizado_em": date.today().isoformat()
-    }).eq("id", processo_uuid).execute()
+    nps_dados = {
+        "nps": data.nps,
+        "avaliacoes": data.avaliacoes,
+        "feedback": data.feedback
+    }
+    with stage("db_update", errors="database"):
+        atualizado = supabase.table("processos").update({
+            "nps_dados": nps_dados,
+            "nps_nota": data.nps,
+            "atualizado_em": datetime.utcnow().isoformat()
+        }).eq("id", processo_uuid).execute()
+    replica.gravar(atualizado.data)
+
+    _invalidar_analytics()
+    search.indexar_processo(processo_id, nps_dados=nps_dados)
 
     return {"status": "ok"}
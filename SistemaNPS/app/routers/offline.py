@@ -0,0 +1,27 @@
+import os
+
+from fastapi import APIRouter, Query
+from fastapi.responses import FileResponse
+
+from app.services import client_ids
+
+router = APIRouter(tags=["Offline"])
+
+SERVICE_WORKER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "sw.js")
+
+
+@router.get("/sw.js")
+def service_worker():
+    # Servido na raiz para controlar /termo, /ressalvas e /nps (escopo "/");
+    # sem cache longo, senão uma versão nova demora a chegar nos aparelhos
+    return FileResponse(
+        SERVICE_WORKER,
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/offline/ids")
+def reservar_ids(n: int = Query(10, ge=1, le=client_ids.MAX_POR_PEDIDO)):
+    """Ids para envios feitos sem conexão (ver app/services/client_ids.py)."""
+    return {"ids": client_ids.emitir(n)}
@@ -1,25 +1,83 @@
-from fastapi import APIRouter, HTTPException
+import hashlib
 
-from app.services.supabase_client import supabase
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from app.services import archive, replica
+from app.services.storage import StorageError
 
 router = APIRouter(prefix="/api/processos", tags=["Processos"])
 
+# Campos de identificação: sempre retornados (pequenos)
+IDENTIDADE = "codigo,nome_cliente,empresa,cpf,status_entrega"
 
-@router.get("/{codigo}")
-def obter_processo(codigo: str):
-    res = (
-        supabase
-        .table("processos")
-        .select(
-            "codigo,nome_cliente,empresa,cpf,status_entrega,"
-            "termo_dados,ressalvas_dados,nps_dados"
+# Seções pesadas (JSON com fotos em base64), escolhidas por ?fields=
+SECOES = {
+    "termo": "termo_dados",
+    "ressalvas": "ressalvas_dados",
+    "nps": "nps_dados",
+}
+
+VERSAO = "atualizado_em,criado_em"
+
+
+def _secoes(fields: str | None) -> list[str]:
+    if not fields:
+        return list(SECOES)
+    pedidas = [f.strip() for f in fields.split(",") if f.strip()]
+    invalidas = [f for f in pedidas if f not in SECOES]
+    if invalidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Seções inválidas: {', '.join(invalidas)} (use {', '.join(SECOES)})"
         )
-        .eq("codigo", codigo)
-        .single()
-        .execute()
-    )
+    return [s for s in SECOES if s in pedidas]
+
+
+def _etag(codigo: str, versao: dict, secoes: list[str]) -> str:
+    # Toda gravação em processos atualiza atualizado_em; a lista de seções
+    # entra no hash porque cada combinação é uma representação diferente.
+    marca = versao.get("atualizado_em") or versao.get("criado_em") or ""
+    digest = hashlib.sha1(f"{codigo}|{marca}|{','.join(secoes)}".encode()).hexdigest()
+    return f'"{digest[:20]}"'
 
-    if not res.data:
+
+def _buscar(codigo: str, colunas: str):
+    # Réplica local quando em dia; senão Supabase (app/services/replica.py)
+    data = replica.processo(codigo, colunas)
+    if not data:
         raise HTTPException(status_code=404, detail="Processo não encontrado")
+    return data
+
+
+@router.get("/{codigo}")
+def obter_processo(
+    codigo: str,
+    request: Request,
+    fields: str | None = Query(None, description="Seções: termo, ressalvas, nps"),
+):
+    secoes = _secoes(fields)
+    if_none_match = request.headers.get("if-none-match")
 
-    return res.data
+    # Revalidação: só as colunas de versão, sem trazer os JSONs pesados
+    if if_none_match:
+        etag = _etag(codigo, _buscar(codigo, VERSAO), secoes)
+        if etag in (t.strip() for t in if_none_match.split(",")):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    colunas = ",".join([IDENTIDADE, *(SECOES[s] for s in secoes), VERSAO])
+    data = _buscar(codigo, colunas)
+    try:
+        # Processos antigos: JSON arquivado no storage (app/services/archive.py)
+        archive.rehydrate(data, [SECOES[s] for s in secoes])
+    except StorageError as e:
+        raise HTTPException(status_code=502, detail=f"Falha ao ler dados arquivados: {e}")
+    etag = _etag(codigo, data, secoes)
+    for coluna in VERSAO.split(","):
+        data.pop(coluna, None)
+
+    return Response(
+        content=orjson.dumps(data),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
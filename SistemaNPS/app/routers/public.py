@@ -1,32 +1,117 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
 from fastapi import APIRouter, Request, HTTPException, Response
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from app.services.supabase_client import supabase
+from app.services.metrics import stage
+from app.services import replica, singleflight, thumbnails
+from app.services.storage import ObjectNotFound, StorageError, content_type_for, path_from_url, storage
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates", auto_reload=True)
 
 
-def _extract_storage_path(public_url: str) -> str | None:
-    marker = "/storage/v1/object/public/processos/"
-    if marker in public_url:
-        return public_url.split(marker, 1)[1]
-    if public_url.startswith("processos/"):
-        return public_url.split("processos/", 1)[1]
-    return None
+# PDFs baixados recentemente (paths do storage nunca são regravados com outro
+# conteúdo: uuid ou hash no nome). Evita baixar o arquivo inteiro de novo a
+# cada requisição Range do visualizador do navegador.
+PDF_CACHE_BYTES = int(float(os.getenv("PDF_CACHE_MB", "64")) * 1024 * 1024)
+_pdf_cache: OrderedDict[str, bytes] = OrderedDict()
+_pdf_cache_size = 0
+_pdf_cache_lock = threading.Lock()
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Vários acessos simultâneos ao mesmo PDF (link compartilhado, admin
+# revisando) fazem um só download do storage
+_downloads = singleflight.Group("download_pdf")
+
+
+def _cache_get(path: str) -> bytes | None:
+    with _pdf_cache_lock:
+        data = _pdf_cache.get(path)
+        if data is not None:
+            _pdf_cache.move_to_end(path)
+        return data
+
+
+def _cache_put(path: str, data: bytes) -> None:
+    global _pdf_cache_size
+    if len(data) > PDF_CACHE_BYTES // 4:
+        return
+    with _pdf_cache_lock:
+        if path in _pdf_cache:
+            return
+        _pdf_cache[path] = data
+        _pdf_cache_size += len(data)
+        while _pdf_cache_size > PDF_CACHE_BYTES:
+            _, antigo = _pdf_cache.popitem(last=False)
+            _pdf_cache_size -= len(antigo)
 
 
 def _download_pdf(url: str) -> bytes:
-    path = _extract_storage_path(url)
+    path = path_from_url(url)
     if not path:
         raise HTTPException(status_code=400, detail="URL de storage invÃ¡lida")
 
-    res = supabase.storage.from_("processos").download(path)
-    if hasattr(res, "error") and res.error:
-        raise HTTPException(status_code=502, detail=res.error.message)
-    if isinstance(res, dict) and res.get("error"):
-        raise HTTPException(status_code=502, detail=res.get("error"))
-    return res
+    cached = _cache_get(path)
+    if cached is not None:
+        return cached
+
+    def baixar() -> bytes:
+        with stage("download", errors="storage"):
+            try:
+                data = storage.get(path)
+            except ObjectNotFound:
+                raise HTTPException(status_code=404, detail="Arquivo não encontrado no storage")
+            except StorageError as e:
+                raise HTTPException(status_code=502, detail=str(e))
+        _cache_put(path, data)
+        return data
+
+    return _downloads.do(path, baixar)
+
+
+def _pdf_response(request: Request, pdf_bytes: bytes, filename: str) -> Response:
+    """
+    Responde o PDF inteiro ou o intervalo pedido em `Range` (um só
+    intervalo). Com PDFs linearizados o navegador busca o início do arquivo
+    e exibe a primeira página antes do resto chegar.
+    """
+    total = len(pdf_bytes)
+    headers = {
+        "Content-Disposition": f"inline; filename={filename}",
+        "Accept-Ranges": "bytes",
+    }
+
+    match = _RANGE_RE.match(request.headers.get("range", "").strip())
+    if not match or match.groups() == ("", ""):
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+    inicio_str, fim_str = match.groups()
+    if inicio_str:
+        inicio = int(inicio_str)
+        fim = min(int(fim_str), total - 1) if fim_str else total - 1
+    else:
+        # "bytes=-N": últimos N bytes
+        inicio = max(total - int(fim_str), 0)
+        fim = total - 1
+
+    if inicio >= total or inicio > fim:
+        return Response(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{total}", "Accept-Ranges": "bytes"},
+        )
+
+    headers["Content-Range"] = f"bytes {inicio}-{fim}/{total}"
+    return Response(
+        content=pdf_bytes[inicio:fim + 1],
+        status_code=206,
+        media_type="application/pdf",
+        headers=headers,
+    )
 
 @router.get("/", response_class=HTMLResponse)
 def login(request: Request):
@@ -63,21 +148,12 @@ def nps(request: Request):
 def admin(request: Request):
     processos = []
     try:
-        res = (
-            supabase
-            .table("processos")
-            .select(
-                "codigo,nome_cliente,empresa,cpf,status,status_entrega,"
-                "criado_em,atualizado_em,termo_pdf,pdf_ressalvas,pdf_final,nps_nota"
-            )
-            .order("criado_em", desc=True)
-            .execute()
+        # Réplica local quando em dia (app/services/replica.py)
+        processos = replica.listar(
+            "codigo,nome_cliente,empresa,cpf,status,status_entrega,"
+            "criado_em,atualizado_em,termo_pdf,pdf_ressalvas,pdf_final,nps_nota,"
+            "imagens_termo"
         )
-
-        if hasattr(res, "error") and res.error:
-            raise RuntimeError(res.error.message)
-
-        processos = res.data or []
     except Exception:
         # Fallback para schema antigo (antes das novas colunas)
         res = (
@@ -95,6 +171,7 @@ def admin(request: Request):
             p.setdefault("empresa", None)
             p.setdefault("nps_nota", None)
             p.setdefault("atualizado_em", None)
+            p.setdefault("imagens_termo", None)
 
     q = (request.query_params.get("q") or "").strip().lower()
     if q:
@@ -105,6 +182,18 @@ def admin(request: Request):
             or q in (p.get("empresa") or "").lower()
         ]
 
+    for p in processos:
+        p["thumbs"] = {
+            "termo": thumbnails.thumb_url(p.get("termo_pdf")),
+            "ressalvas": thumbnails.thumb_url(p.get("pdf_ressalvas")),
+            "final": thumbnails.thumb_url(p.get("pdf_final")),
+            "fotos": [
+                thumbnails.thumb_url(img.get("url"))
+                for img in (p.get("imagens_termo") or [])
+                if isinstance(img, dict) and img.get("url")
+            ],
+        }
+
     notas = [
         p.get("nps_nota") for p in processos
         if isinstance(p.get("nps_nota"), int)
@@ -149,67 +238,71 @@ def nps_motor(request: Request):
 
 
 @router.get("/pdf/termo/{codigo}")
-def pdf_termo(codigo: str):
-    proc = (
-        supabase
-        .table("processos")
-        .select("termo_pdf")
-        .eq("codigo", codigo)
-        .single()
-        .execute()
-    )
-    if not proc.data or not proc.data.get("termo_pdf"):
+def pdf_termo(codigo: str, request: Request):
+    proc = replica.processo(codigo, "termo_pdf")
+    if not proc or not proc.get("termo_pdf"):
         raise HTTPException(status_code=404, detail="PDF do termo nÃ£o encontrado")
 
-    pdf_bytes = _download_pdf(proc.data["termo_pdf"])
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=termo.pdf"}
-    )
+    pdf_bytes = _download_pdf(proc["termo_pdf"])
+    return _pdf_response(request, pdf_bytes, "termo.pdf")
 
 
 @router.get("/pdf/ressalvas/{codigo}")
-def pdf_ressalvas(codigo: str):
-    proc = (
-        supabase
-        .table("processos")
-        .select("pdf_ressalvas")
-        .eq("codigo", codigo)
-        .single()
-        .execute()
-    )
-    if not proc.data or not proc.data.get("pdf_ressalvas"):
+def pdf_ressalvas(codigo: str, request: Request):
+    proc = replica.processo(codigo, "pdf_ressalvas")
+    if not proc or not proc.get("pdf_ressalvas"):
         raise HTTPException(status_code=404, detail="PDF de ressalvas nÃ£o encontrado")
 
-    pdf_bytes = _download_pdf(proc.data["pdf_ressalvas"])
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=ressalvas.pdf"}
-    )
+    pdf_bytes = _download_pdf(proc["pdf_ressalvas"])
+    return _pdf_response(request, pdf_bytes, "ressalvas.pdf")
 
 
 @router.get("/pdf/final/{codigo}")
-def pdf_final(codigo: str):
-    proc = (
-        supabase
-        .table("processos")
-        .select("pdf_final")
-        .eq("codigo", codigo)
-        .single()
-        .execute()
-    )
-    if not proc.data or not proc.data.get("pdf_final"):
+def pdf_final(codigo: str, request: Request):
+    proc = replica.processo(codigo, "pdf_final")
+    if not proc or not proc.get("pdf_final"):
         raise HTTPException(status_code=404, detail="PDF final nÃ£o encontrado")
 
-    pdf_bytes = _download_pdf(proc.data["pdf_final"])
+    pdf_bytes = _download_pdf(proc["pdf_final"])
+    return _pdf_response(request, pdf_bytes, "entrega_final.pdf")
+
+@router.get("/thumb/{path:path}")
+def thumb(path: str):
+    # Paths com uuid/hash: a miniatura de um path nunca muda
+    if not path.endswith(thumbnails.THUMB_SUFFIX):
+        raise HTTPException(status_code=404, detail="Miniatura não encontrada")
+
+    try:
+        with stage("download", errors="storage"):
+            data = storage.get(path)
+    except StorageError:
+        data = thumbnails.gerar_sob_demanda(path)
+    if not data:
+        raise HTTPException(status_code=404, detail="Miniatura não encontrada")
+
     return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline; filename=entrega_final.pdf"}
+        content=data,
+        media_type="image/webp",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
     )
 
+
+@router.get("/arquivos/{path:path}")
+def arquivo(path: str):
+    # URLs públicas do backend local (STORAGE_BACKEND=local)
+    if storage.name != "local":
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    try:
+        chunks = storage.stream(path)
+    except StorageError:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return StreamingResponse(
+        chunks,
+        media_type=content_type_for(path),
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+
 @router.get("/.well-known/appspecific/com.chrome.devtools.json")
 def chrome_devtools():
     return {}
@@ -1,18 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, date
-import base64
-import hashlib
 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 from io import BytesIO
 
 from app.services.supabase_client import supabase
-from app.services.upload import upload_pdf
+from app.services.upload import upload_bytes
+from app.services.photos import DecodedPhoto
 from app.services.pdf_layout import draw_header_footer, content_top, content_bottom
+from app.services import text_layout
+from app.services.metrics import stage
+from app.services import preview, render_cache, replica, search, thumbnails
 
 router = APIRouter(prefix="/ressalvas", tags=["Ressalvas"])
 
@@ -55,35 +54,99 @@ class RessalvasResponse(BaseModel):
 # UTILS
 # ============================================================
 
-def normalize_base64(encoded: str) -> str:
-    encoded = encoded.strip().replace("\n", "").replace(" ", "")
-    missing = len(encoded) % 4
-    if missing:
-        encoded += "=" * (4 - missing)
-    return encoded
-
-
-def decode_base64_image(base64_data: str) -> BytesIO:
-    try:
-        if "," not in base64_data:
-            raise ValueError("Formato Base64 inválido")
-
-        _, encoded = base64_data.split(",", 1)
-        encoded = normalize_base64(encoded)
-
-        return BytesIO(base64.b64decode(encoded))
-    except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Imagem Base64 inválida: {str(e)}"
+def decode_fotos(imagens: List[ImagemRessalva]) -> List[Optional[DecodedPhoto]]:
+    """Decodifica cada foto uma vez (render, hash e dados usam o mesmo objeto)."""
+    fotos = []
+    for img in imagens:
+        if not img.imagem_base64:
+            fotos.append(None)
+            continue
+        try:
+            fotos.append(DecodedPhoto.from_base64(img.imagem_base64))
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Imagem Base64 inválida: {str(e)}"
+            )
+    return fotos
+
+
+# Colunas comparadas para decidir se um item existente mudou (trocar só a
+# foto também é uma alteração da mesma linha)
+ITEM_CAMPOS = ("descricao", "prazo", "aprovacao", "imagem_hash")
+
+
+def sincronizar_itens(
+    processo_uuid: str,
+    imagens: List[ImagemRessalva],
+    fotos: List[Optional[DecodedPhoto]]
+) -> dict:
+    """
+    Casa os itens enviados com as linhas de ressalvas_itens pelo `item`;
+    com o mesmo item repetido, a linha com a mesma foto (imagem_hash) tem
+    preferência. Alterados vão num único upsert (mantendo id e criado_em),
+    novos num único insert e os que sumiram num único delete.
+    """
+    with stage("db_itens_select", errors="database"):
+        res = (
+            supabase
+            .table("ressalvas_itens")
+            .select("id,processo_id,item,descricao,prazo,aprovacao,imagem_hash,criado_em")
+            .eq("processo_id", processo_uuid)
+            .execute()
         )
 
-
-def gerar_hash_imagem(base64_data: str) -> str:
-    _, encoded = base64_data.split(",", 1)
-    encoded = normalize_base64(encoded)
-    raw = base64.b64decode(encoded)
-    return hashlib.sha256(raw).hexdigest()
+    existentes: dict[str, list[dict]] = {}
+    for row in res.data or []:
+        existentes.setdefault(row.get("item"), []).append(row)
+
+    desejados = [
+        {
+            "processo_id": processo_uuid,
+            "item": img.item,
+            "descricao": img.descricao,
+            "prazo": img.prazo.isoformat() if img.prazo else None,
+            "aprovacao": img.aprovacao,
+            "imagem_hash": foto.sha256 if foto else None,
+        }
+        for img, foto in zip(imagens, fotos)
+    ]
+
+    # 1ª passada: mesmo item e mesma foto; 2ª: mesmo item, foto trocada
+    casados: list[dict | None] = [None] * len(desejados)
+    for i, desejado in enumerate(desejados):
+        candidatos = existentes.get(desejado["item"]) or []
+        for j, row in enumerate(candidatos):
+            if row.get("imagem_hash") == desejado["imagem_hash"]:
+                casados[i] = candidatos.pop(j)
+                break
+    for i, desejado in enumerate(desejados):
+        candidatos = existentes.get(desejado["item"])
+        if casados[i] is None and candidatos:
+            casados[i] = candidatos.pop(0)
+
+    alterados = []
+    novos = []
+    agora = datetime.utcnow().isoformat()
+    for desejado, atual in zip(desejados, casados):
+        if atual is None:
+            novos.append({**desejado, "criado_em": agora})
+        elif any(atual.get(c) != desejado[c] for c in ITEM_CAMPOS):
+            alterados.append({**desejado, "id": atual["id"], "criado_em": atual.get("criado_em")})
+
+    removidos = [row["id"] for rows in existentes.values() for row in rows]
+
+    with stage("db_itens", errors="database"):
+        if alterados:
+            supabase.table("ressalvas_itens").upsert(alterados, on_conflict="id").execute()
+        if novos:
+            supabase.table("ressalvas_itens").insert(novos).execute()
+
+    if removidos:
+        with stage("db_itens_delete", errors="database"):
+            supabase.table("ressalvas_itens").delete().in_("id", removidos).execute()
+
+    return {"alterados": len(alterados), "novos": len(novos), "removidos": len(removidos)}
 
 
 # ============================================================
@@ -94,13 +157,24 @@ def gerar_pdf_ressalvas(
     processo_codigo: str,
     responsavel: str,
     observacoes: Optional[str],
-    imagens: List[ImagemRessalva]
+    imagens: List[ImagemRessalva],
+    fotos: Optional[List[Optional[DecodedPhoto]]] = None,
+    registrado_em: Optional[datetime] = None
 ) -> BytesIO:
+    """`registrado_em`: data impressa no relatório (padrão: agora). A
+    re-renderização em lote passa a data original do registro."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    if fotos is None:
+        fotos = decode_fotos(imagens)
+
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
 
     largura, altura = A4
     margem_x = 40
+    largura_texto = largura - margem_x * 2
     draw_header_footer(c, largura, altura)
     y = content_top(altura)
 
@@ -116,7 +190,7 @@ def gerar_pdf_ressalvas(
     c.drawString(
         margem_x,
         y,
-        f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+        f"Data: {(registrado_em or datetime.now()).strftime('%d/%m/%Y %H:%M')}"
     )
     y -= 25
 
@@ -124,23 +198,29 @@ def gerar_pdf_ressalvas(
         c.setFont("Helvetica-Bold", 10)
         c.drawString(margem_x, y, "Observações:")
         y -= 15
-        c.setFont("Helvetica", 10)
-        c.drawString(margem_x, y, observacoes)
-        y -= 25
+        y = text_layout.draw_lines(
+            c, margem_x, y,
+            text_layout.wrap(observacoes, largura_texto, "Helvetica", 10),
+            "Helvetica", 10, 13, (largura, altura),
+        )
+        y -= 12
 
-    for idx, img in enumerate(imagens, start=1):
+    for idx, (img, foto) in enumerate(zip(imagens, fotos), start=1):
         if y < content_bottom():
             c.showPage()
             draw_header_footer(c, largura, altura)
             y = content_top(altura)
 
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(margem_x, y, f"Item {idx}: {img.item}")
-        y -= 15
-
-        c.setFont("Helvetica", 10)
-        c.drawString(margem_x, y, f"Descrição: {img.descricao}")
-        y -= 15
+        y = text_layout.draw_lines(
+            c, margem_x, y,
+            text_layout.wrap(f"Item {idx}: {img.item}", largura_texto, "Helvetica-Bold", 11),
+            "Helvetica-Bold", 11, 15, (largura, altura),
+        )
+        y = text_layout.draw_lines(
+            c, margem_x, y,
+            text_layout.wrap(f"Descrição: {img.descricao}", largura_texto, "Helvetica", 10),
+            "Helvetica", 10, 15, (largura, altura),
+        )
 
         if img.prazo:
             c.drawString(
@@ -157,12 +237,9 @@ def gerar_pdf_ressalvas(
         )
         y -= 15
 
-        if img.imagem_base64:
-            image_stream = decode_base64_image(img.imagem_base64)
-            image = ImageReader(image_stream)
-
+        if foto is not None:
             c.drawImage(
-                image,
+                foto.reader(),
                 margem_x,
                 y - 150,
                 width=200,
@@ -185,19 +262,20 @@ def gerar_pdf_ressalvas(
 # ============================================================
 
 @router.post("/salvar", response_model=RessalvasResponse)
-def salvar_ressalvas(data: RessalvasRequest):
+def salvar_ressalvas(data: RessalvasRequest, background_tasks: BackgroundTasks):
     try:
         # ----------------------------------------------------
         # 1. BUSCA PROCESSO PELO CÓDIGO (RETORNA UUID REAL)
         # ----------------------------------------------------
-        proc = (
-            supabase
-            .table("processos")
-            .select("id")
-            .eq("codigo", data.processo_id)
-            .single()
-            .execute()
-        )
+        with stage("db_select", errors="database"):
+            proc = (
+                supabase
+                .table("processos")
+                .select("id")
+                .eq("codigo", data.processo_id)
+                .single()
+                .execute()
+            )
 
         if not proc.data:
             raise HTTPException(
@@ -208,64 +286,49 @@ def salvar_ressalvas(data: RessalvasRequest):
         processo_uuid = proc.data["id"]
 
         # ----------------------------------------------------
-        # 2. GERA PDF
+        # 2. DECODIFICA FOTOS E GERA PDF
         # ----------------------------------------------------
-        pdf_buffer = gerar_pdf_ressalvas(
-            processo_codigo=data.processo_id,
-            responsavel=data.responsavel,
-            observacoes=data.observacoes,
-            imagens=data.imagens
-        )
-
-        # ----------------------------------------------------
-        # 3. PDF → BASE64
-        # ----------------------------------------------------
-        pdf_base64 = (
-            "data:application/pdf;base64,"
-            + base64.b64encode(pdf_buffer.read()).decode()
-        )
+        fotos = decode_fotos(data.imagens)
+        registrado_em = datetime.now()
+
+        with stage("render"):
+            pdf_buffer = gerar_pdf_ressalvas(
+                processo_codigo=data.processo_id,
+                responsavel=data.responsavel,
+                observacoes=data.observacoes,
+                imagens=data.imagens,
+                fotos=fotos,
+                registrado_em=registrado_em
+            )
 
         # ----------------------------------------------------
-        # 4. UPLOAD (BUCKET: processos)
+        # 3. UPLOAD (BUCKET: processos)
         # ----------------------------------------------------
+        digest = render_cache.render_hash("ressalvas", data)
         folder = f"{processo_uuid}/ressalvas"
-        pdf_url = upload_pdf(pdf_base64, folder)
+        pdf_url = upload_bytes(pdf_buffer.getvalue(), render_cache.pdf_path(folder, digest), upsert=True)
 
         if not pdf_url:
             raise HTTPException(
                 status_code=500,
                 detail="Falha no upload do PDF"
             )
+        background_tasks.add_task(thumbnails.gerar, pdf_url, pdf_buffer.getvalue())
 
         # ----------------------------------------------------
-        # 5. INSERE ITENS DE RESSALVAS
+        # 4. SINCRONIZA ITENS DE RESSALVAS (reenvio não duplica)
         # ----------------------------------------------------
-        itens = []
-
-        for img in data.imagens:
-            itens.append({
-                "processo_id": processo_uuid,
-                "item": img.item,
-                "descricao": img.descricao,
-                "prazo": img.prazo.isoformat() if img.prazo else None,
-                "aprovacao": img.aprovacao,
-                "imagem_hash": (
-                    gerar_hash_imagem(img.imagem_base64)
-                    if img.imagem_base64 else None
-                ),
-                "criado_em": datetime.utcnow().isoformat()
-            })
-
-        if itens:
-            supabase.table("ressalvas_itens").insert(itens).execute()
+        sincronizar_itens(processo_uuid, data.imagens, fotos)
 
         # ----------------------------------------------------
-        # 6. ATUALIZA PROCESSO (NÃO ALTERA criado_em)
+        # 5. ATUALIZA PROCESSO (NÃO ALTERA criado_em)
         # ----------------------------------------------------
         ressalvas_dados = {
             "responsavel": data.responsavel,
             "cpf": data.cpf,
             "observacoes": data.observacoes,
+            # Data impressa no PDF (a re-renderização em lote reaproveita)
+            "registrado_em": registrado_em.isoformat(),
             "itens": [
                 {
                     "item": img.item,
@@ -280,12 +343,16 @@ def salvar_ressalvas(data: RessalvasRequest):
             ]
         }
 
-        supabase.table("processos").update({
-            "status": "RESSALVAS_REGISTRADAS",
-            "pdf_ressalvas": pdf_url,
-            "ressalvas_dados": ressalvas_dados,
-            "atualizado_em": datetime.utcnow().isoformat()
-        }).eq("id", processo_uuid).execute()
+        with stage("db_update", errors="database"):
+            atualizado = supabase.table("processos").update({
+                "status": "RESSALVAS_REGISTRADAS",
+                "pdf_ressalvas": pdf_url,
+                "ressalvas_dados": ressalvas_dados,
+                "atualizado_em": datetime.utcnow().isoformat()
+            }).eq("id", processo_uuid).execute()
+        replica.gravar(atualizado.data)
+
+        search.indexar_processo(data.processo_id, ressalvas_dados=ressalvas_dados)
 
         return RessalvasResponse(success=True, pdf_url=pdf_url)
 
@@ -293,17 +360,38 @@ def salvar_ressalvas(data: RessalvasRequest):
         raise
 
 
+@router.post("/preview")
+def preview_ressalvas(
+    data: RessalvasRequest,
+    largura: int = Query(preview.LARGURA_PADRAO, ge=200, le=preview.LARGURA_MAX)
+):
+    """PNG da primeira página das ressalvas com os dados do formulário."""
+    digest = render_cache.render_hash("ressalvas", data)
+    return preview.resposta(
+        digest,
+        largura,
+        lambda: gerar_pdf_ressalvas(
+            processo_codigo=data.processo_id,
+            responsavel=data.responsavel,
+            observacoes=data.observacoes,
+            imagens=data.imagens,
+            fotos=decode_fotos(data.imagens)
+        ).getvalue()
+    )
+
+
 @router.post("/atualizar", response_model=RessalvasResponse)
-def atualizar_ressalvas(data: RessalvasUpdateRequest):
+def atualizar_ressalvas(data: RessalvasUpdateRequest, background_tasks: BackgroundTasks):
     try:
-        proc = (
-            supabase
-            .table("processos")
-            .select("id")
-            .eq("codigo", data.processo_id)
-            .single()
-            .execute()
-        )
+        with stage("db_select", errors="database"):
+            proc = (
+                supabase
+                .table("processos")
+                .select("id, pdf_ressalvas")
+                .eq("codigo", data.processo_id)
+                .single()
+                .execute()
+            )
 
         if not proc.data:
             raise HTTPException(
@@ -313,49 +401,40 @@ def atualizar_ressalvas(data: RessalvasUpdateRequest):
 
         processo_uuid = proc.data["id"]
 
-        pdf_buffer = gerar_pdf_ressalvas(
-            processo_codigo=data.processo_id,
-            responsavel=data.responsavel,
-            observacoes=data.observacoes,
-            imagens=data.imagens
-        )
-
-        pdf_base64 = (
-            "data:application/pdf;base64,"
-            + base64.b64encode(pdf_buffer.read()).decode()
-        )
+        # Mesmos dados e mesmo layout: PDF e itens já estão gravados
+        digest = render_cache.render_hash("ressalvas", data)
+        if render_cache.is_current(proc.data.get("pdf_ressalvas"), digest):
+            return RessalvasResponse(success=True, pdf_url=proc.data["pdf_ressalvas"])
+
+        fotos = decode_fotos(data.imagens)
+        registrado_em = datetime.now()
+
+        with stage("render"):
+            pdf_buffer = gerar_pdf_ressalvas(
+                processo_codigo=data.processo_id,
+                responsavel=data.responsavel,
+                observacoes=data.observacoes,
+                imagens=data.imagens,
+                fotos=fotos,
+                registrado_em=registrado_em
+            )
 
         folder = f"{processo_uuid}/ressalvas"
-        pdf_url = upload_pdf(pdf_base64, folder)
+        pdf_url = upload_bytes(pdf_buffer.getvalue(), render_cache.pdf_path(folder, digest), upsert=True)
 
         if not pdf_url:
             raise HTTPException(status_code=500, detail="Falha no upload do PDF")
+        background_tasks.add_task(thumbnails.gerar, pdf_url, pdf_buffer.getvalue())
 
-        # Remove itens antigos e reinsere
-        supabase.table("ressalvas_itens").delete().eq("processo_id", processo_uuid).execute()
-
-        itens = []
-        for img in data.imagens:
-            itens.append({
-                "processo_id": processo_uuid,
-                "item": img.item,
-                "descricao": img.descricao,
-                "prazo": img.prazo.isoformat() if img.prazo else None,
-                "aprovacao": img.aprovacao,
-                "imagem_hash": (
-                    gerar_hash_imagem(img.imagem_base64)
-                    if img.imagem_base64 else None
-                ),
-                "criado_em": datetime.utcnow().isoformat()
-            })
-
-        if itens:
-            supabase.table("ressalvas_itens").insert(itens).execute()
+        # Aplica só a diferença: itens sem mudança ficam intocados
+        sincronizar_itens(processo_uuid, data.imagens, fotos)
 
         ressalvas_dados = {
             "responsavel": data.responsavel,
             "cpf": data.cpf,
             "observacoes": data.observacoes,
+            # Data impressa no PDF (a re-renderização em lote reaproveita)
+            "registrado_em": registrado_em.isoformat(),
             "itens": [
                 {
                     "item": img.item,
@@ -370,12 +449,16 @@ def atualizar_ressalvas(data: RessalvasUpdateRequest):
             ]
         }
 
-        supabase.table("processos").update({
-            "status": "RESSALVAS_REGISTRADAS",
-            "pdf_ressalvas": pdf_url,
-            "ressalvas_dados": ressalvas_dados,
-            "atualizado_em": datetime.utcnow().isoformat()
-        }).eq("id", processo_uuid).execute()
+        with stage("db_update", errors="database"):
+            atualizado = supabase.table("processos").update({
+                "status": "RESSALVAS_REGISTRADAS",
+                "pdf_ressalvas": pdf_url,
+                "ressalvas_dados": ressalvas_dados,
+                "atualizado_em": datetime.utcnow().isoformat()
+            }).eq("id", processo_uuid).execute()
+        replica.gravar(atualizado.data)
+
+        search.indexar_processo(data.processo_id, ressalvas_dados=ressalvas_dados)
 
         return RessalvasResponse(success=True, pdf_url=pdf_url)
 
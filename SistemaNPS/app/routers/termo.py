@@ -1,6 +1,5 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from pydantic import BaseModel
-import base64
 import os
 import re
 import random
@@ -9,35 +8,19 @@ import uuid
 from datetime import datetime
 from io import BytesIO
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from reportlab.lib.utils import ImageReader
 import math
 
-from app.services.upload import upload_pdf
+from app.services.upload import upload_bytes, upload_photo
+from app.services.photos import DecodedPhoto, decode_optional
 from app.services.supabase_client import supabase
 from app.services.pdf_layout import draw_header_footer, content_top, content_bottom
+from app.services import text_layout
+from app.services.metrics import inc, stage
+from app.services import client_ids, preview, render_cache, replica, thumbnails
 
 
-def _wrap_text(text: str, max_width: float, font_name: str, font_size: int) -> list[str]:
-    if not text:
-        return [""]
-    words = str(text).split()
-    lines: list[str] = []
-    current = ""
-    for word in words:
-        test = f"{current} {word}".strip()
-        if stringWidth(test, font_name, font_size) <= max_width:
-            current = test
-        else:
-            if current:
-                lines.append(current)
-            current = word
-    if current or not lines:
-        lines.append(current)
-    return lines
-
+# ReportLab é importado dentro das funções de render: o import do router
+# (e o startup dos workers) não paga o custo da biblioteca.
 
 def _draw_label_value(
     c,
@@ -50,20 +33,30 @@ def _draw_label_value(
     font_value: str = "Helvetica",
     size_label: int = 11,
     size_value: int = 11,
-    line_height: int = 14
+    line_height: int = 14,
+    page_size: tuple[float, float] | None = None
 ) -> float:
     c.setFont(font_label, size_label)
     c.drawString(x, y, label)
     y -= line_height
-    c.setFont(font_value, size_value)
-    for line in _wrap_text(value, max_width, font_value, size_value):
-        c.drawString(x, y, line)
-        y -= line_height
+    lines = text_layout.wrap(value, max_width, font_value, size_value)
+    if page_size:
+        y = text_layout.draw_lines(c, x, y, lines, font_value, size_value, line_height, page_size)
+    else:
+        c.setFont(font_value, size_value)
+        for line in lines:
+            c.drawString(x, y, line.text)
+            y -= line_height
     y -= 8
     return y
 
 
-def _draw_termo_content(c, width: float, height: float, data) -> None:
+def decode_fotos(imagens: list) -> list[tuple[dict, DecodedPhoto | None]]:
+    """Decodifica as fotos do termo uma vez; inválidas ficam como None."""
+    return [(img_data, decode_optional(img_data.get("imagem_base64"))) for img_data in imagens or []]
+
+
+def _draw_termo_content(c, width: float, height: float, data, fotos) -> None:
     margin_x = 40
     max_width = width - (margin_x * 2)
     termo_dados = data.termo_dados or {}
@@ -113,7 +106,9 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
                 c.showPage()
                 draw_header_footer(c, width, height)
                 y = content_top(height)
-            y = _draw_label_value(c, margin_x, y, max_width, key, str(campos.get(key, "")))
+            y = _draw_label_value(
+                c, margin_x, y, max_width, key, str(campos.get(key, "")), page_size=(width, height)
+            )
 
     # Any extra fields
     for key, value in campos.items():
@@ -123,7 +118,7 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
             c.showPage()
             draw_header_footer(c, width, height)
             y = content_top(height)
-        y = _draw_label_value(c, margin_x, y, max_width, key, str(value))
+        y = _draw_label_value(c, margin_x, y, max_width, key, str(value), page_size=(width, height))
 
     # Status
     status_map = {
@@ -136,12 +131,14 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
             c.showPage()
             draw_header_footer(c, width, height)
             y = content_top(height)
-        y = _draw_label_value(c, margin_x, y, max_width, "STATUS DA ENTREGA", status_label)
+        y = _draw_label_value(
+            c, margin_x, y, max_width, "STATUS DA ENTREGA", status_label, page_size=(width, height)
+        )
 
     # Fotos (se houver)
-    imagens = list(data.imagens or [])
+    imagens = list(fotos)
     if imagens:
-        imagens = sorted(imagens, key=lambda i: i.get("item", 0))
+        imagens = sorted(imagens, key=lambda f: f[0].get("item", 0))
         gap = 10
         cols = 3
         cell_w = (max_width - gap * (cols - 1)) / cols
@@ -169,7 +166,7 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
         }
 
         start_y = y
-        for idx, img_data in enumerate(imagens):
+        for idx, (img_data, foto) in enumerate(imagens):
             col = idx % cols
             row = idx // cols
             x = margin_x + col * (cell_w + gap)
@@ -180,13 +177,10 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
             c.setFont("Helvetica-Bold", 9)
             c.drawString(x, y_top, label)
 
-            if img_data.get("imagem_base64"):
+            if foto is not None:
                 try:
-                    _, img_b64 = img_data["imagem_base64"].split(",", 1)
-                    img_bytes = base64.b64decode(img_b64)
-                    img_reader = ImageReader(BytesIO(img_bytes))
                     c.drawImage(
-                        img_reader,
+                        foto.reader(),
                         x,
                         y_top - label_h - cell_h,
                         width=cell_w,
@@ -224,6 +218,27 @@ def _draw_termo_content(c, width: float, height: float, data) -> None:
             y = content_top(height)
         y = _draw_label_value(c, margin_x, y, max_width, label, value)
 
+
+def gerar_pdf_termo(data, fotos: list[tuple[dict, DecodedPhoto | None]] | None = None) -> BytesIO:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # PDF do termo com dados informados
+    draw_header_footer(c, width, height)
+    if fotos is None:
+        fotos = decode_fotos(data.imagens)
+    _draw_termo_content(c, width, height, data, fotos)
+
+    c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
 router = APIRouter(prefix="/termo", tags=["Termo"])
 
 
@@ -236,9 +251,10 @@ class TermoRequest(BaseModel):
     nome_cliente: str
     empresa: str | None = None
     status_entrega: str
-    imagem: str  # base64 (data:image/...)
+    imagem: str | None = None  # legado: captura da tela (não usada; prévia é gerada no servidor)
     imagens: list = []  # list of dicts with item and imagem_base64
     termo_dados: dict | None = None
+    client_id: str | None = None  # id emitido por /offline/ids (envio idempotente)
 
 
 class TermoUpdateRequest(BaseModel):
@@ -247,36 +263,93 @@ class TermoUpdateRequest(BaseModel):
     nome_cliente: str
     empresa: str | None = None
     status_entrega: str
-    imagem: str
+    imagem: str | None = None
     imagens: list = []
     termo_dados: dict | None = None
 
 
+# `imagem` (captura da tela, legado) não entra no PDF; o código do processo e o
+# client_id também não, para que salvar e atualizar com os mesmos dados gerem o
+# mesmo hash.
+RENDER_HASH_EXCLUDE = {"imagem", "processo_codigo", "client_id"}
+
+
+def _upload_fotos(
+    fotos: list[tuple[dict, DecodedPhoto | None]],
+    folder: str,
+    background_tasks: BackgroundTasks
+) -> list[dict]:
+    imagens_urls = []
+    for img_data, foto in fotos:
+        if foto is None:
+            print(f"Erro ao processar imagem {img_data.get('item')}: imagem inválida")
+            continue
+        try:
+            img_url = upload_photo(foto, folder)
+            if img_url:
+                imagens_urls.append({
+                    "item": img_data["item"],
+                    "regiao_foto": img_data.get("regiao_foto"),
+                    "url": img_url
+                })
+                background_tasks.add_task(thumbnails.gerar, img_url, foto.data)
+        except Exception as e:
+            print(f"Erro ao processar imagem {img_data.get('item')}: {e}")
+    return imagens_urls
+
+
 # ============================================================
 # ROTA
 # ============================================================
 
 @router.post("/salvar")
-def salvar_termo(data: TermoRequest):
+def salvar_termo(data: TermoRequest, background_tasks: BackgroundTasks):
     try:
         # ====================================================
         # 1. VALIDAÇÕES
         # ====================================================
-        cpf_limpo = re.sub(r"\D", "", data.cpf)
-        if not re.fullmatch(r"\d{11}", cpf_limpo):
-            raise HTTPException(status_code=400, detail="CPF inválido")
+        with stage("validacao"):
+            cpf_limpo = re.sub(r"\D", "", data.cpf)
+            if not re.fullmatch(r"\d{11}", cpf_limpo):
+                raise HTTPException(status_code=400, detail="CPF inválido")
 
-        if not data.nome_cliente.strip():
-            raise HTTPException(status_code=400, detail="Nome do cliente obrigatório")
+            if not data.nome_cliente.strip():
+                raise HTTPException(status_code=400, detail="Nome do cliente obrigatório")
 
-        if "," not in data.imagem:
-            raise HTTPException(status_code=400, detail="Imagem Base64 inválida")
+            if data.status_entrega not in ("concluido", "concluido_com_ressalva"):
+                raise HTTPException(status_code=400, detail="Status de entrega inválido")
 
-        if data.status_entrega not in ("concluido", "concluido_com_ressalva"):
-            raise HTTPException(status_code=400, detail="Status de entrega inválido")
+            if data.client_id and not client_ids.valido(data.client_id):
+                raise HTTPException(status_code=400, detail="client_id inválido")
 
         # ====================================================
-        # 2. GERA CÓDIGO HUMANO + UUID REAL
+        # 2. ENVIO REPETIDO (FILA OFFLINE): DEVOLVE O PROCESSO JÁ CRIADO
+        # ====================================================
+        # Sem a coluna no banco (sql/001_processos_client_id.sql) o id é ignorado
+        client_id = data.client_id if data.client_id and client_ids.coluna_disponivel() else None
+        if client_id:
+            with stage("db_select", errors="database"):
+                existente = (
+                    supabase
+                    .table("processos")
+                    .select("codigo")
+                    .eq("client_id", client_id)
+                    .limit(1)
+                    .execute()
+                )
+            if existente.data:
+                inc(
+                    "sistemanps_envios_repetidos_total",
+                    help_text="Envios com client_id já processado (respondidos sem gerar de novo)",
+                    rota="/termo/salvar",
+                )
+                return {
+                    "success": True,
+                    "processo_id": existente.data[0]["codigo"]
+                }
+
+        # ====================================================
+        # 3. GERA CÓDIGO HUMANO + UUID REAL
         # ====================================================
         primeiro_nome = re.sub(r"[^A-Z]", "", data.nome_cliente.split()[0].upper())
         ultimos_cpf = cpf_limpo[-3:]
@@ -287,68 +360,36 @@ def salvar_termo(data: TermoRequest):
         processo_uuid = str(uuid.uuid4())  # ✅ UUID REAL (IMPORTANTE)
 
         # ====================================================
-        # 4. GERA PDF EM MEMÓRIA
+        # 4. DECODIFICA FOTOS (UMA VEZ) E GERA PDF EM MEMÓRIA
         # ====================================================
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-
-        # PDF do termo com dados informados
-        draw_header_footer(c, width, height)
-        _draw_termo_content(c, width, height, data)
+        fotos = decode_fotos(data.imagens)
 
-        c.showPage()
-        c.save()
-        buffer.seek(0)
+        with stage("render"):
+            buffer = gerar_pdf_termo(data, fotos)
 
         # ====================================================
-        # 5. PDF → BASE64
-        # ====================================================
-        pdf_base64 = (
-            "data:application/pdf;base64,"
-            + base64.b64encode(buffer.read()).decode()
-        )
-
-        # ====================================================
-        # 6. UPLOAD (BUCKET: processos)
+        # 5. UPLOAD (BUCKET: processos)
         # ====================================================
+        digest = render_cache.render_hash("termo", data, exclude=RENDER_HASH_EXCLUDE)
         folder = f"{processo_uuid}/termo"
-        termo_url = upload_pdf(pdf_base64, folder)
+        termo_url = upload_bytes(buffer.getvalue(), render_cache.pdf_path(folder, digest))
 
         if not termo_url:
             raise HTTPException(
                 status_code=500,
                 detail="Falha no upload do PDF"
             )
+        background_tasks.add_task(thumbnails.gerar, termo_url, buffer.getvalue())
 
         # ====================================================
         # 7. UPLOAD IMAGENS ADICIONAIS (SE HOUVER)
         # ====================================================
-        imagens_urls = []
-        if data.imagens:
-            for img_data in data.imagens:
-                try:
-                    _, img_b64 = img_data["imagem_base64"].split(",", 1)
-                    img_bytes = base64.b64decode(img_b64)
-                    img_buffer = BytesIO(img_bytes)
-                    img_base64 = (
-                        "data:image/png;base64,"
-                        + base64.b64encode(img_buffer.read()).decode()
-                    )
-                    img_folder = f"{processo_uuid}/termo/imagens"
-                    img_url = upload_pdf(img_base64, img_folder)  # reuse upload_pdf for images
-                    if img_url:
-                        imagens_urls.append({
-                            "item": img_data["item"],
-                            "url": img_url
-                        })
-                except Exception as e:
-                    print(f"Erro ao processar imagem {img_data['item']}: {e}")
+        imagens_urls = _upload_fotos(fotos, f"{processo_uuid}/termo/imagens", background_tasks)
 
         # ====================================================
         # 8. INSERE PROCESSO NO BANCO
         # ====================================================
-        res = supabase.table("processos").insert({
+        registro = {
             "processo_id": processo_uuid,     # ✅ UUID REAL
             "codigo": codigo_processo,        # ✅ CÓDIGO HUMANO
             "nome_cliente": data.nome_cliente,
@@ -360,13 +401,20 @@ def salvar_termo(data: TermoRequest):
             "imagens_termo": imagens_urls if imagens_urls else None,
             "termo_dados": data.termo_dados,
             "criado_em": datetime.utcnow().isoformat()
-        }).execute()
+        }
+        if client_id:
+            # Coluna processos.client_id (text, unique): barra duplicata concorrente
+            registro["client_id"] = client_id
+
+        with stage("db_insert", errors="database"):
+            res = supabase.table("processos").insert(registro).execute()
 
         if hasattr(res, "error") and res.error:
             raise HTTPException(
                 status_code=500,
                 detail=f"Erro Supabase: {res.error.message}"
             )
+        replica.gravar(res.data)
 
         # ====================================================
         # 8. RESPOSTA
@@ -386,99 +434,78 @@ def salvar_termo(data: TermoRequest):
         )
 
 
+@router.post("/preview")
+def preview_termo(
+    data: TermoRequest,
+    largura: int = Query(preview.LARGURA_PADRAO, ge=200, le=preview.LARGURA_MAX)
+):
+    """PNG da primeira página do termo com os dados do formulário."""
+    digest = render_cache.render_hash("termo", data, exclude=RENDER_HASH_EXCLUDE)
+    return preview.resposta(digest, largura, lambda: gerar_pdf_termo(data).getvalue())
+
+
 @router.post("/atualizar")
-def atualizar_termo(data: TermoUpdateRequest):
+def atualizar_termo(data: TermoUpdateRequest, background_tasks: BackgroundTasks):
     try:
-        cpf_limpo = re.sub(r"\D", "", data.cpf)
-        if not re.fullmatch(r"\d{11}", cpf_limpo):
-            raise HTTPException(status_code=400, detail="CPF inválido")
-
-        if not data.nome_cliente.strip():
-            raise HTTPException(status_code=400, detail="Nome do cliente obrigatório")
-
-        if "," not in data.imagem:
-            raise HTTPException(status_code=400, detail="Imagem Base64 inválida")
-
-        if data.status_entrega not in ("concluido", "concluido_com_ressalva"):
-            raise HTTPException(status_code=400, detail="Status de entrega inválido")
-
-        proc = (
-            supabase
-            .table("processos")
-            .select("id")
-            .eq("codigo", data.processo_codigo)
-            .single()
-            .execute()
-        )
+        with stage("validacao"):
+            cpf_limpo = re.sub(r"\D", "", data.cpf)
+            if not re.fullmatch(r"\d{11}", cpf_limpo):
+                raise HTTPException(status_code=400, detail="CPF inválido")
+
+            if not data.nome_cliente.strip():
+                raise HTTPException(status_code=400, detail="Nome do cliente obrigatório")
+
+            if data.status_entrega not in ("concluido", "concluido_com_ressalva"):
+                raise HTTPException(status_code=400, detail="Status de entrega inválido")
+
+        with stage("db_select", errors="database"):
+            proc = (
+                supabase
+                .table("processos")
+                .select("id, termo_pdf")
+                .eq("codigo", data.processo_codigo)
+                .single()
+                .execute()
+            )
 
         if not proc.data:
             raise HTTPException(status_code=404, detail="Processo não encontrado")
 
         processo_uuid = proc.data["id"]
 
-        # Decode imagem principal
-        try:
-            _, img_b64 = data.imagem.split(",", 1)
-            img_bytes = base64.b64decode(img_b64)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Falha ao decodificar imagem")
+        # Mesmos dados e mesmo layout: mantém o PDF (e as fotos) já enviados
+        digest = render_cache.render_hash("termo", data, exclude=RENDER_HASH_EXCLUDE)
+        if render_cache.is_current(proc.data.get("termo_pdf"), digest):
+            return {"success": True, "processo_id": data.processo_codigo}
 
-        # Gera PDF em memória
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
+        # Decodifica as fotos uma vez: render e upload usam os mesmos bytes
+        fotos = decode_fotos(data.imagens)
 
-        # PDF do termo com dados informados
-        draw_header_footer(c, width, height)
-        _draw_termo_content(c, width, height, data)
-
-        c.showPage()
-        c.save()
-        buffer.seek(0)
-
-        pdf_base64 = (
-            "data:application/pdf;base64,"
-            + base64.b64encode(buffer.read()).decode()
-        )
+        with stage("render"):
+            buffer = gerar_pdf_termo(data, fotos)
 
         folder = f"{processo_uuid}/termo"
-        termo_url = upload_pdf(pdf_base64, folder)
+        termo_url = upload_bytes(buffer.getvalue(), render_cache.pdf_path(folder, digest), upsert=True)
 
         if not termo_url:
             raise HTTPException(status_code=500, detail="Falha no upload do PDF")
+        background_tasks.add_task(thumbnails.gerar, termo_url, buffer.getvalue())
 
         # Upload imagens adicionais (se houver)
-        imagens_urls = []
-        if data.imagens:
-            for img_data in data.imagens:
-                try:
-                    _, img_b64 = img_data["imagem_base64"].split(",", 1)
-                    img_bytes = base64.b64decode(img_b64)
-                    img_buffer = BytesIO(img_bytes)
-                    img_base64 = (
-                        "data:image/png;base64,"
-                        + base64.b64encode(img_buffer.read()).decode()
-                    )
-                    img_folder = f"{processo_uuid}/termo/imagens"
-                    img_url = upload_pdf(img_base64, img_folder)
-                    if img_url:
-                        imagens_urls.append({
-                            "item": img_data["item"],
-                            "url": img_url
-                        })
-                except Exception as e:
-                    print(f"Erro ao processar imagem {img_data['item']}: {e}")
-
-        supabase.table("processos").update({
-            "nome_cliente": data.nome_cliente,
-            "empresa": data.empresa,
-            "cpf": cpf_limpo,
-            "status_entrega": data.status_entrega,
-            "termo_pdf": termo_url,
-            "imagens_termo": imagens_urls if imagens_urls else None,
-            "termo_dados": data.termo_dados,
-            "atualizado_em": datetime.utcnow().isoformat()
-        }).eq("id", processo_uuid).execute()
+        imagens_urls = _upload_fotos(fotos, f"{processo_uuid}/termo/imagens", background_tasks)
+
+        with stage("db_update", errors="database"):
+            atualizado = supabase.table("processos").update({
+                "nome_cliente": data.nome_cliente,
+                "empresa": data.empresa,
+                "cpf": cpf_limpo,
+                "status_entrega": data.status_entrega,
+                "termo_pdf": termo_url,
+                "imagens_termo": imagens_urls if imagens_urls else None,
+                "termo_dados": data.termo_dados,
+                "atualizado_em": datetime.utcnow().isoformat()
+            }).eq("id", processo_uuid).execute()
+        replica.gravar(atualizado.data)
 
         return {"success": True, "processo_id": data.processo_codigo}
 
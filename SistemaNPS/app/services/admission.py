@@ -0,0 +1,180 @@
+"""
+Controle de admissão das rotas pesadas (render/merge de PDF).
+
+Cada classe de rota tem um limite de requisições simultâneas por worker e
+uma fila de espera limitada. Com a fila cheia (ou depois de esperar
+`espera_max` segundos) a requisição recebe 503 imediatamente, com
+`Retry-After`, em vez de ocupar uma thread do pool: /login, /api/processos
+e as páginas estáticas continuam respondendo durante um pico de envios.
+
+Configuração por classe (variáveis de ambiente, ex.: classe "render"):
+
+    ADMISSION_RENDER_LIMITE=4      # simultâneas por worker
+    ADMISSION_RENDER_FILA=16       # aguardando vaga
+    ADMISSION_RENDER_ESPERA_S=15   # espera máxima na fila
+
+Métricas: sistemanps_admission_in_flight / _queue_depth (gauges),
+sistemanps_admission_rejected_total{motivo} e
+sistemanps_admission_wait_seconds.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+
+from app.services.metrics import inc, observe, set_gauge
+
+
+class RouteClass:
+    def __init__(self, nome: str, rotas: tuple[str, ...], limite: int, fila: int, espera_max: float):
+        self.nome = nome
+        self.rotas = rotas
+        self.limite = int(os.getenv(f"ADMISSION_{nome.upper()}_LIMITE", limite))
+        self.fila = int(os.getenv(f"ADMISSION_{nome.upper()}_FILA", fila))
+        self.espera_max = float(os.getenv(f"ADMISSION_{nome.upper()}_ESPERA_S", espera_max))
+        self.ativos = 0
+        self.esperando = 0
+        # Duração média (EWMA) das requisições admitidas: base do Retry-After
+        self.duracao_media = 1.0
+        self._semaforo: asyncio.Semaphore | None = None
+        self._loop = None
+
+    def _sem(self) -> asyncio.Semaphore:
+        # Um semáforo por event loop (um loop por worker; vários nos testes)
+        loop = asyncio.get_running_loop()
+        if self._semaforo is None or self._loop is not loop:
+            self._semaforo = asyncio.Semaphore(self.limite)
+            self._loop = loop
+        return self._semaforo
+
+    def _gauges(self) -> None:
+        set_gauge(
+            "sistemanps_admission_in_flight",
+            self.ativos,
+            help_text="Requisições em execução por classe de rota",
+            classe=self.nome,
+        )
+        set_gauge(
+            "sistemanps_admission_queue_depth",
+            self.esperando,
+            help_text="Requisições aguardando vaga por classe de rota",
+            classe=self.nome,
+        )
+
+    def retry_after(self) -> int:
+        # Tempo estimado para a fila atual escoar
+        rodadas = (self.esperando + self.ativos) / max(self.limite, 1)
+        return max(1, math.ceil(rodadas * self.duracao_media))
+
+    async def entrar(self) -> str | None:
+        """None se admitida; senão o motivo da rejeição."""
+        sem = self._sem()
+        if not sem.locked():
+            # Vaga livre: acquire() retorna sem suspender
+            await sem.acquire()
+        elif self.esperando >= self.fila:
+            return "fila_cheia"
+        else:
+            inicio = time.perf_counter()
+            self.esperando += 1
+            self._gauges()
+            try:
+                await asyncio.wait_for(sem.acquire(), timeout=self.espera_max)
+            except asyncio.TimeoutError:
+                return "timeout"
+            finally:
+                self.esperando -= 1
+                observe(
+                    "sistemanps_admission_wait_seconds",
+                    time.perf_counter() - inicio,
+                    help_text="Espera na fila de admissão por classe de rota",
+                    classe=self.nome,
+                )
+
+        self.ativos += 1
+        self._gauges()
+        return None
+
+    def sair(self, duracao: float) -> None:
+        self.ativos -= 1
+        self.duracao_media = 0.8 * self.duracao_media + 0.2 * duracao
+        self._sem().release()
+        self._gauges()
+
+
+ROUTE_CLASSES = (
+    RouteClass(
+        "render",
+        (
+            "/termo/salvar",
+            "/termo/atualizar",
+            "/ressalvas/salvar",
+            "/ressalvas/atualizar",
+            "/nps/finalizar",
+            "/finalizacao/gerar-pdf-final",
+        ),
+        limite=4,
+        fila=16,
+        espera_max=15.0,
+    ),
+    # Prévias: mesmo custo de render, mas descartáveis; fila curta
+    RouteClass(
+        "preview",
+        ("/termo/preview", "/ressalvas/preview"),
+        limite=2,
+        fila=4,
+        espera_max=5.0,
+    ),
+)
+
+_POR_ROTA = {rota: classe for classe in ROUTE_CLASSES for rota in classe.rotas}
+
+
+async def _rejeitar(send, classe: RouteClass, motivo: str) -> None:
+    inc(
+        "sistemanps_admission_rejected_total",
+        help_text="Requisições recusadas (503) pelo controle de admissão",
+        classe=classe.nome,
+        motivo=motivo,
+    )
+    espera = classe.retry_after()
+    corpo = json.dumps(
+        {"detail": f"Servidor ocupado. Tente novamente em {espera} s."},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(corpo)).encode()),
+            (b"retry-after", str(espera).encode()),
+            (b"cache-control", b"no-store"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: aplica o limite da classe antes de chegar ao router."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        classe = _POR_ROTA.get(scope["path"]) if scope["type"] == "http" else None
+        if classe is None:
+            await self.app(scope, receive, send)
+            return
+
+        motivo = await classe.entrar()
+        if motivo:
+            await _rejeitar(send, classe, motivo)
+            return
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            classe.sair(time.perf_counter() - inicio)
@@ -0,0 +1,280 @@
+"""
+Snapshot colunar das respostas de NPS para o painel e a API de análise.
+
+Os processos com nota são lidos em páginas e convertidos em arrays NumPy
+(nota, data, empresa, responsável e uma coluna por pergunta de
+`avaliacoes`). As consultas agregam esses arrays de forma vetorizada; o
+banco só é lido de novo quando o snapshot expira (ANALYTICS_TTL_S) ou é
+invalidado por uma gravação de NPS.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import numpy as np
+
+from app.services import archive
+from app.services.metrics import set_gauge, stage
+from app.services.supabase_client import supabase
+
+ANALYTICS_TTL_S = float(os.getenv("ANALYTICS_TTL_S", "300"))
+PAGE_SIZE = 1000
+
+RESPONSAVEL_CAMPO = "RESPONSÁVEL PELA ENTREGA"
+SEM_VALOR = "(não informado)"
+
+# Escala das perguntas de `avaliacoes` (estrelas)
+NOTA_AVALIACAO_MAX = 5
+
+PERIODOS = ("semana", "mes")
+AGRUPAMENTOS = ("empresa", "responsavel")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    nota: np.ndarray            # int16, 0..10
+    dia: np.ndarray             # datetime64[D]
+    empresa: np.ndarray         # int32 -> empresas
+    empresas: np.ndarray        # rótulos
+    responsavel: np.ndarray     # int32 -> responsaveis
+    responsaveis: np.ndarray
+    avaliacoes: dict            # pergunta -> float64 (nan = sem resposta)
+    gerado_em: float
+
+    def __len__(self) -> int:
+        return len(self.nota)
+
+
+_snapshot: Snapshot | None = None
+_lock = threading.Lock()
+
+
+# ============================================================
+# CARGA
+# ============================================================
+
+def _parse_dia(valor) -> np.datetime64:
+    if not valor:
+        return np.datetime64("NaT")
+    try:
+        return np.datetime64(datetime.fromisoformat(str(valor).replace("Z", "+00:00")).date(), "D")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+def _fetch_rows() -> list[dict]:
+    # Paginação por id (como archive.py): sem empates nem linhas puladas
+    # ou repetidas entre páginas quando há gravações no meio
+    rows: list[dict] = []
+    ultimo = None
+    while True:
+        query = (
+            supabase
+            .table("processos")
+            .select("id,empresa,nps_nota,nps_dados,termo_dados,finalizado_em,criado_em")
+            .gte("nps_nota", 0)
+        )
+        if ultimo is not None:
+            query = query.gt("id", ultimo)
+        with stage("db_select", errors="database"):
+            res = query.order("id").limit(PAGE_SIZE).execute()
+        pagina = res.data or []
+        rows.extend(archive.rehydrate_rows(pagina, ("termo_dados", "nps_dados")))
+        if len(pagina) < PAGE_SIZE:
+            return rows
+        ultimo = pagina[-1]["id"]
+
+
+def _codes(valores: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    labels, codes = np.unique(np.array(valores, dtype=object).astype(str), return_inverse=True)
+    return codes.astype(np.int32), labels
+
+
+def build_snapshot(rows: list[dict]) -> Snapshot:
+    n = len(rows)
+    nota = np.empty(n, dtype=np.int16)
+    dia = np.empty(n, dtype="datetime64[D]")
+    empresas: list[str] = []
+    responsaveis: list[str] = []
+    respostas: dict[str, np.ndarray] = {}
+
+    for i, row in enumerate(rows):
+        nota[i] = row.get("nps_nota")
+        dia[i] = _parse_dia(row.get("finalizado_em") or row.get("criado_em"))
+        empresas.append((row.get("empresa") or "").strip() or SEM_VALOR)
+
+        campos = ((row.get("termo_dados") or {}).get("campos") or {})
+        responsaveis.append(str(campos.get(RESPONSAVEL_CAMPO) or "").strip() or SEM_VALOR)
+
+        avaliacoes = ((row.get("nps_dados") or {}).get("avaliacoes") or {})
+        for pergunta, valor in avaliacoes.items():
+            coluna = respostas.get(pergunta)
+            if coluna is None:
+                coluna = respostas[pergunta] = np.full(n, np.nan)
+            try:
+                coluna[i] = float(valor)
+            except (TypeError, ValueError):
+                pass
+
+    empresa_codes, empresa_labels = _codes(empresas)
+    resp_codes, resp_labels = _codes(responsaveis)
+    return Snapshot(
+        nota=nota,
+        dia=dia,
+        empresa=empresa_codes,
+        empresas=empresa_labels,
+        responsavel=resp_codes,
+        responsaveis=resp_labels,
+        avaliacoes=respostas,
+        gerado_em=time.time(),
+    )
+
+
+def get_snapshot() -> Snapshot:
+    global _snapshot
+    snap = _snapshot
+    if snap is not None and time.time() - snap.gerado_em < ANALYTICS_TTL_S:
+        return snap
+    with _lock:
+        snap = _snapshot
+        if snap is None or time.time() - snap.gerado_em >= ANALYTICS_TTL_S:
+            start = time.perf_counter()
+            snap = _snapshot = build_snapshot(_fetch_rows())
+            set_gauge(
+                "sistemanps_analytics_refresh_seconds",
+                time.perf_counter() - start,
+                help_text="Duração da última recarga do snapshot de análise",
+            )
+            set_gauge(
+                "sistemanps_analytics_rows",
+                len(snap),
+                help_text="Respostas de NPS no snapshot de análise",
+            )
+    return snap
+
+
+def invalidate() -> None:
+    """Força recarga na próxima consulta (chamado após gravar NPS)."""
+    global _snapshot
+    _snapshot = None
+
+
+# ============================================================
+# CONSULTAS
+# ============================================================
+
+def _label_index(labels: np.ndarray, valor: str) -> int:
+    idx = np.flatnonzero(labels == valor)
+    return int(idx[0]) if len(idx) else -1
+
+
+def _mask(
+    snap: Snapshot,
+    empresa: str | None = None,
+    responsavel: str | None = None,
+    desde: date | None = None,
+    ate: date | None = None,
+) -> np.ndarray:
+    mask = np.ones(len(snap), dtype=bool)
+    if empresa:
+        mask &= snap.empresa == _label_index(snap.empresas, empresa)
+    if responsavel:
+        mask &= snap.responsavel == _label_index(snap.responsaveis, responsavel)
+    if desde:
+        mask &= snap.dia >= np.datetime64(desde, "D")
+    if ate:
+        mask &= snap.dia <= np.datetime64(ate, "D")
+    return mask
+
+
+def _agregar(grupos: np.ndarray, nota: np.ndarray, tamanho: int) -> dict[str, np.ndarray]:
+    total = np.bincount(grupos, minlength=tamanho)
+    promotores = np.bincount(grupos, weights=nota >= 9, minlength=tamanho)
+    detratores = np.bincount(grupos, weights=nota <= 6, minlength=tamanho)
+    soma = np.bincount(grupos, weights=nota, minlength=tamanho)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nps = np.round((promotores - detratores) * 100 / total, 1)
+        media = np.round(soma / total, 2)
+    return {
+        "total": total,
+        "promotores": promotores.astype(int),
+        "neutros": (total - promotores - detratores).astype(int),
+        "detratores": detratores.astype(int),
+        "nps": nps,
+        "media": media,
+    }
+
+
+def _linhas(chaves: list[str], nome: str, agregado: dict[str, np.ndarray]) -> list[dict]:
+    linhas = []
+    for i, chave in enumerate(chaves):
+        total = int(agregado["total"][i])
+        if not total:
+            continue
+        linhas.append({
+            nome: chave,
+            "total": total,
+            "nps": float(agregado["nps"][i]),
+            "media": float(agregado["media"][i]),
+            "promotores": int(agregado["promotores"][i]),
+            "neutros": int(agregado["neutros"][i]),
+            "detratores": int(agregado["detratores"][i]),
+        })
+    return linhas
+
+
+def tendencia(periodo: str = "mes", **filtros) -> tuple[list[dict], Snapshot]:
+    """NPS (promotores - detratores, em %) por semana (segunda-feira) ou mês.
+
+    As consultas devolvem também o snapshot usado: a resposta descreve os
+    mesmos dados que foram agregados, mesmo que o TTL expire no meio."""
+    snap = get_snapshot()
+    mask = _mask(snap, **filtros) & ~np.isnat(snap.dia)
+    dias = snap.dia[mask]
+    nota = snap.nota[mask]
+    if not len(dias):
+        return [], snap
+
+    if periodo == "semana":
+        # 1970-01-01 foi quinta-feira: recua até a segunda-feira da semana
+        n = dias.astype(np.int64)
+        inicio = (n - (n + 3) % 7).astype("datetime64[D]")
+    else:
+        inicio = dias.astype("datetime64[M]").astype("datetime64[D]")
+
+    chaves, grupos = np.unique(inicio, return_inverse=True)
+    agregado = _agregar(grupos, nota, len(chaves))
+    return _linhas([str(c) for c in chaves], "periodo", agregado), snap
+
+
+def agrupar(por: str = "empresa", **filtros) -> tuple[list[dict], Snapshot]:
+    snap = get_snapshot()
+    mask = _mask(snap, **filtros)
+    codes, labels = (
+        (snap.empresa, snap.empresas) if por == "empresa"
+        else (snap.responsavel, snap.responsaveis)
+    )
+    agregado = _agregar(codes[mask], snap.nota[mask], len(labels))
+    linhas = _linhas([str(label) for label in labels], por, agregado)
+    return sorted(linhas, key=lambda linha: linha["total"], reverse=True), snap
+
+
+def distribuicao(**filtros) -> tuple[list[dict], Snapshot]:
+    """Contagem por nota (0..5) e média de cada pergunta de `avaliacoes`."""
+    snap = get_snapshot()
+    mask = _mask(snap, **filtros)
+    perguntas = []
+    for pergunta, coluna in sorted(snap.avaliacoes.items()):
+        valores = coluna[mask]
+        valores = valores[~np.isnan(valores)]
+        notas = np.clip(np.rint(valores), 0, NOTA_AVALIACAO_MAX).astype(np.int64)
+        contagem = np.bincount(notas, minlength=NOTA_AVALIACAO_MAX + 1)
+        perguntas.append({
+            "pergunta": pergunta,
+            "respostas": int(len(valores)),
+            "media": round(float(valores.mean()), 2) if len(valores) else None,
+            "distribuicao": {str(n): int(c) for n, c in enumerate(contagem)},
+        })
+    return perguntas, snap
@@ -0,0 +1,198 @@
+"""
+Arquivamento (hot/cold) dos JSONs pesados de processos finalizados.
+
+`termo_dados`, `ressalvas_dados` e `nps_dados` ficam inline em processos
+para sempre, e as ressalvas carregam fotos em base64. Este job move o JSON
+de processos finalizados há mais de ARCHIVE_DIAS dias para objetos zstd no
+storage e deixa na coluna só um ponteiro:
+
+    {"$arquivo": "<processo>/arquivo/ressalvas_dados-<hash>.json.zst",
+     "bytes": 1843211, "zstd_bytes": 1390022}
+
+Quem lê essas colunas chama `rehydrate()` (API de processos, rerender,
+analytics, reindexação da busca): o ponteiro é trocado pelo JSON original.
+Colunas menores que ARCHIVE_MIN_BYTES continuam inline (não compensa uma
+ida ao storage). Uma gravação posterior na coluna (atualizar) volta a
+deixá-la inline; o objeto antigo fica órfão no storage.
+
+O job não altera `atualizado_em`: o conteúdo reidratado é o mesmo, então o
+ETag da API de processos continua válido. Rodar de novo é seguro: colunas
+já arquivadas são só ponteiros e são puladas.
+
+CLI: scripts/arquivar_processos.py
+"""
+import hashlib
+import os
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import orjson
+
+from app.services.metrics import inc, stage
+from app.services.storage import StorageError, storage
+from app.services.supabase_client import supabase
+
+COLUNAS = ("termo_dados", "ressalvas_dados", "nps_dados")
+MARCADOR = "$arquivo"
+
+ARCHIVE_DIAS = int(os.getenv("ARCHIVE_DIAS", "180"))
+ARCHIVE_MIN_BYTES = int(os.getenv("ARCHIVE_MIN_BYTES", "8192"))
+# Job em lote: nível alto (compressão lenta, descompressão continua rápida)
+ARCHIVE_ZSTD_NIVEL = int(os.getenv("ARCHIVE_ZSTD_NIVEL", "19"))
+PAGE_SIZE = 50
+CONTENT_TYPE = "application/zstd"
+
+
+def e_ponteiro(valor) -> bool:
+    return isinstance(valor, dict) and MARCADOR in valor
+
+
+# ============================================================
+# LEITURA
+# ============================================================
+
+def _carregar(ponteiro: dict):
+    import zstandard
+
+    path = ponteiro[MARCADOR]
+    with stage("download_arquivo", errors="storage"):
+        comprimido = storage.get(path)
+    inc(
+        "sistemanps_archive_rehydrate_total",
+        help_text="Colunas arquivadas lidas de volta do storage",
+    )
+    return orjson.loads(zstandard.ZstdDecompressor().decompress(comprimido))
+
+
+def rehydrate(row: dict | None, colunas=COLUNAS) -> dict | None:
+    """Troca (na própria linha) ponteiros de arquivo pelo JSON original."""
+    if not row:
+        return row
+    for coluna in colunas:
+        if e_ponteiro(row.get(coluna)):
+            row[coluna] = _carregar(row[coluna])
+    return row
+
+
+def rehydrate_rows(rows: list[dict], colunas=COLUNAS) -> list[dict]:
+    for row in rows:
+        rehydrate(row, colunas)
+    return rows
+
+
+# ============================================================
+# JOB
+# ============================================================
+
+@dataclass
+class Resultado:
+    processos: int = 0
+    arquivados: int = 0  # processos com ao menos uma coluna movida
+    colunas: int = 0
+    bytes_antes: int = 0
+    bytes_depois: int = 0
+    erros: list[str] = field(default_factory=list)
+
+
+def _comprimir(valor) -> tuple[bytes, bytes]:
+    import zstandard
+
+    bruto = orjson.dumps(valor, option=orjson.OPT_SORT_KEYS)
+    return bruto, zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_NIVEL).compress(bruto)
+
+
+def _paginas(corte: date, limite: int | None):
+    """Processos finalizados antes de `corte`, por id (keyset)."""
+    ultimo = None
+    lidos = 0
+    while True:
+        query = (
+            supabase
+            .table("processos")
+            .select("id,codigo,atualizado_em," + ",".join(COLUNAS))
+            .eq("status", "finalizado")
+            .lt("finalizado_em", corte.isoformat())
+        )
+        if ultimo is not None:
+            query = query.gt("id", ultimo)
+        with stage("db_select", errors="database"):
+            linhas = query.order("id").limit(PAGE_SIZE).execute().data or []
+        if limite is not None:
+            linhas = linhas[: limite - lidos]
+        if linhas:
+            yield linhas
+            lidos += len(linhas)
+            ultimo = linhas[-1]["id"]
+        if len(linhas) < PAGE_SIZE or (limite is not None and lidos >= limite):
+            return
+
+
+def _arquivar(p: dict, resultado: Resultado, dry_run: bool) -> None:
+    ponteiros = {}
+    enviados = []
+    for coluna in COLUNAS:
+        valor = p.get(coluna)
+        if valor is None or e_ponteiro(valor):
+            continue
+        bruto, comprimido = _comprimir(valor)
+        if len(bruto) < ARCHIVE_MIN_BYTES:
+            continue
+
+        digest = hashlib.sha256(bruto).hexdigest()[:16]
+        path = f"{p['id']}/arquivo/{coluna}-{digest}.json.zst"
+        if not dry_run:
+            with stage("upload_arquivo", errors="storage"):
+                storage.put(path, comprimido, CONTENT_TYPE, upsert=True)
+            enviados.append(path)
+        ponteiros[coluna] = {MARCADOR: path, "bytes": len(bruto), "zstd_bytes": len(comprimido)}
+        resultado.bytes_antes += len(bruto)
+        resultado.bytes_depois += len(comprimido)
+
+    if not ponteiros:
+        return
+    resultado.arquivados += 1
+    resultado.colunas += len(ponteiros)
+    if dry_run:
+        return
+
+    # Só grava se o processo não mudou desde a leitura; senão o ponteiro
+    # substituiria dados mais novos
+    query = supabase.table("processos").update(ponteiros).eq("id", p["id"])
+    if p.get("atualizado_em"):
+        query = query.eq("atualizado_em", p["atualizado_em"])
+    else:
+        query = query.is_("atualizado_em", "null")
+    with stage("db_update", errors="database"):
+        res = query.execute()
+
+    if not res.data:
+        storage.delete(enviados)
+        resultado.arquivados -= 1
+        resultado.colunas -= len(ponteiros)
+        resultado.erros.append(f"{p.get('codigo')}: alterado durante o arquivamento, tente de novo")
+        return
+    inc(
+        "sistemanps_archive_columns_total",
+        len(ponteiros),
+        help_text="Colunas JSON movidas para o storage pelo arquivamento",
+    )
+
+
+def executar(
+    dias: int = ARCHIVE_DIAS,
+    limite: int | None = None,
+    dry_run: bool = False,
+    progresso=None,
+) -> Resultado:
+    corte = date.today() - timedelta(days=dias)
+    resultado = Resultado()
+    for pagina in _paginas(corte, limite):
+        for p in pagina:
+            resultado.processos += 1
+            try:
+                _arquivar(p, resultado, dry_run)
+            except StorageError as e:
+                resultado.erros.append(f"{p.get('codigo')}: {e}")
+        if progresso:
+            progresso(resultado)
+    return resultado
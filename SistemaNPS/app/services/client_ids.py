@@ -0,0 +1,84 @@
+"""
+Ids de envio emitidos pelo servidor para o modo offline.
+
+Em campo o termo pode ser salvo sem conexão: a página reserva ids enquanto
+está online (GET /offline/ids) e anexa um deles ao envio. O service worker
+usa o id como processo provisório até a fila sincronizar, e o /termo/salvar
+o grava em `processos.client_id`: o mesmo envio repetido (resposta perdida,
+fila reenviada) devolve o processo já criado em vez de duplicar.
+
+O id é `<aleatório>.<hmac>`; só ids assinados por este servidor são aceitos.
+A chave do HMAC é CLIENT_ID_SECRET, a mesma em todos os workers e
+instâncias (um id emitido por um worker é validado por outro). Sem ela a
+aplicação não sobe: `verificar_segredo()` roda no lifespan.
+
+A coluna vem de sql/001_processos_client_id.sql. Enquanto ela não existir
+no banco, `coluna_disponivel()` é False e o /termo/salvar ignora o id (salva
+normalmente, sem reconhecer reenvios).
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+from app.services.supabase_client import supabase
+
+# Segredo próprio (não reaproveita a chave do Supabase); gerar com
+# `python -c "import secrets; print(secrets.token_hex(32))"`
+CLIENT_ID_SECRET = os.getenv("CLIENT_ID_SECRET", "")
+
+MAX_POR_PEDIDO = 50
+# Coluna ausente: verifica de novo depois disso (migração aplicada sem restart)
+COLUNA_RECHECAR_S = 300
+# Coluna inexistente: no select (Postgres) e no cache de schema do PostgREST
+_ERROS_COLUNA = ("42703", "PGRST204")
+
+_coluna: bool | None = None
+_coluna_verificada_em = 0.0
+
+
+def verificar_segredo() -> None:
+    """Chamado no startup: falha cedo em vez de emitir ids que outro worker recusaria."""
+    if not CLIENT_ID_SECRET:
+        raise RuntimeError("CLIENT_ID_SECRET não configurado (ver app/services/client_ids.py)")
+
+
+def _assinatura(aleatorio: str) -> str:
+    verificar_segredo()
+    return hmac.new(CLIENT_ID_SECRET.encode("utf-8"), f"client-id:{aleatorio}".encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def emitir(quantidade: int) -> list[str]:
+    ids = []
+    for _ in range(min(quantidade, MAX_POR_PEDIDO)):
+        aleatorio = secrets.token_hex(12)
+        ids.append(f"{aleatorio}.{_assinatura(aleatorio)}")
+    return ids
+
+
+def valido(client_id: str) -> bool:
+    aleatorio, _, assinatura = client_id.partition(".")
+    if len(aleatorio) != 24 or not assinatura:
+        return False
+    return hmac.compare_digest(assinatura, _assinatura(aleatorio))
+
+
+def coluna_disponivel() -> bool:
+    """processos.client_id existe no banco?"""
+    global _coluna, _coluna_verificada_em
+    if _coluna or (
+        _coluna is False and time.monotonic() - _coluna_verificada_em < COLUNA_RECHECAR_S
+    ):
+        return bool(_coluna)
+    try:
+        supabase.table("processos").select("client_id").limit(1).execute()
+        _coluna = True
+    except Exception as e:
+        if getattr(e, "code", None) not in _ERROS_COLUNA:
+            raise
+        if _coluna is None:
+            print("processos.client_id não existe: aplique sql/001_processos_client_id.sql")
+        _coluna = False
+    _coluna_verificada_em = time.monotonic()
+    return _coluna
@@ -0,0 +1,19 @@
+from starlette.middleware.gzip import GZipMiddleware
+
+# /static já tem cópias pré-comprimidas (build); /pdf e /thumb servem binários
+# com suporte a Range; comprimir esses caminhos só gastaria CPU.
+EXCLUDED_PREFIXES = ("/static", "/pdf", "/thumb", "/metrics")
+
+
+class CompressionMiddleware:
+    """Gzip para as respostas HTML/JSON das rotas dinâmicas."""
+
+    def __init__(self, app, minimum_size: int = 1024, compresslevel: int = 6):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(EXCLUDED_PREFIXES):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,403 @@
+"""
+Substituto em memória do cliente Supabase (tabelas + storage).
+
+Implementa apenas o subconjunto da API usado pelos routers, para testes de
+carga e execução offline. Ativado com SUPABASE_BACKEND=fake. A latência de
+cada chamada pode ser injetada por variáveis de ambiente:
+
+    FAKE_SUPABASE_LATENCIA_DB_MS=20         # fixa, ou faixa "10-40"
+    FAKE_SUPABASE_LATENCIA_STORAGE_MS=50
+    FAKE_SUPABASE_STORAGE_MBPS=20           # banda simulada do storage
+"""
+import copy
+import os
+import random
+import threading
+import time
+import uuid
+
+FAKE_URL = "http://supabase.fake.invalid"
+
+
+class FakeAPIError(Exception):
+    """Mesmo formato de postgrest.exceptions.APIError (code/message/details)."""
+
+    def __init__(self, error: dict):
+        self.code = error.get("code")
+        self.message = error.get("message")
+        self.details = error.get("details")
+        self.hint = error.get("hint")
+        super().__init__(self.message)
+
+
+class FakeStorageError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        self.message = message
+        self.status = status
+        super().__init__(message)
+
+
+def _parse_latencia(valor: str | None) -> tuple[float, float]:
+    if not valor:
+        return (0.0, 0.0)
+    if "-" in valor:
+        minimo, maximo = valor.split("-", 1)
+        return (float(minimo) / 1000, float(maximo) / 1000)
+    return (float(valor) / 1000, float(valor) / 1000)
+
+
+class _Latencia:
+    def __init__(self, faixa: tuple[float, float], bytes_por_segundo: float = 0):
+        self.faixa = faixa
+        self.bytes_por_segundo = bytes_por_segundo
+
+    def esperar(self, tamanho: int = 0) -> None:
+        atraso = random.uniform(*self.faixa) if self.faixa[1] else 0.0
+        if self.bytes_por_segundo and tamanho:
+            atraso += tamanho / self.bytes_por_segundo
+        if atraso:
+            time.sleep(atraso)
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+# ============================================================
+# TABELAS
+# ============================================================
+
+# ---------- filtros ----------
+def _condicao(row: dict, op: str, col, value) -> bool:
+    if op in ("or", "and"):
+        partes = (_condicao(row, *c) for c in value)
+        return any(partes) if op == "or" else all(partes)
+    atual = row.get(col)
+    if op == "eq":
+        return atual == value
+    if op == "neq":
+        return atual != value
+    if op == "in":
+        return atual in value
+    if op == "is":
+        return atual is (None if value == "null" else value)
+    if atual is None:
+        return False
+    if op == "gt":
+        return atual > value
+    if op == "gte":
+        return atual >= value
+    if op == "lt":
+        return atual < value
+    if op == "lte":
+        return atual <= value
+    raise ValueError(f"Operador não suportado no fake: {op}")
+
+
+def _parse_logico(texto: str) -> list[tuple]:
+    """Subconjunto do filtro or=/and= do PostgREST: `col.op.valor`,
+    `and(...)`, `or(...)`, valores entre aspas duplas."""
+    condicoes, pos = _parse_lista(texto, 0)
+    if pos != len(texto):
+        raise ValueError(f"Filtro inválido: {texto}")
+    return condicoes
+
+
+def _parse_lista(texto: str, pos: int) -> tuple[list[tuple], int]:
+    condicoes = []
+    while True:
+        for logico in ("and(", "or("):
+            if texto.startswith(logico, pos):
+                filhos, pos = _parse_lista(texto, pos + len(logico))
+                if texto[pos:pos + 1] != ")":
+                    raise ValueError(f"Filtro inválido: {texto}")
+                condicoes.append((logico[:-1], None, filhos))
+                pos += 1
+                break
+        else:
+            col, op, _ = texto[pos:].split(".", 2)
+            pos += len(col) + len(op) + 2
+            if texto[pos:pos + 1] == '"':
+                fim = pos + 1
+                valor = []
+                while texto[fim] != '"':
+                    if texto[fim] == "\\":
+                        fim += 1
+                    valor.append(texto[fim])
+                    fim += 1
+                valor, pos = "".join(valor), fim + 1
+            else:
+                fim = pos
+                while fim < len(texto) and texto[fim] not in ",)":
+                    fim += 1
+                valor, pos = texto[pos:fim], fim
+            if op == "is":
+                valor = None if valor == "null" else valor
+            condicoes.append((op, col, valor))
+        if texto[pos:pos + 1] != ",":
+            return condicoes, pos
+        pos += 1
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns: list[str] | None = None
+        self._payload = None
+        self._filters: list[tuple] = []
+        self._order: list[tuple[str, bool]] = []
+        self._single = False
+        self._limit: int | None = None
+        self._range: tuple[int, int] | None = None
+        self._on_conflict = "id"
+
+    # ---------- operações ----------
+    def select(self, columns: str = "*", count=None):
+        self._op = "select"
+        cols = [c.strip() for c in columns.split(",") if c.strip()]
+        self._columns = None if cols == ["*"] else cols
+        return self
+
+    def insert(self, payload):
+        self._op = "insert"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", **_):
+        self._op = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, payload: dict):
+        self._op = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ---------- filtros ----------
+    def eq(self, column: str, value):
+        self._filters.append(("eq", column, value))
+        return self
+
+    def neq(self, column: str, value):
+        self._filters.append(("neq", column, value))
+        return self
+
+    def in_(self, column: str, values):
+        self._filters.append(("in", column, list(values)))
+        return self
+
+    def gt(self, column: str, value):
+        self._filters.append(("gt", column, value))
+        return self
+
+    def gte(self, column: str, value):
+        self._filters.append(("gte", column, value))
+        return self
+
+    def lt(self, column: str, value):
+        self._filters.append(("lt", column, value))
+        return self
+
+    def lte(self, column: str, value):
+        self._filters.append(("lte", column, value))
+        return self
+
+    def is_(self, column: str, value):
+        self._filters.append(("is", column, None if value in (None, "null") else value))
+        return self
+
+    def or_(self, filters: str):
+        self._filters.append(("or", None, _parse_logico(filters)))
+        return self
+
+    def order(self, column: str, desc: bool = False, **_):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int):
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int):
+        self._range = (start, end)
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._single = None
+        return self
+
+    # ---------- execução ----------
+    def _match(self, row: dict) -> bool:
+        return all(_condicao(row, op, col, value) for op, col, value in self._filters)
+
+    def _project(self, row: dict) -> dict:
+        if self._columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self._columns}
+
+    def execute(self) -> FakeResponse:
+        self._db._latencia_db.esperar()
+        with self._db._lock:
+            rows = self._db._tables.setdefault(self._table, [])
+
+            if self._op in ("insert", "upsert"):
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                inseridos = []
+                for item in payload:
+                    novo = copy.deepcopy(item)
+                    novo.setdefault("id", str(uuid.uuid4()))
+                    existente = None
+                    if self._op == "upsert":
+                        existente = next(
+                            (r for r in rows if r.get(self._on_conflict) == novo.get(self._on_conflict)),
+                            None,
+                        )
+                    if existente is not None:
+                        existente.update(novo)
+                        inseridos.append(copy.deepcopy(existente))
+                    else:
+                        rows.append(novo)
+                        inseridos.append(copy.deepcopy(novo))
+                return FakeResponse(inseridos)
+
+            matched = [r for r in rows if self._match(r)]
+
+            if self._op == "update":
+                for r in matched:
+                    r.update(copy.deepcopy(self._payload))
+                return FakeResponse([copy.deepcopy(r) for r in matched])
+
+            if self._op == "delete":
+                removidos = {id(r) for r in matched}
+                self._db._tables[self._table] = [r for r in rows if id(r) not in removidos]
+                return FakeResponse([copy.deepcopy(r) for r in matched])
+
+            for column, desc in reversed(self._order):
+                matched.sort(
+                    key=lambda r: (r.get(column) is None, r.get(column) or ""),
+                    reverse=desc,
+                )
+            if self._range is not None:
+                matched = matched[self._range[0]:self._range[1] + 1]
+            if self._limit is not None:
+                matched = matched[:self._limit]
+
+            data = [self._project(r) for r in matched]
+
+        if self._single is not False:
+            if len(data) == 1:
+                return FakeResponse(data[0])
+            if self._single is None and not data:
+                return FakeResponse(None)
+            raise FakeAPIError({
+                "code": "PGRST116",
+                "message": "JSON object requested, multiple (or no) rows returned",
+                "details": f"The result contains {len(data)} rows",
+            })
+        return FakeResponse(data, count=len(data))
+
+
+# ============================================================
+# STORAGE
+# ============================================================
+
+class FakeBucket:
+    def __init__(self, db: "FakeSupabase", bucket: str):
+        self._db = db
+        self._bucket = bucket
+
+    def upload(self, path: str, file, file_options: dict | None = None):
+        data = file if isinstance(file, (bytes, bytearray)) else file.read()
+        options = file_options or {}
+        upsert = str(options.get("upsert", "false")).lower() == "true"
+        self._db._latencia_storage.esperar(len(data))
+        with self._db._lock:
+            objetos = self._db._objects.setdefault(self._bucket, {})
+            if path in objetos and not upsert:
+                raise FakeStorageError("The resource already exists", status=409)
+            objetos[path] = (bytes(data), options.get("content-type"))
+        return {"path": path, "Key": f"{self._bucket}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        with self._db._lock:
+            obj = self._db._objects.get(self._bucket, {}).get(path)
+        if obj is None:
+            self._db._latencia_storage.esperar()
+            raise FakeStorageError("Object not found", status=404)
+        self._db._latencia_storage.esperar(len(obj[0]))
+        return obj[0]
+
+    def exists(self, path: str) -> bool:
+        self._db._latencia_storage.esperar()
+        with self._db._lock:
+            return path in self._db._objects.get(self._bucket, {})
+
+    def remove(self, paths: list[str]):
+        self._db._latencia_storage.esperar()
+        with self._db._lock:
+            objetos = self._db._objects.get(self._bucket, {})
+            return [{"name": p} for p in paths if objetos.pop(p, None) is not None]
+
+    def list(self, path: str = "", options: dict | None = None):
+        self._db._latencia_storage.esperar()
+        prefixo = f"{path.rstrip('/')}/" if path else ""
+        with self._db._lock:
+            nomes = set()
+            for chave in self._db._objects.get(self._bucket, {}):
+                if chave.startswith(prefixo):
+                    nomes.add(chave[len(prefixo):].split("/", 1)[0])
+        return [{"name": n} for n in sorted(nomes)]
+
+    def get_public_url(self, path: str) -> str:
+        return f"{FAKE_URL}/storage/v1/object/public/{self._bucket}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, db: "FakeSupabase"):
+        self._db = db
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self._db, bucket)
+
+
+class FakeSupabase:
+    def __init__(
+        self,
+        latencia_db: tuple[float, float] = (0.0, 0.0),
+        latencia_storage: tuple[float, float] = (0.0, 0.0),
+        storage_bytes_por_segundo: float = 0,
+    ):
+        self._lock = threading.RLock()
+        self._tables: dict[str, list[dict]] = {}
+        self._objects: dict[str, dict[str, tuple[bytes, str | None]]] = {}
+        self._latencia_db = _Latencia(latencia_db)
+        self._latencia_storage = _Latencia(latencia_storage, storage_bytes_por_segundo)
+        self.storage = FakeStorage(self)
+
+    @classmethod
+    def from_env(cls) -> "FakeSupabase":
+        mbps = float(os.getenv("FAKE_SUPABASE_STORAGE_MBPS") or 0)
+        return cls(
+            latencia_db=_parse_latencia(os.getenv("FAKE_SUPABASE_LATENCIA_DB_MS")),
+            latencia_storage=_parse_latencia(os.getenv("FAKE_SUPABASE_LATENCIA_STORAGE_MS")),
+            storage_bytes_por_segundo=mbps * 1024 * 1024 / 8,
+        )
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
@@ -0,0 +1,110 @@
+"""
+Cliente HTTP compartilhado (httpx, HTTP/2, keep-alive).
+
+Um único pool por worker atende tabelas (postgrest), storage e os downloads
+diretos dos PDFs: conexões TLS ficam abertas e as requisições ao mesmo host
+são multiplexadas em HTTP/2. Criado no startup (lifespan do app) ou na
+primeira chamada, fechado no shutdown. Como o cliente Supabase, NÃO é criado
+no master do gunicorn (conexões não sobrevivem ao fork).
+
+Estatísticas de reaproveitamento: sistemanps_http_requests_total{conexao}
+("nova"/"reutilizada") e sistemanps_http_connections_total.
+
+httpx é importado só ao criar o cliente: o import de app.main continua leve.
+"""
+import os
+import threading
+
+from app.services.metrics import inc
+
+HTTP2 = os.getenv("HTTP_HTTP2", "1") != "0"
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Padrão do cliente (tabelas e storage via supabase-py): upload de fotos e
+# PDFs grandes precisa de mais tempo de escrita que de leitura.
+# (argumentos de httpx.Timeout)
+DEFAULT_TIMEOUT = dict(connect=5.0, read=30.0, write=60.0, pool=10.0)
+
+# Timeouts por operação, para as chamadas feitas diretamente com o cliente
+TIMEOUTS = {
+    "download": dict(connect=5.0, read=30.0, write=10.0, pool=10.0),
+    "upload": dict(connect=5.0, read=30.0, write=60.0, pool=10.0),
+    "db": dict(connect=5.0, read=20.0, write=20.0, pool=10.0),
+}
+
+_client = None  # httpx.Client
+_client_lock = threading.Lock()
+
+
+# ============================================================
+# ESTATÍSTICAS
+# ============================================================
+
+def _trace_factory():
+    estado = {"nova": False}
+
+    def trace(evento: str, info: dict) -> None:
+        if evento == "connection.connect_tcp.complete":
+            estado["nova"] = True
+            inc(
+                "sistemanps_http_connections_total",
+                help_text="Conexões TCP abertas pelo cliente HTTP compartilhado",
+            )
+        elif evento.endswith(".send_request_headers.started"):
+            inc(
+                "sistemanps_http_requests_total",
+                help_text="Requisições do cliente HTTP compartilhado por protocolo e conexão",
+                protocolo=evento.split(".", 1)[0],
+                conexao="nova" if estado["nova"] else "reutilizada",
+            )
+
+    return trace
+
+
+def _on_request(request) -> None:
+    request.extensions["trace"] = _trace_factory()
+
+
+# ============================================================
+# CICLO DE VIDA
+# ============================================================
+
+def _create_client():
+    import httpx
+
+    return httpx.Client(
+        http2=HTTP2,
+        timeout=httpx.Timeout(**DEFAULT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        follow_redirects=True,
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def close() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get(url: str, operation: str = "download"):
+    import httpx
+
+    return get_client().get(url, timeout=httpx.Timeout(**TIMEOUTS[operation]))
@@ -0,0 +1,258 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Buckets (segundos / bytes)
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+SIZE_BUCKETS = tuple(1024 * (4 ** i) for i in range(10))  # 1 KiB .. 256 MiB
+
+_lock = threading.Lock()
+_histograms: dict[str, dict] = {}
+_counters: dict[str, dict] = {}
+_gauges: dict[str, dict] = {}
+_help: dict[str, str] = {}
+
+# Timings da requisição corrente (usados no header Server-Timing)
+_timings: ContextVar[list | None] = ContextVar("server_timings", default=None)
+_scope: ContextVar[dict | None] = ContextVar("metrics_scope", default=None)
+
+
+def _current_route() -> str:
+    # O roteador grava a rota no próprio scope; usamos o template do path
+    # (ex.: /pdf/final/{codigo}) para não explodir a cardinalidade.
+    scope = _scope.get()
+    if scope is None:
+        return "-"
+    return getattr(scope.get("route"), "path", None) or "desconhecida"
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _register(store: dict, name: str, help_text: str) -> dict:
+    if name not in store:
+        store[name] = {}
+        _help[name] = help_text
+    return store[name]
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, help_text: str = "", **labels) -> None:
+    key = _labels_key(labels)
+    with _lock:
+        series = _register(_histograms, name, help_text)
+        h = series.get(key)
+        if h is None:
+            h = series[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        idx = bisect_left(h["buckets"], value)
+        if idx < len(h["counts"]):
+            h["counts"][idx] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+def inc(name: str, amount: float = 1, help_text: str = "", **labels) -> None:
+    key = _labels_key(labels)
+    with _lock:
+        series = _register(_counters, name, help_text)
+        series[key] = series.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, help_text: str = "", **labels) -> None:
+    key = _labels_key(labels)
+    with _lock:
+        series = _register(_gauges, name, help_text)
+        series[key] = value
+
+
+def count_error(kind: str, operation: str) -> None:
+    """kind: "storage" ou "database"."""
+    inc(
+        f"sistemanps_{kind}_errors_total",
+        help_text=f"Falhas em chamadas de {kind}",
+        operation=operation,
+    )
+
+
+# ============================================================
+# TIMERS
+# ============================================================
+
+@contextmanager
+def stage(name: str, errors: str | None = None):
+    """
+    Mede um estágio da requisição. Registra no histograma por rota/estágio
+    e acumula para o header Server-Timing. Se `errors` for informado
+    ("storage"/"database"), exceções no bloco incrementam o contador.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors:
+            count_error(errors, name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(
+            "sistemanps_stage_duration_seconds",
+            elapsed,
+            help_text="Duração de cada estágio por rota",
+            route=_current_route(),
+            stage=name,
+        )
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name: str, errors: str | None = None):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, errors=errors):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+
+def _server_timing(timings: list, total: float) -> bytes:
+    parts = []
+    seen: dict[str, int] = {}
+    for name, elapsed in timings:
+        # Estágios repetidos (ex.: upload por foto) recebem sufixo
+        n = seen.get(name, 0)
+        seen[name] = n + 1
+        metric = name if n == 0 else f"{name}-{n}"
+        parts.append(f"{metric};dur={elapsed * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latência por rota, tamanho de payload e Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: list = []
+        timings_token = _timings.set(timings)
+        scope_token = _scope.set(scope)
+        status = {"code": 500}
+        request_size = {"bytes": 0}
+        response_size = {"bytes": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size["bytes"] += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", _server_timing(timings, time.perf_counter() - start))
+                )
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                response_size["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route_label = _current_route()
+            elapsed = time.perf_counter() - start
+            observe(
+                "sistemanps_request_duration_seconds",
+                elapsed,
+                help_text="Latência das requisições HTTP por rota",
+                route=route_label,
+                method=scope.get("method", ""),
+            )
+            inc(
+                "sistemanps_requests_total",
+                help_text="Requisições HTTP por rota e status",
+                route=route_label,
+                method=scope.get("method", ""),
+                status=str(status["code"]),
+            )
+            if request_size["bytes"]:
+                observe(
+                    "sistemanps_request_size_bytes",
+                    request_size["bytes"],
+                    buckets=SIZE_BUCKETS,
+                    help_text="Tamanho do corpo das requisições por rota",
+                    route=route_label,
+                )
+            if response_size["bytes"]:
+                observe(
+                    "sistemanps_response_size_bytes",
+                    response_size["bytes"],
+                    buckets=SIZE_BUCKETS,
+                    help_text="Tamanho do corpo das respostas por rota",
+                    route=route_label,
+                )
+            _timings.reset(timings_token)
+            _scope.reset(scope_token)
+
+
+# ============================================================
+# EXPOSIÇÃO (formato Prometheus)
+# ============================================================
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: tuple, extra: dict | None = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# HELP {name} {_help.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_fmt_labels(key)} {value}")
+
+        for name, series in sorted(_gauges.items()):
+            lines.append(f"# HELP {name} {_help.get(name, '')}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{_fmt_labels(key)} {value}")
+
+        for name, series in sorted(_histograms.items()):
+            lines.append(f"# HELP {name} {_help.get(name, '')}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, h in series.items():
+                acc = 0
+                for bound, count in zip(h["buckets"], h["counts"]):
+                    acc += count
+                    lines.append(f"{name}_bucket{_fmt_labels(key, {'le': bound})} {acc}")
+                lines.append(f"{name}_bucket{_fmt_labels(key, {'le': '+Inf'})} {h['count']}")
+                lines.append(f"{name}_sum{_fmt_labels(key)} {h['sum']}")
+                lines.append(f"{name}_count{_fmt_labels(key)} {h['count']}")
+    return "\n".join(lines) + "\n"
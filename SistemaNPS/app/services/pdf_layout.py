@@ -1,6 +1,9 @@
 import os
-from reportlab.lib.colors import HexColor
-from reportlab.lib.utils import ImageReader
+from functools import lru_cache
+
+# Incrementar ao mudar qualquer coisa no desenho dos PDFs: invalida o cache
+# de render (app/services/render_cache.py)
+LAYOUT_VERSION = 1
 
 # Layout constants
 HEADER_MARGIN_X = 30
@@ -10,10 +13,13 @@ RIGHT_IMAGE_HEIGHT = 220
 HEADER_BOTTOM_GAP = 20
 CONTENT_HEADER_HEIGHT = 110
 
+LEFT_IMAGE = "LogoFlexcolor.png"
+RIGHT_IMAGE = "Kure.png"
+
 FOOTER_Y = 20
 FOOTER_FONT = "Helvetica"
 FOOTER_FONT_SIZE = 10
-FOOTER_COLOR = HexColor("#8a8a8a")
+FOOTER_COLOR = "#8a8a8a"
 
 DEFAULT_FOOTER_TEXT = (
     "R. José Antônio Valadares, 285 - Vila Liviero, São Paulo - SP, 04185-020"
@@ -25,7 +31,11 @@ def _asset_path(filename: str) -> str:
     return os.path.join(base, filename)
 
 
-def _load_image(filename: str) -> ImageReader | None:
+@lru_cache(maxsize=None)
+def _load_image(filename: str):
+    # Logos são lidos uma vez por processo (ou no master, antes do fork)
+    from reportlab.lib.utils import ImageReader
+
     path = _asset_path(filename)
     if not os.path.exists(path):
         return None
@@ -35,15 +45,29 @@ def _load_image(filename: str) -> ImageReader | None:
         return None
 
 
+def preload_assets() -> None:
+    """Decodifica os logos e carrega as métricas das fontes usadas no layout."""
+    from reportlab.pdfbase.pdfmetrics import getFont
+
+    for font in ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", FOOTER_FONT):
+        getFont(font)
+    for filename in (LEFT_IMAGE, RIGHT_IMAGE):
+        img = _load_image(filename)
+        if img:
+            img.getRGBData()
+
+
 def draw_header_footer(
     c,
     width: float,
     height: float,
     footer_text: str = DEFAULT_FOOTER_TEXT
 ) -> None:
+    from reportlab.lib.colors import HexColor
+
     # Header images
-    left_img = _load_image("LogoFlexcolor.png")
-    right_img = _load_image("Kure.png")
+    left_img = _load_image(LEFT_IMAGE)
+    right_img = _load_image(RIGHT_IMAGE)
 
     if left_img:
         iw, ih = left_img.getSize()
@@ -68,7 +92,7 @@ def draw_header_footer(
 
     # Footer text
     c.setFont(FOOTER_FONT, FOOTER_FONT_SIZE)
-    c.setFillColor(FOOTER_COLOR)
+    c.setFillColor(HexColor(FOOTER_COLOR))
     text_w = c.stringWidth(footer_text, FOOTER_FONT, FOOTER_FONT_SIZE)
     c.drawString((width - text_w) / 2, FOOTER_Y, footer_text)
     c.setFillColor(HexColor("#000000"))
@@ -80,3 +104,10 @@ def content_top(height: float) -> float:
 
 def content_bottom() -> float:
     return FOOTER_Y + 30
+
+
+def new_page(c, width: float, height: float) -> float:
+    """Fecha a página atual, desenha cabeçalho/rodapé na próxima e retorna o topo do conteúdo."""
+    c.showPage()
+    draw_header_footer(c, width, height)
+    return content_top(height)
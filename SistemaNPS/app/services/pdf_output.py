@@ -0,0 +1,45 @@
+"""
+Estágio de saída dos PDFs entregues ao navegador.
+
+`linearizar` regrava o PDF em modo "fast web view" (linearizado, objetos
+agrupados em object streams comprimidos): o dicionário de linearização e a
+primeira página vêm no início do arquivo, e o visualizador do navegador,
+com requisições Range, mostra a página 1 antes de baixar o restante (as
+fotos das outras páginas).
+"""
+from io import BytesIO
+
+from app.services.metrics import count_error, stage
+
+
+def linearizar(pdf) -> bytes:
+    """Recebe bytes ou BytesIO; em caso de falha devolve o PDF original."""
+    dados = pdf.getvalue() if isinstance(pdf, BytesIO) else bytes(pdf)
+    try:
+        import pikepdf
+    except ImportError:
+        return dados
+
+    try:
+        with stage("linearize"):
+            with pikepdf.open(BytesIO(dados)) as doc:
+                saida = BytesIO()
+                # Streams copiados como estão (ReportLab já os comprime):
+                # decodificar e recomprimir as fotos custaria segundos.
+                doc.save(
+                    saida,
+                    linearize=True,
+                    object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                    stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                    compress_streams=False,
+                )
+        return saida.getvalue()
+    except Exception as e:
+        count_error("pdf", "linearize")
+        print(f"Erro ao linearizar PDF: {e}")
+        return dados
+
+
+def is_linearized(dados: bytes) -> bool:
+    # O dicionário /Linearized precisa estar no primeiro objeto do arquivo
+    return b"/Linearized" in dados[:1024]
@@ -0,0 +1,145 @@
+"""
+Fotos decodificadas uma única vez na entrada da requisição.
+
+O mesmo objeto serve ao render do PDF (ImageReader), ao hash gravado em
+ressalvas_itens e ao upload — sem decodificar de novo nem re-codificar em
+base64. O MIME vem dos bytes (não do prefixo data:), e as dimensões são
+lidas do cabeçalho do arquivo, sem decodificar os pixels.
+"""
+import base64
+import binascii
+import hashlib
+import struct
+from dataclasses import dataclass, field
+from io import BytesIO
+
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+def _normalize_base64(encoded: str) -> str:
+    encoded = encoded.strip().replace("\n", "").replace("\r", "").replace(" ", "")
+    missing = len(encoded) % 4
+    if missing:
+        encoded += "=" * (4 - missing)
+    return encoded
+
+
+def sniff_mime(data: bytes) -> str | None:
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+def _jpeg_size(data: bytes) -> tuple[int, int] | None:
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        (seg_len,) = struct.unpack(">H", data[i + 2:i + 4])
+        # SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            altura, largura = struct.unpack(">HH", data[i + 5:i + 9])
+            return largura, altura
+        i += 2 + seg_len
+    return None
+
+
+def _webp_size(data: bytes) -> tuple[int, int] | None:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        largura, altura = struct.unpack("<HH", data[26:30])
+        return largura & 0x3FFF, altura & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        largura = int.from_bytes(data[24:27], "little") + 1
+        altura = int.from_bytes(data[27:30], "little") + 1
+        return largura, altura
+    return None
+
+
+def image_size(data: bytes, mime: str | None) -> tuple[int, int] | None:
+    try:
+        if mime == "image/png" and len(data) >= 24:
+            return struct.unpack(">II", data[16:24])
+        if mime == "image/jpeg":
+            return _jpeg_size(data)
+        if mime == "image/webp":
+            return _webp_size(data)
+        if mime == "image/gif" and len(data) >= 10:
+            return struct.unpack("<HH", data[6:10])
+    except struct.error:
+        return None
+    return None
+
+
+@dataclass(frozen=True)
+class DecodedPhoto:
+    data: bytes = field(repr=False)
+    mime: str
+    width: int | None
+    height: int | None
+    sha256: str
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DecodedPhoto":
+        if not data:
+            raise ValueError("Imagem vazia")
+        mime = sniff_mime(data)
+        if mime is None:
+            raise ValueError("Formato de imagem não suportado")
+        size = image_size(data, mime) or (None, None)
+        return cls(
+            data=data,
+            mime=mime,
+            width=size[0],
+            height=size[1],
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+
+    @classmethod
+    def from_base64(cls, value: str) -> "DecodedPhoto":
+        """Aceita data URL (data:image/...;base64,...) ou base64 puro."""
+        encoded = value.split(",", 1)[1] if "," in value else value
+        try:
+            data = base64.b64decode(_normalize_base64(encoded))
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Base64 inválido: {e}")
+        return cls.from_bytes(data)
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS.get(self.mime, ".bin")
+
+    def reader(self):
+        from reportlab.lib.utils import ImageReader
+
+        return ImageReader(BytesIO(self.data))
+
+
+def decode_optional(value: str | None) -> DecodedPhoto | None:
+    """Decodifica se houver valor; imagem inválida vira None."""
+    if not value:
+        return None
+    try:
+        return DecodedPhoto.from_base64(value)
+    except ValueError:
+        return None
@@ -0,0 +1,69 @@
+"""
+Pré-visualização (PNG da primeira página) do termo e das ressalvas.
+
+O formulário envia os mesmos dados do salvar; o servidor gera o PDF com o
+mesmo código de render e rasteriza a página 1 (pypdfium2, sob a trava de
+thumbnails: o PDFium não é thread-safe). O resultado fica
+em um cache LRU indexado pelo hash de render (render_cache) e pela largura:
+pedir a prévia de novo sem alterar o formulário não gera nada.
+"""
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable
+
+from fastapi import Response
+
+from app.services import thumbnails
+from app.services.metrics import inc, stage
+
+LARGURA_PADRAO = 800
+LARGURA_MAX = 1600
+CACHE_ITENS = int(os.getenv("PREVIEW_CACHE_ITENS", "64"))
+
+_cache: OrderedDict[str, bytes] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(chave: str) -> bytes | None:
+    with _cache_lock:
+        png = _cache.get(chave)
+        if png is not None:
+            _cache.move_to_end(chave)
+        return png
+
+
+def _cache_put(chave: str, png: bytes) -> None:
+    with _cache_lock:
+        _cache[chave] = png
+        while len(_cache) > CACHE_ITENS:
+            _cache.popitem(last=False)
+
+
+def render_png(pdf_bytes: bytes, largura: int) -> bytes:
+    # Rasteriza sob thumbnails.pdfium_lock (PDFium não é thread-safe);
+    # a codificação PNG fica fora da trava.
+    image = thumbnails.render_pdf_page(pdf_bytes, largura)
+    saida = BytesIO()
+    # compress_level baixo: a prévia é descartável, o tempo importa mais
+    image.save(saida, "PNG", compress_level=1)
+    return saida.getvalue()
+
+
+def resposta(digest: str, largura: int, gerar_pdf: Callable[[], bytes]) -> Response:
+    chave = f"{digest}-{largura}"
+    png = _cache_get(chave)
+    inc(
+        "sistemanps_preview_cache_total",
+        help_text="Prévias servidas do cache ou geradas",
+        result="hit" if png is not None else "miss",
+    )
+    if png is None:
+        with stage("render"):
+            pdf = gerar_pdf()
+        with stage("rasterize"):
+            png = render_png(pdf, largura)
+        _cache_put(chave, png)
+
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "no-store"})
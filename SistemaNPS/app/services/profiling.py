@@ -0,0 +1,329 @@
+"""
+Profiling sob demanda de requisições (produção).
+
+Desligado por padrão. Uma requisição é perfilada quando:
+
+    - traz o header `X-Profile: <PROFILE_TOKEN>` (uso do admin; com
+      `X-Profile-Memoria: 1` também liga o tracemalloc), ou
+    - cai na amostragem: PROFILE_SAMPLE_RATE (0..1) nas rotas de
+      PROFILE_ROUTES (padrão: rotas de render).
+
+Para a requisição perfilada são gravados em PROFILE_DIR:
+
+    <id>.speedscope.json   amostras de pilha (CPU) da thread que executa a
+                           rota, a cada PROFILE_INTERVAL_MS; abrir em
+                           https://www.speedscope.app
+    <id>.memoria.json      resumo; com tracemalloc, pico e maiores
+                           alocações por linha
+
+O id volta no header `X-Profile-Id`; os arquivos são listados e baixados
+em /admin/profiles (mesmo token). Só um profile por vez em cada worker: com
+outro em andamento a requisição segue sem profiling. Com o profiling
+desligado o custo é um `if` no middleware e um ContextVar.get por rota.
+
+tracemalloc é global ao processo: durante o profile, alocações de outras
+requisições simultâneas também entram no snapshot.
+"""
+import asyncio
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from app.services.metrics import inc
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ROUTES = tuple(
+    rota.strip() for rota in os.getenv(
+        "PROFILE_ROUTES",
+        "/termo/salvar,/ressalvas/salvar,/nps/finalizar,/finalizacao/gerar-pdf-final",
+    ).split(",") if rota.strip()
+)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+PROFILE_MAX = int(os.getenv("PROFILE_MAX", "40"))
+# tracemalloc deixa código que aloca muito (ex.: base85 do ReportLab) até 10x
+# mais lento e distorce o profile de CPU: desligado por padrão, ligado por
+# requisição com X-Profile-Memoria ou para todas com PROFILE_TRACEMALLOC=1
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "0") == "1"
+PROFILE_TOP_ALOCACOES = 25
+
+HEADER = b"x-profile"
+HEADER_MEMORIA = b"x-profile-memoria"
+
+_ativo: ContextVar["Perfil | None"] = ContextVar("profiling_ativo", default=None)
+# Um profile por vez: o sampler e o tracemalloc são do processo inteiro
+_em_andamento = threading.Lock()
+
+
+def habilitado() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def token_valido(valor: str | None) -> bool:
+    return bool(PROFILE_TOKEN) and bool(valor) and hmac.compare_digest(valor, PROFILE_TOKEN)
+
+
+# ============================================================
+# PERFIL (SAMPLER + TRACEMALLOC)
+# ============================================================
+
+class Perfil:
+    def __init__(self, rota: str, motivo: str, memoria: bool = PROFILE_TRACEMALLOC):
+        self.rota = rota
+        self.motivo = motivo
+        self.memoria = memoria
+        slug = re.sub(r"[^a-z0-9]+", "-", rota.lower()).strip("-") or "raiz"
+        self.id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{slug}-{os.urandom(2).hex()}"
+        # Threads que executam a rota (registradas por `_marcar_thread`)
+        self.threads: set[int] = set()
+        self.amostras: Counter = Counter()  # pilha -> ms
+        self.n_amostras = 0
+        self.inicio = 0.0
+        self.duracao = 0.0
+        self.status = None
+        self._parar = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._tracemalloc_proprio = False
+        self._memoria: dict = {}
+
+    def iniciar(self) -> None:
+        if self.memoria and not tracemalloc.is_tracing():
+            # 1 frame basta para o top por linha e custa bem menos
+            tracemalloc.start(1)
+            self._tracemalloc_proprio = True
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.inicio = time.perf_counter()
+        self._sampler = threading.Thread(target=self._amostrar, name="profiling-sampler", daemon=True)
+        self._sampler.start()
+
+    def _amostrar(self) -> None:
+        intervalo = PROFILE_INTERVAL_MS / 1000
+        proprio = threading.get_ident()
+        anterior = time.perf_counter()
+        while not self._parar.wait(intervalo):
+            # Peso = tempo real desde a amostra anterior (o wait atrasa sob GIL)
+            agora = time.perf_counter()
+            peso = (agora - anterior) * 1000
+            anterior = agora
+            for tid, frame in sys._current_frames().items():
+                if tid == proprio or tid not in self.threads:
+                    continue
+                pilha = []
+                while frame is not None:
+                    code = frame.f_code
+                    pilha.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                pilha.reverse()
+                self.n_amostras += 1
+                self.amostras[tuple(pilha)] += peso
+
+    def finalizar(self) -> None:
+        self.duracao = time.perf_counter() - self.inicio
+        self._parar.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+        if not self.memoria or not tracemalloc.is_tracing():
+            return
+
+        atual, pico = tracemalloc.get_traced_memory()
+        estatisticas = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )).statistics("lineno")
+        if self._tracemalloc_proprio:
+            tracemalloc.stop()
+
+        self._memoria = {
+            "atual_bytes": atual,
+            "pico_bytes": pico,
+            "top_alocacoes": [
+                {
+                    "arquivo": stat.traceback[0].filename,
+                    "linha": stat.traceback[0].lineno,
+                    "bytes": stat.size,
+                    "blocos": stat.count,
+                }
+                for stat in estatisticas[:PROFILE_TOP_ALOCACOES]
+            ],
+        }
+
+    def _speedscope(self) -> dict:
+        frames: list[dict] = []
+        indices: dict[tuple, int] = {}
+        samples, weights = [], []
+        for pilha, ms in self.amostras.most_common():
+            linha = []
+            for chave in pilha:
+                if chave not in indices:
+                    indices[chave] = len(frames)
+                    frames.append({"name": chave[0], "file": chave[1], "line": chave[2]})
+                linha.append(indices[chave])
+            samples.append(linha)
+            weights.append(round(ms, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "sistemanps",
+            "name": self.id,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.rota,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(self.duracao * 1000, 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def salvar(self) -> None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.id)
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self._speedscope(), f)
+        with open(f"{base}.memoria.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "rota": self.rota,
+                "motivo": self.motivo,
+                "status": self.status,
+                "duracao_s": round(self.duracao, 4),
+                "amostras_cpu": self.n_amostras,
+                "tracemalloc": self.memoria,
+                "intervalo_ms": PROFILE_INTERVAL_MS,
+                **self._memoria,
+            }, f, ensure_ascii=False, indent=2)
+        _limpar_antigos()
+
+
+def _limpar_antigos() -> None:
+    ids = sorted({nome.split(".", 1)[0] for nome in os.listdir(PROFILE_DIR)})
+    for antigo in ids[:-PROFILE_MAX] if len(ids) > PROFILE_MAX else []:
+        for nome in (f"{antigo}.speedscope.json", f"{antigo}.memoria.json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, nome))
+            except FileNotFoundError:
+                pass
+
+
+def listar() -> list[str]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(os.listdir(PROFILE_DIR), reverse=True)
+
+
+def caminho_artefato(nome: str) -> str | None:
+    # Só nomes gerados aqui: nada de "../"
+    if not re.fullmatch(r"[\w-]+\.(speedscope|memoria)\.json", nome):
+        return None
+    caminho = os.path.join(PROFILE_DIR, nome)
+    return caminho if os.path.isfile(caminho) else None
+
+
+# ============================================================
+# INSTRUMENTAÇÃO DAS ROTAS
+# ============================================================
+
+def _marcar_thread(func):
+    # Rotas síncronas rodam no threadpool: o sampler precisa saber em qual
+    # thread a rota perfilada está. O ContextVar é copiado para a thread.
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            perfil = _ativo.get()
+            if perfil is not None:
+                perfil.threads.add(threading.get_ident())
+            return await func(*args, **kwargs)
+    else:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            perfil = _ativo.get()
+            if perfil is not None:
+                perfil.threads.add(threading.get_ident())
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def instrumentar(app) -> None:
+    """Chamar depois de incluir os routers."""
+    from fastapi.routing import APIRoute
+
+    if not habilitado():
+        return
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.dependant.call is not None:
+            route.dependant.call = _marcar_thread(route.dependant.call)
+
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.ativo = habilitado()
+
+    def _motivo(self, scope) -> tuple[str | None, bool]:
+        """(motivo ou None, com tracemalloc)."""
+        headers = dict(scope.get("headers") or ())
+        if HEADER in headers:
+            if not token_valido(headers[HEADER].decode("latin-1")):
+                return None, False
+            return "header", PROFILE_TRACEMALLOC or headers.get(HEADER_MEMORIA) == b"1"
+        if PROFILE_SAMPLE_RATE > 0 and scope["path"] in PROFILE_ROUTES and random.random() < PROFILE_SAMPLE_RATE:
+            return "amostragem", PROFILE_TRACEMALLOC
+        return None, False
+
+    async def __call__(self, scope, receive, send):
+        if not self.ativo or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        motivo, memoria = self._motivo(scope)
+        if motivo is None or not _em_andamento.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        perfil = Perfil(scope["path"], motivo, memoria)
+        token = _ativo.set(perfil)
+
+        async def send_com_id(message):
+            if message["type"] == "http.response.start":
+                perfil.status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", perfil.id.encode())]
+            await send(message)
+
+        try:
+            perfil.iniciar()
+            try:
+                await self.app(scope, receive, send_com_id)
+            finally:
+                _ativo.reset(token)
+                perfil.finalizar()
+            # Escrita dos arquivos fora do event loop
+            try:
+                await asyncio.to_thread(perfil.salvar)
+            except OSError as e:
+                print(f"Erro ao gravar profile {perfil.id}: {e}")
+                return
+            inc(
+                "sistemanps_profiles_total",
+                help_text="Requisições perfiladas por motivo",
+                motivo=motivo,
+            )
+        finally:
+            _em_andamento.release()
@@ -0,0 +1,41 @@
+"""
+Cache de render por hash do conteúdo.
+
+O hash cobre o modelo da requisição (canonizado em JSON) e a versão do
+layout. Os PDFs são gravados em `<pasta>/<hash>.pdf`, então a própria URL
+salva no processo diz se o PDF atual já corresponde aos dados enviados.
+Incrementar LAYOUT_VERSION em pdf_layout invalida todas as entradas.
+"""
+import hashlib
+import json
+
+from pydantic import BaseModel
+
+from app.services.metrics import inc
+from app.services.pdf_layout import LAYOUT_VERSION
+
+
+def render_hash(kind: str, model: BaseModel, exclude: set[str] | None = None) -> str:
+    dados = model.model_dump(mode="json", exclude=exclude)
+    canonico = json.dumps(
+        {"kind": kind, "layout": LAYOUT_VERSION, "dados": dados},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def pdf_path(folder: str, digest: str) -> str:
+    return f"{folder}/{digest}.pdf"
+
+
+def is_current(url: str | None, digest: str) -> bool:
+    """True se a URL armazenada já aponta para o PDF deste hash."""
+    hit = bool(url) and url.split("?", 1)[0].endswith(f"/{digest}.pdf")
+    inc(
+        "sistemanps_render_cache_total",
+        help_text="Consultas ao cache de render por resultado",
+        result="hit" if hit else "miss",
+    )
+    return hit
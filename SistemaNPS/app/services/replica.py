@@ -0,0 +1,385 @@
+"""
+Réplica local (SQLite) da tabela processos para leitura.
+
+/admin, /api/processos/{codigo} e as rotas /pdf/* leem dados que mudam
+pouco; com a réplica essas leituras não vão ao Supabase pela rede.
+
+    - Sincronização incremental: uma thread por worker puxa a cada
+      REPLICA_INTERVALO_S as linhas com criado_em / atualizado_em depois do
+      último cursor (paginação por chave (coluna, id), com o desempate por
+      id na própria consulta). Cursores e linhas ficam no arquivo
+      REPLICA_DB_PATH, compartilhado pelos workers.
+    - Write-through: as rotas de gravação passam o retorno do insert/update
+      para `gravar()`, então o próprio worker enxerga a gravação na hora.
+    - Limite de atraso: se a última sincronização deste worker tem mais de
+      REPLICA_MAX_ATRASO_S, ou o processo não está na réplica, a leitura
+      vai ao Supabase como antes.
+
+Cada linha é guardada como JSON com as colunas de busca/ordenação
+indexadas à parte; colunas novas em processos não exigem migração aqui.
+Os JSONs pesados (termo_dados, ressalvas_dados com fotos, nps_dados) ficam
+na tabela `pesados`, lida só quando a consulta pede essas colunas: a
+listagem do /admin decodifica apenas a parte leve.
+Remoções feitas direto no banco não são replicadas: `sincronizar(completo=True)`
+refaz a cópia do zero. Desligar com REPLICA_ENABLED=0.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import orjson
+
+from app.services.metrics import count_error, inc, set_gauge, stage
+from app.services.supabase_client import apos, supabase
+
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "1") != "0"
+REPLICA_DB_PATH = os.getenv("REPLICA_DB_PATH", os.path.join("data", "replica.sqlite3"))
+REPLICA_INTERVALO_S = float(os.getenv("REPLICA_INTERVALO_S", "10"))
+REPLICA_MAX_ATRASO_S = float(os.getenv("REPLICA_MAX_ATRASO_S", "30"))
+# Linhas inteiras (ressalvas_dados com fotos em base64): páginas pequenas
+PAGE_SIZE = 100
+
+CURSORES = ("criado_em", "atualizado_em")
+_INICIO = "1970-01-01T00:00:00"
+PESADAS = ("termo_dados", "ressalvas_dados", "nps_dados")
+# Muda quando o esquema local muda: a réplica é recriada e puxada de novo
+_VERSAO_ESQUEMA = 2
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_sincronizado_em = 0.0
+_parar = threading.Event()
+_thread: threading.Thread | None = None
+
+
+# ============================================================
+# ARMAZENAMENTO
+# ============================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processos (
+    id TEXT PRIMARY KEY,
+    codigo TEXT,
+    criado_em TEXT,
+    atualizado_em TEXT,
+    status TEXT,
+    empresa TEXT,
+    versao TEXT,
+    linha BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pesados (
+    id TEXT PRIMARY KEY,
+    versao TEXT,
+    termo_dados BLOB,
+    ressalvas_dados BLOB,
+    nps_dados BLOB
+);
+CREATE UNIQUE INDEX IF NOT EXISTS processos_codigo ON processos (codigo);
+CREATE INDEX IF NOT EXISTS processos_criado_em ON processos (criado_em);
+CREATE INDEX IF NOT EXISTS processos_status ON processos (status);
+CREATE INDEX IF NOT EXISTS processos_empresa ON processos (empresa);
+CREATE TABLE IF NOT EXISTS estado (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+_UPSERT = """
+INSERT INTO processos (id, codigo, criado_em, atualizado_em, status, empresa, versao, linha)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    codigo = excluded.codigo,
+    criado_em = excluded.criado_em,
+    atualizado_em = excluded.atualizado_em,
+    status = excluded.status,
+    empresa = excluded.empresa,
+    versao = excluded.versao,
+    linha = excluded.linha
+WHERE excluded.versao >= COALESCE(processos.versao, '')
+"""
+
+_UPSERT_PESADOS = """
+INSERT INTO pesados (id, versao, termo_dados, ressalvas_dados, nps_dados)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    versao = excluded.versao,
+    termo_dados = excluded.termo_dados,
+    ressalvas_dados = excluded.ressalvas_dados,
+    nps_dados = excluded.nps_dados
+WHERE excluded.versao >= COALESCE(pesados.versao, '')
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        pasta = os.path.dirname(REPLICA_DB_PATH)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(REPLICA_DB_PATH, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != _VERSAO_ESQUEMA:
+            with _write_lock:
+                _recriar(conn)
+        _local.conn = conn
+    return conn
+
+
+def _recriar(conn: sqlite3.Connection) -> None:
+    """Recria as tabelas se o esquema do arquivo é de outra versão.
+
+    Roda com _write_lock e dentro de BEGIN IMMEDIATE: a versão é relida
+    depois de pegar as travas, então só uma thread/worker recria.
+    Não chamar _connect() com _write_lock já tomado (a trava não é reentrante).
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != _VERSAO_ESQUEMA:
+            for tabela in ("processos", "pesados", "estado"):
+                conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+            for comando in _SCHEMA.split(";"):
+                if comando.strip():
+                    conn.execute(comando)
+            conn.execute(f"PRAGMA user_version = {_VERSAO_ESQUEMA}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _versao(row: dict) -> str:
+    return row.get("atualizado_em") or row.get("criado_em") or ""
+
+
+def _json(valor) -> bytes | None:
+    return None if valor is None else orjson.dumps(valor)
+
+
+def _upsert(conn: sqlite3.Connection, rows: list[dict]) -> None:
+    rows = [r for r in rows if r.get("id") is not None]
+    conn.executemany(_UPSERT, [
+        (
+            str(r["id"]),
+            r.get("codigo"),
+            r.get("criado_em"),
+            r.get("atualizado_em"),
+            r.get("status"),
+            r.get("empresa"),
+            _versao(r),
+            orjson.dumps({k: v for k, v in r.items() if k not in PESADAS}),
+        )
+        for r in rows
+    ])
+    conn.executemany(_UPSERT_PESADOS, [
+        (str(r["id"]), _versao(r), *(_json(r.get(c)) for c in PESADAS))
+        for r in rows
+    ])
+
+
+def _estado(conn: sqlite3.Connection, chave: str):
+    row = conn.execute("SELECT valor FROM estado WHERE chave = ?", (chave,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def _gravar_estado(conn: sqlite3.Connection, chave: str, valor) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO estado (chave, valor) VALUES (?, ?)",
+        (chave, orjson.dumps(valor).decode()),
+    )
+
+
+def gravar(rows) -> None:
+    """Write-through: linhas devolvidas por insert/update em processos."""
+    if not REPLICA_ENABLED or not rows:
+        return
+    if isinstance(rows, dict):
+        rows = [rows]
+    try:
+        conn = _connect()
+        with _write_lock:
+            with conn:
+                _upsert(conn, rows)
+    except Exception as e:
+        count_error("database", "replica_gravar")
+        print(f"Erro ao gravar na réplica: {e}")
+
+
+# ============================================================
+# SINCRONIZAÇÃO
+# ============================================================
+
+def _puxar(conn: sqlite3.Connection, coluna: str) -> int:
+    cursor = _estado(conn, f"cursor_{coluna}")
+    total = 0
+    while True:
+        query = supabase.table("processos").select("*")
+        if cursor:
+            query = apos(query, coluna, *cursor)
+        else:
+            # Primeira carga: sem nulos (atualizado_em vazio vem pelo criado_em)
+            query = query.gte(coluna, _INICIO)
+        with stage("replica_pull", errors="database"):
+            linhas = query.order(coluna).order("id").limit(PAGE_SIZE).execute().data or []
+
+        if linhas:
+            with _write_lock, conn:
+                _upsert(conn, linhas)
+                cursor = [linhas[-1][coluna], str(linhas[-1]["id"])]
+                _gravar_estado(conn, f"cursor_{coluna}", cursor)
+            total += len(linhas)
+        if len(linhas) < PAGE_SIZE:
+            return total
+
+
+def sincronizar(completo: bool = False) -> int:
+    """Puxa as linhas novas/alteradas desde o último cursor. Devolve quantas."""
+    global _sincronizado_em
+    conn = _connect()
+    if completo:
+        with _write_lock, conn:
+            conn.execute("DELETE FROM processos")
+            conn.execute("DELETE FROM pesados")
+            conn.execute("DELETE FROM estado")
+
+    inicio = time.time()
+    total = sum(_puxar(conn, coluna) for coluna in CURSORES)
+    # Marca o início: gravações durante o pull entram na próxima rodada
+    _sincronizado_em = inicio
+    set_gauge(
+        "sistemanps_replica_synced_timestamp_seconds",
+        inicio,
+        help_text="Início da última sincronização completa da réplica (epoch)",
+    )
+    inc(
+        "sistemanps_replica_rows_pulled_total",
+        total,
+        help_text="Linhas de processos puxadas para a réplica",
+    )
+    return total
+
+
+def _loop() -> None:
+    while not _parar.is_set():
+        try:
+            sincronizar()
+        except Exception as e:
+            count_error("database", "replica_sync")
+            print(f"Erro ao sincronizar réplica: {e}")
+        _parar.wait(REPLICA_INTERVALO_S)
+
+
+def iniciar() -> None:
+    """Chamado no startup de cada worker (lifespan)."""
+    global _thread
+    if not REPLICA_ENABLED or _thread is not None:
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="replica-sync", daemon=True)
+    _thread.start()
+
+
+def parar() -> None:
+    global _thread
+    _parar.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+# ============================================================
+# LEITURA
+# ============================================================
+
+def fresca() -> bool:
+    return REPLICA_ENABLED and time.time() - _sincronizado_em <= REPLICA_MAX_ATRASO_S
+
+
+def _colunas(colunas: str) -> list[str] | None:
+    """None = todas ("*")."""
+    if colunas.strip() == "*":
+        return None
+    return [c for c in (c.strip() for c in colunas.split(",")) if c]
+
+
+def _projetar(row: dict, colunas: list[str] | None) -> dict:
+    if colunas is None:
+        return row
+    return {c: row.get(c) for c in colunas}
+
+
+def _ler_local(conn: sqlite3.Connection, codigo: str, colunas: list[str] | None) -> dict | None:
+    with stage("replica_select"):
+        row = conn.execute(
+            "SELECT id, linha FROM processos WHERE codigo = ?", (codigo,)
+        ).fetchone()
+        if row is None:
+            return None
+        linha = orjson.loads(row[1])
+        pesadas = [c for c in PESADAS if colunas is None or c in colunas]
+        if pesadas:
+            valores = conn.execute(
+                f"SELECT {', '.join(pesadas)} FROM pesados WHERE id = ?", (row[0],)
+            ).fetchone() or (None,) * len(pesadas)
+            for coluna, valor in zip(pesadas, valores):
+                linha[coluna] = orjson.loads(valor) if valor is not None else None
+    return _projetar(linha, colunas)
+
+
+def _contar(origem: str) -> None:
+    inc(
+        "sistemanps_replica_reads_total",
+        help_text="Leituras de processos pela réplica local ou pelo Supabase",
+        origem=origem,
+    )
+
+
+def processo(codigo: str, colunas: str) -> dict | None:
+    """Colunas do processo pelo código; None se não existe."""
+    if fresca():
+        data = _ler_local(_connect(), codigo, _colunas(colunas))
+        if data is not None:
+            _contar("local")
+            return data
+
+    # Réplica atrasada, ou processo criado por outra instância depois do pull
+    _contar("remoto")
+    with stage("db_select", errors="database"):
+        res = (
+            supabase
+            .table("processos")
+            .select(colunas)
+            .eq("codigo", codigo)
+            .maybe_single()
+            .execute()
+        )
+    return res.data if res is not None else None
+
+
+def listar(colunas: str) -> list[dict]:
+    """Todos os processos, mais recentes primeiro (tela /admin). Só colunas
+    leves: os JSONs pesados não são lidos."""
+    pedidas = _colunas(colunas)
+    if pedidas is None or any(c in PESADAS for c in pedidas):
+        raise ValueError("listar() não traz colunas pesadas")
+    if fresca():
+        _contar("local")
+        with stage("replica_select"):
+            rows = _connect().execute(
+                "SELECT linha FROM processos ORDER BY criado_em DESC"
+            ).fetchall()
+        return [_projetar(orjson.loads(r[0]), pedidas) for r in rows]
+
+    _contar("remoto")
+    with stage("db_select", errors="database"):
+        res = (
+            supabase
+            .table("processos")
+            .select(colunas)
+            .order("criado_em", desc=True)
+            .execute()
+        )
+    if hasattr(res, "error") and res.error:
+        raise RuntimeError(res.error.message)
+    return res.data or []
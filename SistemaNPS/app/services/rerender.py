@@ -0,0 +1,449 @@
+"""
+Regeração em massa dos PDFs de termo e ressalvas.
+
+Depois de uma mudança de layout (pdf_layout.py: logos, rodapé, margens, e
+LAYOUT_VERSION incrementado) os PDFs já gravados continuam com o layout
+antigo. Este job percorre a tabela processos e refaz os PDFs a partir dos
+dados salvos (`termo_dados` + fotos de `imagens_termo`, `ressalvas_dados`):
+
+    leitura paginada  ->  preparo (download das fotos, hash)  ->
+    render (ProcessPool)  ->  upload + update (concorrência limitada,
+    token bucket)
+
+O hash de render é o mesmo das rotas (render_cache): documentos cujo PDF já
+corresponde ao layout atual são pulados, então rodar de novo é seguro. O
+progresso é gravado em um checkpoint (criado_em/id do último processo
+concluído em ordem) e a execução seguinte continua dali.
+
+CLI: scripts/rerender_pdfs.py
+"""
+import base64
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from app.services import archive, render_cache, thumbnails
+from app.services.metrics import count_error, inc, stage
+from app.services.storage import StorageError, path_from_url, storage
+from app.services.supabase_client import apos, supabase
+from app.services.upload import upload_bytes
+
+PAGE_SIZE = 50
+CHECKPOINT_PATH = os.getenv(
+    "RERENDER_CHECKPOINT", os.path.join("data", "rerender_checkpoint.json")
+)
+
+# Ordem das regiões no TermoAceite.html (item 1..6): usada quando o
+# processo é anterior ao registro de `regiao_foto` em imagens_termo.
+REGIOES_FOTO = (
+    "frontal", "traseira", "lateral-esquerda", "lateral-direita", "superior", "inferior"
+)
+
+COLUNAS = (
+    "id,codigo,empresa,nome_cliente,cpf,status_entrega,termo_dados,imagens_termo,"
+    "ressalvas_dados,termo_pdf,pdf_ressalvas,criado_em,atualizado_em"
+)
+
+
+@dataclass
+class Filtros:
+    empresa: str | None = None
+    desde: date | None = None
+    ate: date | None = None  # inclusivo
+    tipos: tuple[str, ...] = ("termo", "ressalvas")
+    limite: int | None = None
+
+
+@dataclass
+class Resultado:
+    processos: int = 0
+    renderizados: int = 0
+    em_dia: int = 0
+    # Salvos de novo (termo/ressalvas atualizar) durante o job: já têm o
+    # PDF no layout atual, o regerado é descartado
+    alterados: int = 0
+    erros: list[str] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def somar(self, campo: str) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def erro(self, mensagem: str) -> None:
+        with self._lock:
+            self.erros.append(mensagem)
+
+
+# ============================================================
+# CONTROLE DE TAXA E CHECKPOINT
+# ============================================================
+
+class TokenBucket:
+    """Limita gravações por segundo (uploads + updates) contra o Supabase."""
+
+    def __init__(self, taxa: float, rajada: int | None = None):
+        self.taxa = taxa
+        self.capacidade = rajada or max(1, int(taxa))
+        self._tokens = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.taxa <= 0:
+            return
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+class Checkpoint:
+    """
+    Processos terminam fora de ordem; o cursor gravado só avança até o
+    último processo cuja sequência anterior inteira já terminou.
+    """
+
+    def __init__(self, path: str | None, filtros: Filtros):
+        self.path = path
+        self.chave_filtros = json.dumps(
+            {
+                "empresa": filtros.empresa,
+                "desde": filtros.desde.isoformat() if filtros.desde else None,
+                "ate": filtros.ate.isoformat() if filtros.ate else None,
+                "tipos": list(filtros.tipos),
+            },
+            sort_keys=True,
+        )
+        self.cursor: tuple[str, str] | None = None
+        self._pendentes: list[tuple[str, str]] = []
+        self._concluidos: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self._gravado_em = 0.0
+
+    def carregar(self) -> tuple[str, str] | None:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            dados = json.load(f)
+        # Checkpoint de outra seleção (filtros diferentes) não vale
+        if dados.get("filtros") != self.chave_filtros:
+            return None
+        self.cursor = tuple(dados["cursor"]) if dados.get("cursor") else None
+        return self.cursor
+
+    def registrar(self, chave: tuple[str, str]) -> None:
+        with self._lock:
+            self._pendentes.append(chave)
+
+    def concluir(self, chave: tuple[str, str]) -> None:
+        with self._lock:
+            self._concluidos.add(chave)
+            while self._pendentes and self._pendentes[0] in self._concluidos:
+                self.cursor = self._pendentes.pop(0)
+                self._concluidos.discard(self.cursor)
+            if time.monotonic() - self._gravado_em > 1.0:
+                self._gravar()
+
+    def finalizar(self) -> None:
+        with self._lock:
+            self._gravar()
+
+    def _gravar(self) -> None:
+        if not self.path:
+            return
+        pasta = os.path.dirname(self.path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"filtros": self.chave_filtros, "cursor": self.cursor}, f)
+        os.replace(tmp, self.path)
+        self._gravado_em = time.monotonic()
+
+
+# ============================================================
+# LEITURA
+# ============================================================
+
+def _paginas(filtros: Filtros, cursor: tuple[str, str] | None):
+    """Paginação por chave (criado_em, id): estável com gravações no meio."""
+    lidos = 0
+    while True:
+        query = supabase.table("processos").select(COLUNAS)
+        if filtros.empresa:
+            query = query.eq("empresa", filtros.empresa)
+        if filtros.desde:
+            query = query.gte("criado_em", filtros.desde.isoformat())
+        if filtros.ate:
+            query = query.lt("criado_em", (filtros.ate + timedelta(days=1)).isoformat())
+        if cursor:
+            query = apos(query, "criado_em", *cursor)
+        with stage("db_select", errors="database"):
+            res = query.order("criado_em").order("id").limit(PAGE_SIZE).execute()
+
+        linhas = res.data or []
+        pagina = linhas if filtros.limite is None else linhas[: filtros.limite - lidos]
+        if pagina:
+            yield pagina
+            lidos += len(pagina)
+            cursor = (pagina[-1].get("criado_em") or "", str(pagina[-1]["id"]))
+        if len(linhas) < PAGE_SIZE or (filtros.limite is not None and lidos >= filtros.limite):
+            return
+
+
+# ============================================================
+# RENDER (processos filhos)
+# ============================================================
+
+def _init_worker() -> None:
+    from app.services.pdf_layout import preload_assets
+
+    preload_assets()
+
+
+def _render_termo(modelo: dict, fotos: list[tuple[dict, bytes | None]]) -> bytes:
+    from app.routers.termo import TermoRequest, gerar_pdf_termo
+    from app.services.photos import DecodedPhoto
+
+    decodificadas = [
+        (img, DecodedPhoto.from_bytes(dados) if dados else None) for img, dados in fotos
+    ]
+    return gerar_pdf_termo(TermoRequest(**modelo), decodificadas).getvalue()
+
+
+def _render_ressalvas(modelo: dict, registrado_em: str | None) -> bytes:
+    from app.routers.ressalvas import RessalvasRequest, decode_fotos, gerar_pdf_ressalvas
+
+    data = RessalvasRequest(**modelo)
+    return gerar_pdf_ressalvas(
+        processo_codigo=data.processo_id,
+        responsavel=data.responsavel,
+        observacoes=data.observacoes,
+        imagens=data.imagens,
+        fotos=decode_fotos(data.imagens),
+        registrado_em=datetime.fromisoformat(registrado_em) if registrado_em else None,
+    ).getvalue()
+
+
+# ============================================================
+# PREPARO (modelo equivalente ao da rota + hash)
+# ============================================================
+
+def _preparar_termo(p: dict):
+    from app.routers.termo import RENDER_HASH_EXCLUDE, TermoRequest
+    from app.services.photos import DecodedPhoto
+
+    fotos = []
+    imagens = []
+    for img in sorted(p.get("imagens_termo") or [], key=lambda i: i.get("item") or 0):
+        path = path_from_url(img.get("url"))
+        item = img.get("item")
+        regiao = img.get("regiao_foto")
+        if not regiao and isinstance(item, int) and 1 <= item <= len(REGIOES_FOTO):
+            regiao = REGIOES_FOTO[item - 1]
+        img_data = {"item": item, "regiao_foto": regiao}
+        try:
+            with stage("download", errors="storage"):
+                dados = storage.get(path) if path else None
+            foto = DecodedPhoto.from_bytes(dados) if dados else None
+        except (StorageError, ValueError):
+            dados, foto = None, None
+        fotos.append((img_data, dados))
+        imagens.append({
+            **img_data,
+            "imagem_base64": (
+                f"data:{foto.mime};base64,{base64.b64encode(foto.data).decode()}" if foto else None
+            ),
+        })
+
+    modelo = {
+        "cpf": p.get("cpf") or "",
+        "nome_cliente": p.get("nome_cliente") or "",
+        "empresa": p.get("empresa"),
+        "status_entrega": p.get("status_entrega") or "",
+        "imagem": "",
+        "imagens": imagens,
+        "termo_dados": p.get("termo_dados"),
+    }
+    digest = render_cache.render_hash("termo", TermoRequest(**modelo), exclude=RENDER_HASH_EXCLUDE)
+    # O processo filho recebe os bytes das fotos, não o base64
+    modelo["imagens"] = [{**i, "imagem_base64": None} for i in imagens]
+    return digest, (_render_termo, modelo, fotos)
+
+
+def _preparar_ressalvas(p: dict):
+    from app.routers.ressalvas import RessalvasRequest
+
+    dados = p["ressalvas_dados"]
+    modelo = {
+        "processo_id": p["codigo"],
+        "responsavel": dados.get("responsavel") or "",
+        "cpf": dados.get("cpf"),
+        "observacoes": dados.get("observacoes"),
+        "imagens": dados.get("itens") or [],
+    }
+    digest = render_cache.render_hash("ressalvas", RessalvasRequest(**modelo))
+    # Mantém a data do relatório original: registros antigos (sem
+    # registrado_em) usam a criação do processo, nunca a data de hoje
+    registrado_em = dados.get("registrado_em") or p.get("criado_em")
+    return digest, (_render_ressalvas, modelo, registrado_em)
+
+
+DOCUMENTOS = {
+    # tipo: (coluna da URL, dados necessários, preparo, pasta)
+    "termo": ("termo_pdf", "termo_dados", _preparar_termo, "termo"),
+    "ressalvas": ("pdf_ressalvas", "ressalvas_dados", _preparar_ressalvas, "ressalvas"),
+}
+
+
+# ============================================================
+# EXECUÇÃO
+# ============================================================
+
+class _Job:
+    def __init__(self, filtros, processos, concorrencia, taxa, dry_run, remover_antigos):
+        self.filtros = filtros
+        self.dry_run = dry_run
+        self.remover_antigos = remover_antigos
+        self.bucket = TokenBucket(taxa)
+        self.resultado = Resultado()
+        # spawn: o job já tem threads (pool de I/O, cliente HTTP) ao criar os filhos
+        self.cpu = ProcessPoolExecutor(
+            max_workers=processos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self.io = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="rerender")
+        # Janela de processos em andamento (fotos e PDFs ficam em memória)
+        self.janela = threading.BoundedSemaphore(concorrencia * 2)
+
+    def documento(self, p: dict, tipo: str) -> None:
+        coluna, dados, preparar, pasta = DOCUMENTOS[tipo]
+        if not p.get(dados) or not p.get(coluna):
+            return
+
+        archive.rehydrate(p, (dados,))
+        digest, (render, *args) = preparar(p)
+        if render_cache.is_current(p.get(coluna), digest):
+            self.resultado.somar("em_dia")
+            return
+        if self.dry_run:
+            self.resultado.somar("renderizados")
+            return
+
+        with stage("render"):
+            pdf = self.cpu.submit(render, *args).result()
+
+        self.bucket.acquire()
+        url = upload_bytes(pdf, render_cache.pdf_path(f"{p['id']}/{pasta}", digest), upsert=True)
+        atualizado_em = datetime.utcnow().isoformat()
+        # Só grava se o processo não mudou desde a leitura (como archive.py):
+        # um salvar no meio do caminho não pode perder o PDF mais novo
+        query = supabase.table("processos").update({
+            coluna: url,
+            "atualizado_em": atualizado_em,
+        }).eq("id", p["id"])
+        if p.get("atualizado_em"):
+            query = query.eq("atualizado_em", p["atualizado_em"])
+        else:
+            query = query.is_("atualizado_em", "null")
+        with stage("db_update", errors="database"):
+            res = query.execute()
+
+        if not res.data:
+            self._descartar(p, coluna, url)
+            return
+        # O próximo documento do mesmo processo compara com o valor gravado aqui
+        p["atualizado_em"] = atualizado_em
+        thumbnails.gerar(url, pdf)
+
+        antigo = path_from_url(p.get(coluna))
+        if self.remover_antigos and antigo and antigo != path_from_url(url):
+            try:
+                storage.delete([antigo, thumbnails.thumb_path(antigo)])
+            except StorageError as e:
+                print(f"Aviso: não foi possível remover {antigo}: {e}")
+
+        self.resultado.somar("renderizados")
+        inc(
+            "sistemanps_rerender_total",
+            help_text="PDFs regerados pelo job de re-render",
+            tipo=tipo,
+        )
+
+    def _descartar(self, p: dict, coluna: str, url: str) -> None:
+        """Processo alterado durante o render: apaga o upload órfão, a menos
+        que o salvar concorrente tenha gravado o mesmo arquivo (mesmo hash)."""
+        self.resultado.somar("alterados")
+        with stage("db_select", errors="database"):
+            atual = (
+                supabase.table("processos").select(coluna).eq("id", p["id"])
+                .maybe_single().execute()
+            )
+        atual = (atual.data or {}).get(coluna) if atual is not None else None
+        orfao = path_from_url(url)
+        if orfao and orfao != path_from_url(atual):
+            try:
+                storage.delete([orfao])
+            except StorageError as e:
+                print(f"Aviso: não foi possível remover {orfao}: {e}")
+
+    def processo(self, p: dict, checkpoint: Checkpoint) -> None:
+        chave = (p.get("criado_em") or "", str(p["id"]))
+        try:
+            for tipo in self.filtros.tipos:
+                try:
+                    self.documento(p, tipo)
+                except Exception as e:
+                    count_error("rerender", tipo)
+                    self.resultado.erro(f"{p.get('codigo')} ({tipo}): {e}")
+            self.resultado.somar("processos")
+        finally:
+            checkpoint.concluir(chave)
+            self.janela.release()
+
+    def executar(self, checkpoint: Checkpoint, progresso=None) -> Resultado:
+        try:
+            for pagina in _paginas(self.filtros, checkpoint.carregar()):
+                for p in pagina:
+                    self.janela.acquire()
+                    checkpoint.registrar((p.get("criado_em") or "", str(p["id"])))
+                    self.io.submit(self.processo, p, checkpoint)
+                if progresso:
+                    progresso(self.resultado)
+            self.io.shutdown(wait=True)
+        finally:
+            self.io.shutdown(wait=True, cancel_futures=True)
+            self.cpu.shutdown(wait=True)
+            checkpoint.finalizar()
+        return self.resultado
+
+
+def executar(
+    filtros: Filtros | None = None,
+    processos: int | None = None,
+    concorrencia: int = 4,
+    taxa: float = 5.0,
+    checkpoint_path: str | None = CHECKPOINT_PATH,
+    dry_run: bool = False,
+    remover_antigos: bool = False,
+    progresso=None,
+) -> Resultado:
+    """
+    processos: tamanho do pool de render (padrão: núcleos da máquina).
+    concorrencia: uploads/updates simultâneos. taxa: gravações por segundo.
+    """
+    filtros = filtros or Filtros()
+    job = _Job(filtros, processos or os.cpu_count() or 2, concorrencia, taxa, dry_run, remover_antigos)
+    return job.executar(Checkpoint(None if dry_run else checkpoint_path, filtros), progresso)
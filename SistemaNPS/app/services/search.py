@@ -0,0 +1,389 @@
+"""
+Busca textual nos comentários do NPS e nas descrições de ressalvas.
+
+Índice local SQLite FTS5 (um arquivo por instância, SEARCH_DB_PATH). Cada
+trecho de texto livre vira um documento: feedback do NPS (`nps_dados.feedback`),
+observações e descrições dos itens de ressalva. O texto indexado passa por
+um stemmer leve de português (com remoção de acentos), aplicado também à
+consulta, então "arranhões", "arranhão" e "arranhado" se encontram.
+
+As rotas de gravação atualizam o índice do processo salvo; `reindexar()`
+(ou scripts/reindexar_busca.py) reconstrói tudo a partir do banco, página a
+página e sem apagar o índice antes. Um índice novo é construído em segundo
+plano (`garantir_indice()`, no startup); até lá a busca responde com o que
+já foi indexado. POST /api/busca/reindexar exige SEARCH_REINDEX_TOKEN.
+"""
+import hmac
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from app.services import archive
+from app.services.metrics import count_error, stage
+from app.services.supabase_client import supabase
+
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join("data", "search.sqlite3"))
+# ressalvas_dados carrega as fotos em base64: páginas menores na reindexação
+PAGE_SIZE = 200
+SEARCH_REINDEX_TOKEN = os.getenv("SEARCH_REINDEX_TOKEN", "")
+# Reserva de uma reindexação (entre workers) expira depois disso
+REINDEX_RESERVA_S = 3600
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Plural: normalizado para o singular antes de remover sufixos
+_PLURAIS = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m"))
+
+# Sufixos removidos (o mais longo primeiro), mantendo radical com 3+ letras.
+# Cobre gênero, diminutivo, particípio e derivações comuns.
+_SUFIXOS = sorted(
+    (
+        "amento", "imento", "mente", "acao", "icao", "idade", "eza",
+        "zinho", "zinha", "inho", "inha", "ada", "ida", "ado", "ido",
+        "ando", "endo", "indo", "ar", "er", "ir", "ao", "a", "o", "e",
+    ),
+    key=len,
+    reverse=True,
+)
+_RADICAL_MIN = 3
+
+# Palavras ignoradas na consulta (o AND entre termos ficaria restritivo demais)
+_STOPWORDS = frozenset(
+    "a o e as os de da do das dos em no na nos nas com para por um uma que ou se ao".split()
+)
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_reindexando = threading.Lock()
+
+
+# ============================================================
+# NORMALIZAÇÃO
+# ============================================================
+
+def fold(texto: str) -> str:
+    """Minúsculas sem acentos."""
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(ch for ch in decomposto if not unicodedata.combining(ch))
+
+
+def stem(token: str) -> str:
+    token = fold(token)
+    if len(token) <= _RADICAL_MIN or token.isdigit():
+        return token
+    for plural, singular in _PLURAIS:
+        if token.endswith(plural):
+            token = token[: -len(plural)] + singular
+            break
+    else:
+        if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+            token = token[:-1]
+    for sufixo in _SUFIXOS:
+        if token.endswith(sufixo) and len(token) - len(sufixo) >= _RADICAL_MIN:
+            return token[: -len(sufixo)]
+    return token
+
+
+def termos(texto: str) -> list[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(texto or "")]
+
+
+# ============================================================
+# ARMAZENAMENTO
+# ============================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT NOT NULL,
+    fonte TEXT NOT NULL,
+    campo TEXT,
+    texto TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documentos_codigo_fonte ON documentos (codigo, fonte);
+CREATE VIRTUAL TABLE IF NOT EXISTS documentos_fts USING fts5(
+    termos,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS estado (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS indexados (
+    codigo TEXT PRIMARY KEY,
+    em REAL NOT NULL
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        pasta = os.path.dirname(SEARCH_DB_PATH)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(SEARCH_DB_PATH, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _documentos_nps(nps_dados: dict | None) -> list[tuple[str, str]]:
+    feedback = (nps_dados or {}).get("feedback") or {}
+    return [(str(campo), str(texto)) for campo, texto in feedback.items() if texto]
+
+
+def _documentos_ressalvas(ressalvas_dados: dict | None) -> list[tuple[str, str]]:
+    dados = ressalvas_dados or {}
+    docs = []
+    if dados.get("observacoes"):
+        docs.append(("observacoes", str(dados["observacoes"])))
+    for item in dados.get("itens") or []:
+        if item.get("descricao"):
+            docs.append((str(item.get("item") or "item"), str(item["descricao"])))
+    return docs
+
+
+def _substituir(conn: sqlite3.Connection, codigo: str, fonte: str, docs: list[tuple[str, str]]) -> None:
+    antigos = [
+        r[0] for r in conn.execute(
+            "SELECT id FROM documentos WHERE codigo = ? AND fonte = ?", (codigo, fonte)
+        )
+    ]
+    if antigos:
+        marcadores = ",".join("?" * len(antigos))
+        conn.execute(f"DELETE FROM documentos_fts WHERE rowid IN ({marcadores})", antigos)
+        conn.execute(f"DELETE FROM documentos WHERE id IN ({marcadores})", antigos)
+    for campo, texto in docs:
+        cur = conn.execute(
+            "INSERT INTO documentos (codigo, fonte, campo, texto) VALUES (?, ?, ?, ?)",
+            (codigo, fonte, campo, texto),
+        )
+        conn.execute(
+            "INSERT INTO documentos_fts (rowid, termos) VALUES (?, ?)",
+            (cur.lastrowid, " ".join(termos(f"{campo} {texto}"))),
+        )
+
+
+def _marcar(conn: sqlite3.Connection, codigo: str, em: float) -> None:
+    conn.execute("INSERT OR REPLACE INTO indexados (codigo, em) VALUES (?, ?)", (codigo, em))
+
+
+def indexar_processo(
+    codigo: str,
+    nps_dados: dict | None = None,
+    ressalvas_dados: dict | None = None,
+) -> None:
+    """
+    Atualiza os documentos do processo. Só as fontes informadas são
+    substituídas (a rota de NPS não apaga o que veio das ressalvas).
+    Falhas são contadas e registradas, sem derrubar a gravação.
+    """
+    try:
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                if nps_dados is not None:
+                    _substituir(conn, codigo, "nps", _documentos_nps(nps_dados))
+                if ressalvas_dados is not None:
+                    _substituir(conn, codigo, "ressalvas", _documentos_ressalvas(ressalvas_dados))
+                _marcar(conn, codigo, time.time())
+    except Exception as e:
+        count_error("search", "indexar")
+        print(f"Erro ao indexar processo {codigo}: {e}")
+
+
+def reindexar(progresso=None) -> int:
+    """
+    Reconstrói o índice a partir da tabela processos, uma página por vez.
+
+    Cada processo lido substitui os próprios documentos, a menos que uma
+    rota de gravação o tenha indexado depois da leitura da página (o dado
+    da página seria mais velho). No fim saem os documentos de processos
+    que não existem mais no banco.
+    """
+    comeco = time.time()
+    total = 0
+    ultimo = None
+    while True:
+        lido_em = time.time()
+        # Paginação por id: um processo pulado entre páginas seria tirado
+        # do índice como removido no fim da passada
+        query = supabase.table("processos").select("id,codigo,nps_dados,ressalvas_dados")
+        if ultimo is not None:
+            query = query.gt("id", ultimo)
+        with stage("db_select", errors="database"):
+            res = query.order("id").limit(PAGE_SIZE).execute()
+        pagina = archive.rehydrate_rows(res.data or [], ("nps_dados", "ressalvas_dados"))
+
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                for p in pagina:
+                    codigo = p.get("codigo")
+                    if not codigo:
+                        continue
+                    marca = conn.execute(
+                        "SELECT em FROM indexados WHERE codigo = ?", (codigo,)
+                    ).fetchone()
+                    if marca and marca[0] > lido_em:
+                        continue
+                    _substituir(conn, codigo, "nps", _documentos_nps(p.get("nps_dados")))
+                    _substituir(conn, codigo, "ressalvas", _documentos_ressalvas(p.get("ressalvas_dados")))
+                    _marcar(conn, codigo, lido_em)
+
+        total += len(pagina)
+        if progresso:
+            progresso(total)
+        if len(pagina) < PAGE_SIZE:
+            break
+        ultimo = pagina[-1]["id"]
+
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            # Não vistos nesta passada nem gravados durante ela: removidos do banco
+            removidos = "SELECT codigo FROM indexados WHERE em >= ?"
+            conn.execute(
+                "DELETE FROM documentos_fts WHERE rowid IN "
+                f"(SELECT id FROM documentos WHERE codigo NOT IN ({removidos}))",
+                (comeco,),
+            )
+            conn.execute(f"DELETE FROM documentos WHERE codigo NOT IN ({removidos})", (comeco,))
+            conn.execute("DELETE FROM indexados WHERE em < ?", (comeco,))
+            conn.execute(
+                "INSERT OR REPLACE INTO estado (chave, valor) VALUES ('indexado_em', ?)",
+                (str(time.time()),),
+            )
+            conn.execute("INSERT INTO documentos_fts (documentos_fts) VALUES ('optimize')")
+    return total
+
+
+def _reservar(conn: sqlite3.Connection) -> bool:
+    # Entre workers (mesmo arquivo): só um reindexa por vez
+    with _write_lock, conn:
+        conn.execute(
+            "DELETE FROM estado WHERE chave = 'reindexando_desde' AND CAST(valor AS REAL) < ?",
+            (time.time() - REINDEX_RESERVA_S,),
+        )
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO estado (chave, valor) VALUES ('reindexando_desde', ?)",
+            (str(time.time()),),
+        )
+    return cur.rowcount == 1
+
+
+def _liberar() -> None:
+    conn = _connect()
+    with _write_lock, conn:
+        conn.execute("DELETE FROM estado WHERE chave = 'reindexando_desde'")
+
+
+def iniciar_reindexacao() -> bool:
+    """Reindexa em uma thread. False se já há uma reindexação em andamento."""
+    if not _reindexando.acquire(blocking=False):
+        return False
+    try:
+        reservado = _reservar(_connect())
+    except Exception:
+        _reindexando.release()
+        raise
+    if not reservado:
+        _reindexando.release()
+        return False
+
+    def executar():
+        try:
+            reindexar()
+        except Exception as e:
+            count_error("search", "reindexar")
+            print(f"Erro ao reindexar a busca: {e}")
+        finally:
+            try:
+                _liberar()
+            finally:
+                _reindexando.release()
+
+    threading.Thread(target=executar, name="search-reindex", daemon=True).start()
+    return True
+
+
+def indice_pronto() -> bool:
+    return _connect().execute(
+        "SELECT 1 FROM estado WHERE chave = 'indexado_em'"
+    ).fetchone() is not None
+
+
+def garantir_indice() -> None:
+    """Índice nunca construído (arquivo novo): constrói em segundo plano."""
+    try:
+        if not indice_pronto():
+            iniciar_reindexacao()
+    except Exception as e:
+        count_error("search", "reindexar")
+        print(f"Erro ao iniciar a indexação da busca: {e}")
+
+
+def token_valido(valor: str | None) -> bool:
+    return bool(SEARCH_REINDEX_TOKEN) and bool(valor) and hmac.compare_digest(valor, SEARCH_REINDEX_TOKEN)
+
+
+# ============================================================
+# BUSCA
+# ============================================================
+
+def _trecho(texto: str, radicais: set[str], largura: int = 160) -> tuple[str, list[str]]:
+    palavras = [
+        m for m in _TOKEN_RE.finditer(texto)
+        if any(stem(m.group()).startswith(r) for r in radicais)
+    ]
+    if not palavras:
+        return texto[:largura], []
+    inicio = max(0, palavras[0].start() - largura // 3)
+    fim = min(len(texto), inicio + largura)
+    trecho = ("…" if inicio else "") + texto[inicio:fim] + ("…" if fim < len(texto) else "")
+    return trecho, sorted({m.group() for m in palavras})
+
+
+def buscar(consulta: str, fonte: str | None = None, limite: int = 20) -> list[dict]:
+    radicais = [
+        stem(t) for t in _TOKEN_RE.findall(consulta or "")
+        if fold(t) not in _STOPWORDS
+    ]
+    if not radicais:
+        return []
+
+    # Todos os termos (E), cada um como prefixo do radical
+    match = " ".join(f'"{r}"*' for r in radicais)
+    sql = (
+        "SELECT d.codigo, d.fonte, d.campo, d.texto, bm25(documentos_fts) AS score "
+        "FROM documentos_fts JOIN documentos d ON d.id = documentos_fts.rowid "
+        "WHERE documentos_fts MATCH ?"
+    )
+    params: list = [match]
+    if fonte:
+        sql += " AND d.fonte = ?"
+        params.append(fonte)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limite)
+
+    with stage("busca"):
+        rows = _connect().execute(sql, params).fetchall()
+
+    resultados = []
+    for codigo, fonte_doc, campo, texto, score in rows:
+        trecho, encontrados = _trecho(texto, set(radicais))
+        resultados.append({
+            "codigo": codigo,
+            "fonte": fonte_doc,
+            "campo": campo,
+            "trecho": trecho,
+            "termos": encontrados,
+            "score": round(-score, 6),
+        })
+    return resultados
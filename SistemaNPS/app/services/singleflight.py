@@ -0,0 +1,70 @@
+"""
+Single-flight: chamadas simultâneas com a mesma chave compartilham uma
+única execução.
+
+A primeira chamada (líder) executa a função; as que chegam enquanto ela
+está em andamento (seguidoras) esperam e recebem o mesmo resultado, ou a
+mesma exceção. Terminada a execução a chave sai do grupo: não é cache, a
+próxima chamada executa de novo.
+
+Uso (rotas síncronas, threadpool):
+
+    _downloads = Group("download_pdf")
+    data = _downloads.do(path, lambda: storage.get(path))
+"""
+import threading
+from typing import Callable, TypeVar
+
+from app.services.metrics import inc
+
+T = TypeVar("T")
+
+
+class _Chamada:
+    __slots__ = ("pronto", "resultado", "erro", "seguidores")
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro: BaseException | None = None
+        self.seguidores = 0
+
+
+class Group:
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self._em_andamento: dict[str, _Chamada] = {}
+
+    def do(self, chave: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _Chamada()
+            else:
+                chamada.seguidores += 1
+
+        inc(
+            "sistemanps_singleflight_total",
+            help_text="Chamadas single-flight por papel (lider executa, seguidor reaproveita)",
+            grupo=self.nome,
+            papel="lider" if lider else "seguidor",
+        )
+
+        if not lider:
+            chamada.pronto.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = fn()
+            return chamada.resultado
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.pronto.set()
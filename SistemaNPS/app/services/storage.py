@@ -0,0 +1,269 @@
+"""
+Armazenamento de arquivos (PDFs, fotos, miniaturas) do bucket "processos".
+
+Dois backends com a mesma interface (put/get/stream/exists/delete/list),
+escolhidos por STORAGE_BACKEND:
+
+    supabase (padrão)  Supabase Storage, pelo cliente compartilhado
+    local              sistema de arquivos em STORAGE_LOCAL_DIR/<bucket>;
+                       gravação atômica (arquivo temporário + rename) e
+                       leitura por mmap. Os arquivos são servidos pela rota
+                       /arquivos/{path} (sem salto de rede em instalações
+                       de um nó só, e testes rodando offline).
+
+Os paths são relativos ao bucket ("<uuid>/termo/<hash>.pdf"). O banco
+guarda a URL pública; `path_from_url` faz o caminho inverso para URLs de
+qualquer um dos backends.
+"""
+import mimetypes
+import mmap
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Iterator
+
+from app.services.metrics import set_gauge
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "processos")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", os.path.join("data", "storage"))
+LOCAL_URL_PREFIX = "/arquivos/"
+
+SUPABASE_MARKER = f"/storage/v1/object/public/{STORAGE_BUCKET}/"
+CHUNK_SIZE = 256 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class ObjectNotFound(StorageError):
+    pass
+
+
+def path_from_url(public_url: str | None) -> str | None:
+    """Path no bucket a partir da URL pública (Supabase ou local)."""
+    if not public_url:
+        return None
+    url = public_url.split("?", 1)[0]
+    for marker in (SUPABASE_MARKER, LOCAL_URL_PREFIX):
+        if marker in url:
+            return url.split(marker, 1)[1]
+    if url.startswith(f"{STORAGE_BUCKET}/"):
+        return url.split("/", 1)[1]
+    return None
+
+
+def content_type_for(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def _as_bytes(data: bytes | BinaryIO) -> bytes:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    return data.read()
+
+
+# ============================================================
+# SUPABASE
+# ============================================================
+
+class SupabaseStorage:
+    name = "supabase"
+
+    def __init__(self, bucket: str = STORAGE_BUCKET):
+        self.bucket = bucket
+
+    def _bucket(self):
+        from app.services.supabase_client import supabase
+
+        return supabase.storage.from_(self.bucket)
+
+    @staticmethod
+    def _raise(e: Exception, path: str):
+        status = str(getattr(e, "status", "") or getattr(e, "code", ""))
+        mensagem = str(getattr(e, "message", "") or e)
+        if status == "404" or "not found" in mensagem.lower():
+            raise ObjectNotFound(path) from e
+        raise StorageError(mensagem) from e
+
+    def put(self, path: str, data: bytes | BinaryIO, content_type: str, upsert: bool = False) -> None:
+        try:
+            res = self._bucket().upload(
+                path,
+                _as_bytes(data),
+                file_options={
+                    "content-type": content_type,
+                    "upsert": "true" if upsert else "false"
+                }
+            )
+        except Exception as e:
+            self._raise(e, path)
+        if hasattr(res, "error") and res.error:
+            raise StorageError(res.error.message)
+        if isinstance(res, dict) and res.get("error"):
+            raise StorageError(res.get("error"))
+
+    def get(self, path: str) -> bytes:
+        try:
+            res = self._bucket().download(path)
+        except Exception as e:
+            self._raise(e, path)
+        if hasattr(res, "error") and res.error:
+            raise StorageError(res.error.message)
+        return res
+
+    def stream(self, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        # storage3 não expõe download em streaming: baixa e fatia
+        data = self.get(path)
+        for inicio in range(0, len(data), chunk_size):
+            yield data[inicio:inicio + chunk_size]
+
+    def exists(self, path: str) -> bool:
+        try:
+            return bool(self._bucket().exists(path))
+        except Exception as e:
+            self._raise(e, path)
+
+    def delete(self, paths: list[str]) -> None:
+        if paths:
+            try:
+                self._bucket().remove(list(paths))
+            except Exception as e:
+                self._raise(e, paths[0])
+
+    def list(self, prefix: str = "") -> list[str]:
+        try:
+            return [item["name"] for item in self._bucket().list(prefix)]
+        except Exception as e:
+            self._raise(e, prefix)
+
+    def public_url(self, path: str) -> str:
+        return self._bucket().get_public_url(path)
+
+
+# ============================================================
+# LOCAL
+# ============================================================
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_DIR, bucket: str = STORAGE_BUCKET):
+        self.root = os.path.abspath(os.path.join(root, bucket))
+
+    def _full(self, path: str) -> str:
+        full = os.path.abspath(os.path.join(self.root, path.lstrip("/")))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise StorageError(f"Path fora do bucket: {path}")
+        return full
+
+    def put(self, path: str, data: bytes | BinaryIO, content_type: str, upsert: bool = False) -> None:
+        destino = self._full(path)
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+
+        # Temporário na mesma pasta: o rename é atômico e leitores nunca
+        # veem um arquivo pela metade.
+        fd, tmp = tempfile.mkstemp(dir=pasta, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    while bloco := data.read(CHUNK_SIZE):
+                        f.write(bloco)
+                f.flush()
+                os.fsync(f.fileno())
+            if upsert:
+                os.replace(tmp, destino)
+            else:
+                # link() falha se o destino já existe (mesma semântica do Supabase)
+                try:
+                    os.link(tmp, destino)
+                except FileExistsError:
+                    raise StorageError("The resource already exists")
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def _open(self, path: str):
+        try:
+            return open(self._full(path), "rb")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+            raise ObjectNotFound(path) from e
+
+    def get(self, path: str) -> bytes:
+        with self._open(path) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:]
+
+    def stream(self, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        f = self._open(path)
+
+        def chunks():
+            with f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for inicio in range(0, len(mm), chunk_size):
+                        yield mm[inicio:inicio + chunk_size]
+
+        return chunks()
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(self._full(path))
+
+    def delete(self, paths: list[str]) -> None:
+        for path in paths:
+            try:
+                os.unlink(self._full(path))
+            except FileNotFoundError:
+                pass
+
+    def list(self, prefix: str = "") -> list[str]:
+        pasta = self._full(prefix) if prefix else self.root
+        try:
+            return sorted(n for n in os.listdir(pasta) if not n.startswith(".tmp-"))
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    def public_url(self, path: str) -> str:
+        return f"{LOCAL_URL_PREFIX}{path}"
+
+
+# ============================================================
+# INSTÂNCIA
+# ============================================================
+
+_BACKENDS = {"supabase": SupabaseStorage, "local": LocalStorage}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_storage():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND not in _BACKENDS:
+                    raise RuntimeError(f"STORAGE_BACKEND inválido: {STORAGE_BACKEND}")
+                _backend = _BACKENDS[STORAGE_BACKEND]()
+                set_gauge(
+                    "sistemanps_storage_backend_info",
+                    1,
+                    help_text="Backend de storage ativo",
+                    backend=_backend.name,
+                )
+    return _backend
+
+
+class _LazyStorage:
+    def __getattr__(self, name):
+        return getattr(get_storage(), name)
+
+
+storage = _LazyStorage()
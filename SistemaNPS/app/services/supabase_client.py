@@ -1,16 +1,80 @@
 import os
+import threading
 from dotenv import load_dotenv
-from supabase import create_client
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Variáveis SUPABASE não configuradas")
+# "supabase" (padrão) ou "fake" (em memória, para testes de carga/offline)
+SUPABASE_BACKEND = os.getenv("SUPABASE_BACKEND", "supabase").lower()
 
-supabase = create_client(
-    SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
-)
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_client():
+    if SUPABASE_BACKEND == "fake":
+        from app.services.fake_supabase import FakeSupabase
+
+        return FakeSupabase.from_env()
+
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("Variáveis SUPABASE não configuradas")
+
+    # Import pesado (httpx, postgrest, storage3...): só na primeira chamada
+    from supabase import create_client
+    from supabase.lib.client_options import SyncClientOptions
+
+    from app.services import http
+
+    # Tabelas e storage usam o pool HTTP/2 compartilhado do worker
+    return create_client(
+        SUPABASE_URL,
+        SUPABASE_SERVICE_ROLE_KEY,
+        options=SyncClientOptions(httpx_client=http.get_client()),
+    )
+
+
+def get_supabase():
+    """
+    Retorna o cliente, criando-o na primeira chamada. Credenciais ausentes
+    só falham aqui (na primeira requisição), não na importação do app.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+class _LazySupabase:
+    """Mantém `supabase.table(...)` / `supabase.storage` nos routers."""
+
+    def __getattr__(self, name):
+        return getattr(get_supabase(), name)
+
+
+supabase = _LazySupabase()
+
+
+# ============================================================
+# PAGINAÇÃO POR CHAVE
+# ============================================================
+
+def _literal(valor) -> str:
+    # Entre aspas: timestamps têm ":" e "+", reservados no filtro or=
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
+
+def apos(query, coluna: str, valor, ultimo_id):
+    """
+    Linhas depois de (valor, ultimo_id) na ordem (coluna, id). O desempate
+    por id vai na própria consulta: com mais de uma página de linhas no
+    mesmo `valor` a paginação continua avançando.
+    """
+    v, i = _literal(valor), _literal(ultimo_id)
+    return query.or_(f"{coluna}.gt.{v},and({coluna}.eq.{v},id.gt.{i})")
@@ -0,0 +1,112 @@
+"""
+Quebra de linhas compartilhada pelos renderizadores de PDF.
+
+As larguras são medidas por palavra (cache por fonte, em tamanho 1) e
+somadas, então o custo é linear no tamanho do texto. Respeita quebras de
+linha explícitas e parte palavras maiores que a largura disponível.
+"""
+from functools import lru_cache
+from typing import NamedTuple
+
+from app.services.pdf_layout import content_bottom, new_page
+
+
+class LineBox(NamedTuple):
+    text: str
+    width: float
+
+
+@lru_cache(maxsize=65536)
+def _unit_width(text: str, font_name: str) -> float:
+    # Largura em tamanho 1: escala linearmente com o tamanho da fonte
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    return stringWidth(text, font_name, 1)
+
+
+def string_width(text: str, font_name: str, font_size: float) -> float:
+    return _unit_width(text, font_name) * font_size
+
+
+def _split_long_word(word: str, max_width: float, font_name: str, font_size: float) -> list[LineBox]:
+    pieces: list[LineBox] = []
+    current = ""
+    current_w = 0.0
+    for ch in word:
+        ch_w = string_width(ch, font_name, font_size)
+        if current and current_w + ch_w > max_width:
+            pieces.append(LineBox(current, current_w))
+            current, current_w = "", 0.0
+        current += ch
+        current_w += ch_w
+    if current:
+        pieces.append(LineBox(current, current_w))
+    return pieces
+
+
+def wrap(text, max_width: float, font_name: str, font_size: float) -> list[LineBox]:
+    """Quebra `text` em linhas que cabem em `max_width`. Nunca retorna lista vazia."""
+    if text is None or text == "":
+        return [LineBox("", 0.0)]
+
+    space_w = string_width(" ", font_name, font_size)
+    lines: list[LineBox] = []
+
+    for paragraph in str(text).replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        words = paragraph.split()
+        if not words:
+            lines.append(LineBox("", 0.0))
+            continue
+
+        current: list[str] = []
+        current_w = 0.0
+        for word in words:
+            word_w = string_width(word, font_name, font_size)
+
+            if word_w > max_width:
+                if current:
+                    lines.append(LineBox(" ".join(current), current_w))
+                    current, current_w = [], 0.0
+                pieces = _split_long_word(word, max_width, font_name, font_size)
+                lines.extend(pieces[:-1])
+                current, current_w = [pieces[-1].text], pieces[-1].width
+                continue
+
+            if not current:
+                current, current_w = [word], word_w
+            elif current_w + space_w + word_w <= max_width:
+                current.append(word)
+                current_w += space_w + word_w
+            else:
+                lines.append(LineBox(" ".join(current), current_w))
+                current, current_w = [word], word_w
+
+        if current:
+            lines.append(LineBox(" ".join(current), current_w))
+
+    return lines
+
+
+def draw_lines(
+    c,
+    x: float,
+    y: float,
+    lines: list[LineBox],
+    font_name: str,
+    font_size: float,
+    line_height: float,
+    page_size: tuple[float, float],
+) -> float:
+    """
+    Desenha as linhas a partir de `y`, abrindo nova página (com cabeçalho e
+    rodapé) quando o texto alcança a margem inferior. Retorna o novo `y`.
+    """
+    width, height = page_size
+    c.setFont(font_name, font_size)
+    for line in lines:
+        if y < content_bottom():
+            y = new_page(c, width, height)
+            c.setFont(font_name, font_size)
+        c.drawString(x, y, line.text)
+        y -= line_height
+    return y
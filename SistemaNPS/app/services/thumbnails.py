@@ -0,0 +1,122 @@
+"""
+Miniaturas para a listagem do admin.
+
+Cada PDF (primeira página, via pypdfium2) e cada foto do termo ganham uma
+miniatura WebP gravada ao lado do original: `<path original>.thumb.webp`.
+São geradas em segundo plano (BackgroundTasks) depois das gravações e, para
+registros antigos, sob demanda na primeira vez que a rota /thumb é pedida.
+Os paths do storage levam uuid ou hash, então as miniaturas são imutáveis.
+"""
+import threading
+from io import BytesIO
+
+from app.services.metrics import count_error, stage
+from app.services.storage import StorageError, path_from_url, storage
+from app.services.upload import upload_bytes
+
+THUMB_SUFFIX = ".thumb.webp"
+PDF_THUMB_WIDTH = 240
+PHOTO_THUMB_SIZE = (240, 240)
+THUMB_QUALITY = 70
+
+# O PDFium não é thread-safe: toda abertura, render e fechamento de
+# PdfDocument no processo passa por esta trava (miniaturas em segundo plano,
+# /thumb sob demanda, prévias, re-render).
+pdfium_lock = threading.Lock()
+
+
+def thumb_path(path: str) -> str:
+    return f"{path}{THUMB_SUFFIX}"
+
+
+def thumb_url(public_url: str | None) -> str | None:
+    """URL da rota /thumb para o original (None se não for do storage)."""
+    path = path_from_url(public_url)
+    return f"/thumb/{thumb_path(path)}" if path else None
+
+
+# ============================================================
+# RENDER
+# ============================================================
+
+def _to_webp(image) -> bytes:
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    saida = BytesIO()
+    image.save(saida, "WEBP", quality=THUMB_QUALITY, method=4)
+    return saida.getvalue()
+
+
+def render_pdf_page(pdf_bytes: bytes, largura: int):
+    """Primeira página do PDF como imagem PIL com a largura pedida."""
+    import pypdfium2 as pdfium
+
+    with pdfium_lock:
+        doc = pdfium.PdfDocument(pdf_bytes)
+        try:
+            page = doc[0]
+            scale = largura / page.get_width()
+            bitmap = page.render(scale=scale)
+            # Cópia: a imagem não pode apontar para o buffer do PDFium
+            image = bitmap.to_pil().copy()
+            bitmap.close()
+            page.close()
+        finally:
+            doc.close()
+    return image
+
+
+def render_pdf_thumb(pdf_bytes: bytes) -> bytes:
+    return _to_webp(render_pdf_page(pdf_bytes, PDF_THUMB_WIDTH))
+
+
+def render_photo_thumb(data: bytes) -> bytes:
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    # JPEG: decodifica já reduzido (bem mais rápido que reduzir depois)
+    image.draft("RGB", PHOTO_THUMB_SIZE)
+    image.thumbnail(PHOTO_THUMB_SIZE)
+    return _to_webp(image)
+
+
+def render_thumb(path: str, data: bytes) -> bytes:
+    if path.lower().endswith(".pdf"):
+        return render_pdf_thumb(data)
+    return render_photo_thumb(data)
+
+
+# ============================================================
+# GRAVAÇÃO
+# ============================================================
+
+def _salvar(path: str, data: bytes) -> bytes | None:
+    try:
+        with stage("thumbnail"):
+            thumb = render_thumb(path, data)
+        upload_bytes(thumb, thumb_path(path), content_type="image/webp", upsert=True)
+        return thumb
+    except Exception as e:
+        count_error("thumbnail", "gerar")
+        print(f"Erro ao gerar miniatura de {path}: {e}")
+        return None
+
+
+def gerar(public_url: str | None, data: bytes) -> None:
+    """Tarefa de segundo plano: miniatura de um PDF ou foto recém-enviado."""
+    path = path_from_url(public_url)
+    if path:
+        _salvar(path, data)
+
+
+def gerar_sob_demanda(path_thumb: str) -> bytes | None:
+    """Baixa o original e gera a miniatura que ainda não existe."""
+    if not path_thumb.endswith(THUMB_SUFFIX):
+        return None
+    original = path_thumb[: -len(THUMB_SUFFIX)]
+    try:
+        with stage("download", errors="storage"):
+            data = storage.get(original)
+    except StorageError:
+        return None
+    return _salvar(original, data)
@@ -0,0 +1,133 @@
+/*
+ * Envio dos formulários (termo, ressalvas, NPS).
+ *
+ * O servidor responde 503 + Retry-After quando a fila de geração de PDFs
+ * está cheia (app/services/admission.py). Nesse caso o envio é repetido
+ * depois do tempo indicado (com um pouco de variação, para os clientes
+ * não voltarem todos juntos), até `tentativas` vezes.
+ */
+async function enviarComRetry(url, opcoes, { tentativas = 5, aoAguardar = null } = {}) {
+    for (let tentativa = 1; ; tentativa++) {
+        const resposta = await fetch(url, opcoes);
+        if (resposta.status !== 503 || tentativa >= tentativas) {
+            return resposta;
+        }
+
+        const retryAfter = parseInt(resposta.headers.get("Retry-After"), 10);
+        const segundos = Number.isFinite(retryAfter) ? retryAfter : 2 * tentativa;
+        const espera = segundos * 1000 * (1 + Math.random() * 0.3);
+
+        if (aoAguardar) {
+            aoAguardar(Math.ceil(espera / 1000), tentativa);
+        }
+        await new Promise(r => setTimeout(r, espera));
+    }
+}
+
+/*
+ * Pré-visualização gerada no servidor (/termo/preview, /ressalvas/preview):
+ * envia os dados do formulário e mostra o PNG da primeira página do PDF.
+ */
+async function mostrarPrevia(endpoint, payload) {
+    const resposta = await enviarComRetry(endpoint, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(payload)
+    }, { tentativas: 2 });
+
+    if (!resposta.ok) {
+        let mensagem = "Erro ao gerar a pré-visualização";
+        try {
+            const result = await resposta.json();
+            if (Array.isArray(result?.detail)) {
+                mensagem = result.detail.map(e => e.msg).join("\n");
+            } else if (typeof result?.detail === "string") {
+                mensagem = result.detail;
+            }
+        } catch { /* corpo não é JSON */ }
+        throw new Error(mensagem);
+    }
+
+    const url = URL.createObjectURL(await resposta.blob());
+
+    const overlay = document.createElement("div");
+    overlay.style.cssText =
+        "position:fixed;inset:0;z-index:9999;background:rgba(15,23,42,.75);" +
+        "display:flex;align-items:flex-start;justify-content:center;overflow:auto;padding:24px;cursor:zoom-out;";
+
+    const img = document.createElement("img");
+    img.src = url;
+    img.alt = "Pré-visualização do PDF";
+    img.style.cssText = "max-width:min(100%, 900px);background:#fff;box-shadow:0 10px 30px rgba(0,0,0,.4);";
+
+    const fechar = () => {
+        overlay.remove();
+        URL.revokeObjectURL(url);
+        document.removeEventListener("keydown", aoTeclar);
+    };
+    const aoTeclar = (e) => { if (e.key === "Escape") fechar(); };
+
+    overlay.addEventListener("click", fechar);
+    document.addEventListener("keydown", aoTeclar);
+    overlay.appendChild(img);
+    document.body.appendChild(overlay);
+}
+
+/*
+ * Modo campo (offline): service worker (/sw.js) com fila de envios.
+ * Enquanto online, a página reserva ids de envio no servidor; o termo salvo
+ * sem conexão usa um deles como processo provisório até a fila sincronizar.
+ */
+const CHAVE_CLIENT_IDS = "sistemanps_client_ids";
+const MIN_CLIENT_IDS = 5;
+
+function _idsReservados() {
+    try {
+        return JSON.parse(localStorage.getItem(CHAVE_CLIENT_IDS)) || [];
+    } catch {
+        return [];
+    }
+}
+
+async function reservarClientIds() {
+    const ids = _idsReservados();
+    if (ids.length >= MIN_CLIENT_IDS || !navigator.onLine) return;
+    try {
+        const resposta = await fetch(`/offline/ids?n=${2 * MIN_CLIENT_IDS}`);
+        if (resposta.ok) {
+            const { ids: novos } = await resposta.json();
+            localStorage.setItem(CHAVE_CLIENT_IDS, JSON.stringify(ids.concat(novos)));
+        }
+    } catch { /* sem conexão: tenta na próxima visita */ }
+}
+
+function proximoClientId() {
+    const ids = _idsReservados();
+    const id = ids.shift() || null;
+    localStorage.setItem(CHAVE_CLIENT_IDS, JSON.stringify(ids));
+    reservarClientIds();
+    return id;
+}
+
+function pedirSincronizacao() {
+    navigator.serviceWorker?.controller?.postMessage({ tipo: "sincronizar" });
+}
+
+function avisarFalhasDaFila(event) {
+    // Envios feitos offline que o servidor recusou ficam em `falhas` no
+    // IndexedDB do service worker; a página avisa para refazê-los.
+    const { tipo, falhas } = event.data || {};
+    if (tipo === "fila-sincronizada" && falhas) {
+        alert(`${falhas} envio(s) feito(s) sem conexão não foram aceitos pelo servidor. Refaça-os.`);
+    }
+}
+
+if ("serviceWorker" in navigator) {
+    navigator.serviceWorker.register("/sw.js").catch((e) => console.warn("Service worker não registrado", e));
+    navigator.serviceWorker.addEventListener("message", avisarFalhasDaFila);
+    window.addEventListener("online", pedirSincronizacao);
+    window.addEventListener("load", () => {
+        reservarClientIds();
+        pedirSincronizacao();
+    });
+}
@@ -0,0 +1,325 @@
+/*
+ * Service worker do modo campo (offline).
+ *
+ * - Páginas do fluxo (/termo, /ressalvas, /nps, /user): rede primeiro, cópia
+ *   em cache se não houver conexão.
+ * - /static/*: cache primeiro, atualizado em segundo plano.
+ * - Envios (/termo/salvar, /ressalvas/salvar, /nps/finalizar): sem conexão,
+ *   o corpo vai para uma fila no IndexedDB e a página recebe 202 com
+ *   `offline: true`. A fila é reenviada em ordem quando a conexão volta
+ *   (Background Sync, ou mensagem "sincronizar" enviada pelas páginas).
+ * - Online, um envio só entra na fila se depende de outro ainda pendente
+ *   (mesmo processo; 202 com `offline: false`); os demais vão direto,
+ *   mesmo com a fila travada.
+ * - Recusas (4xx) e erros do servidor repetidos MAX_TENTATIVAS vezes vão
+ *   para `falhas`; ressalvas e NPS de um termo que falhou vão junto.
+ *
+ * O termo salvo offline usa o client_id (emitido por /offline/ids) como
+ * processo_id provisório; ressalvas e NPS feitos em seguida o referenciam, e
+ * a sincronização troca pelo código real devolvido pelo servidor. O
+ * /termo/salvar é idempotente por client_id, então reenviar não duplica.
+ */
+const VERSAO = "v1";
+const CACHE_PAGINAS = `sistemanps-paginas-${VERSAO}`;
+const CACHE_STATIC = `sistemanps-static-${VERSAO}`;
+
+const PAGINAS = ["/termo", "/ressalvas", "/nps", "/user"];
+const STATIC_INICIAIS = [
+    "/static/envio.js",
+    "/static/logozinha.png",
+    "/static/LogoFlexcolor2.png",
+    "/static/arrow.png",
+    "/static/camera-icon.png",
+    "/static/Cliente.png",
+];
+
+const ENVIOS = ["/termo/salvar", "/ressalvas/salvar", "/nps/finalizar"];
+const TAG_SYNC = "sistemanps-fila";
+// Erros 5xx seguidos antes de desistir de uma entrada (503 da admissão não conta)
+const MAX_TENTATIVAS = 5;
+
+// ================= INSTALAÇÃO =================
+self.addEventListener("install", (event) => {
+    event.waitUntil((async () => {
+        const paginas = await caches.open(CACHE_PAGINAS);
+        await paginas.addAll(PAGINAS);
+        const estaticos = await caches.open(CACHE_STATIC);
+        await estaticos.addAll(STATIC_INICIAIS);
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener("activate", (event) => {
+    event.waitUntil((async () => {
+        const atuais = [CACHE_PAGINAS, CACHE_STATIC];
+        for (const nome of await caches.keys()) {
+            if (nome.startsWith("sistemanps-") && !atuais.includes(nome)) {
+                await caches.delete(nome);
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+// ================= INDEXEDDB =================
+function abrirBanco() {
+    return new Promise((resolve, reject) => {
+        const req = indexedDB.open("sistemanps-offline", 1);
+        req.onupgradeneeded = () => {
+            const db = req.result;
+            db.createObjectStore("fila", { keyPath: "seq", autoIncrement: true });
+            db.createObjectStore("falhas", { keyPath: "seq" });
+            // client_id -> código real do processo
+            db.createObjectStore("ids");
+        };
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+}
+
+async function operacao(store, modo, fn) {
+    const db = await abrirBanco();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(store, modo);
+        const req = fn(tx.objectStore(store));
+        tx.oncomplete = () => resolve(req ? req.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+const enfileirar = (entrada) => operacao("fila", "readwrite", (s) => s.add(entrada));
+const listarFila = () => operacao("fila", "readonly", (s) => s.getAll());
+const atualizarNaFila = (entrada) => operacao("fila", "readwrite", (s) => s.put(entrada));
+const removerDaFila = (seq) => operacao("fila", "readwrite", (s) => s.delete(seq));
+const registrarFalha = (entrada) => operacao("falhas", "readwrite", (s) => s.put(entrada));
+const listarFalhas = () => operacao("falhas", "readonly", (s) => s.getAll());
+const codigoReal = (clientId) => operacao("ids", "readonly", (s) => s.get(clientId));
+const salvarCodigo = (clientId, codigo) => operacao("ids", "readwrite", (s) => s.put(codigo, clientId));
+
+// ================= FETCH =================
+self.addEventListener("fetch", (event) => {
+    const req = event.request;
+    const url = new URL(req.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (req.method === "POST" && ENVIOS.includes(url.pathname)) {
+        event.respondWith(enviarOuEnfileirar(req, url.pathname));
+    } else if (req.method === "GET" && req.mode === "navigate" && PAGINAS.includes(url.pathname)) {
+        event.respondWith(redePrimeiro(req));
+    } else if (req.method === "GET" && url.pathname.startsWith("/static/")) {
+        event.respondWith(cachePrimeiro(req));
+    }
+});
+
+async function redePrimeiro(req) {
+    const cache = await caches.open(CACHE_PAGINAS);
+    try {
+        const resposta = await fetch(req);
+        if (resposta.ok) {
+            // Chave sem query string: ?processo=... serve a mesma página
+            cache.put(new URL(req.url).pathname, resposta.clone());
+        }
+        return resposta;
+    } catch (err) {
+        const copia = await cache.match(new URL(req.url).pathname);
+        if (copia) return copia;
+        throw err;
+    }
+}
+
+async function cachePrimeiro(req) {
+    const cache = await caches.open(CACHE_STATIC);
+    const copia = await cache.match(req);
+    const atualizar = fetch(req).then((resposta) => {
+        if (resposta.ok) cache.put(req, resposta.clone());
+        return resposta;
+    });
+    if (copia) {
+        atualizar.catch(() => {});
+        return copia;
+    }
+    return atualizar;
+}
+
+function json(status, corpo) {
+    return new Response(JSON.stringify(corpo), {
+        status,
+        headers: { "Content-Type": "application/json" },
+    });
+}
+
+function chaveProcesso(rota, dados) {
+    // Envios do mesmo processo: o termo pelo client_id, os demais pelo processo_id
+    return rota === "/termo/salvar" ? dados.client_id : dados.processo_id;
+}
+
+async function dependeDaFila(rota, dados) {
+    const chave = chaveProcesso(rota, dados);
+    if (!chave) return false;
+    return (await listarFila()).some(
+        (entrada) => chaveProcesso(entrada.rota, JSON.parse(entrada.corpo || "{}")) === chave
+    );
+}
+
+async function resolverProcesso(dados) {
+    // processo_id provisório (client_id de um termo salvo offline) -> código real
+    if (dados.processo_id) {
+        dados.processo_id = (await codigoReal(dados.processo_id)) || dados.processo_id;
+    }
+    return dados;
+}
+
+function enviar(rota, dados) {
+    return fetch(rota, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(dados),
+    });
+}
+
+async function enviarOuEnfileirar(req, rota) {
+    const corpo = await req.clone().text();
+    let dados;
+    try {
+        dados = JSON.parse(corpo || "{}");
+    } catch {
+        return fetch(req);
+    }
+
+    // Este envio pode depender de itens da fila (ressalvas de um termo salvo
+    // offline): tenta esvaziá-la antes; o que não depende dela vai direto
+    await sincronizar().catch(() => {});
+    let offline = !self.navigator.onLine;
+    if (!(await dependeDaFila(rota, dados))) {
+        try {
+            return await enviar(rota, await resolverProcesso({ ...dados }));
+        } catch {
+            offline = true;  // sem conexão: cai na fila abaixo
+        }
+    }
+
+    if (rota === "/termo/salvar" && !dados.client_id) {
+        return json(503, { detail: "Sem conexão. Abra o sistema online uma vez antes de trabalhar offline." });
+    }
+
+    await enfileirar({ rota, corpo, criado_em: new Date().toISOString() });
+    try {
+        await self.registration.sync.register(TAG_SYNC);
+    } catch {
+        // Sem Background Sync: as páginas pedem a sincronização ao voltar online
+    }
+
+    // Online e na fila: espera um envio anterior do mesmo processo
+    const resposta = { success: true, status: "ok", offline, na_fila: true };
+    if (rota === "/termo/salvar") {
+        resposta.processo_id = dados.client_id;
+    }
+    return json(202, resposta);
+}
+
+// ================= SINCRONIZAÇÃO =================
+let sincronizando = null;
+
+function sincronizar() {
+    // Uma passada por vez: sync e mensagens das páginas chegam juntos
+    if (!sincronizando) {
+        sincronizando = esvaziarFila().finally(() => { sincronizando = null; });
+    }
+    return sincronizando;
+}
+
+async function moverParaFalhas(entrada, status, detalhe) {
+    // Guarda para conferência em vez de perder o envio
+    await registrarFalha({ ...entrada, status, detalhe });
+    await removerDaFila(entrada.seq);
+}
+
+async function termosFalhos() {
+    // client_ids dos termos em `falhas`: o que depende deles nunca vai passar
+    const ids = new Set();
+    for (const falha of await listarFalhas()) {
+        if (falha.rota === "/termo/salvar") {
+            ids.add(JSON.parse(falha.corpo || "{}").client_id);
+        }
+    }
+    return ids;
+}
+
+async function esvaziarFila() {
+    const fila = await listarFila();
+    const falhos = await termosFalhos();
+    // Processos com um envio anterior ainda na fila: os seguintes esperam
+    const travados = new Set();
+    let enviados = 0;
+    let falhas = 0;
+    let pendentes = 0;
+
+    for (const entrada of fila) {
+        const original = JSON.parse(entrada.corpo || "{}");
+        const chave = chaveProcesso(entrada.rota, original);
+        if (chave && travados.has(chave)) {
+            pendentes++;
+            continue;
+        }
+        if (entrada.rota !== "/termo/salvar" && falhos.has(original.processo_id)) {
+            await moverParaFalhas(entrada, 424, "O termo deste processo não foi enviado");
+            falhas++;
+            continue;
+        }
+
+        const dados = await resolverProcesso({ ...original });
+        let resposta;
+        try {
+            resposta = await enviar(entrada.rota, dados);
+        } catch {
+            throw new Error("sem conexão");  // tenta de novo no próximo sync
+        }
+
+        if (resposta.status >= 500) {
+            const tentativas = (entrada.tentativas || 0) + (resposta.status === 503 ? 0 : 1);
+            if (tentativas < MAX_TENTATIVAS) {
+                await atualizarNaFila({ ...entrada, tentativas });
+                if (chave) travados.add(chave);
+                pendentes++;
+                continue;
+            }
+        }
+
+        if (resposta.ok) {
+            const resultado = await resposta.json().catch(() => ({}));
+            if (entrada.rota === "/termo/salvar" && dados.client_id && resultado.processo_id) {
+                await salvarCodigo(dados.client_id, resultado.processo_id);
+            }
+            await removerDaFila(entrada.seq);
+            enviados++;
+        } else {
+            // Recusado (4xx) ou erro do servidor repetido demais
+            await moverParaFalhas(entrada, resposta.status, await resposta.text());
+            if (entrada.rota === "/termo/salvar" && original.client_id) {
+                falhos.add(original.client_id);
+            }
+            falhas++;
+        }
+    }
+
+    if (enviados || falhas) {
+        for (const cliente of await self.clients.matchAll()) {
+            cliente.postMessage({ tipo: "fila-sincronizada", envios: enviados, falhas, pendentes });
+        }
+    }
+    if (pendentes) {
+        throw new Error(`${pendentes} envio(s) ainda na fila`);  // próximo sync
+    }
+}
+
+self.addEventListener("sync", (event) => {
+    if (event.tag === TAG_SYNC) {
+        event.waitUntil(sincronizar());
+    }
+});
+
+self.addEventListener("message", (event) => {
+    if (event.data?.tipo === "sincronizar") {
+        event.waitUntil(sincronizar().catch(() => {}));
+    }
+});
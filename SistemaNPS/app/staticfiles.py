@@ -0,0 +1,99 @@
+import json
+import os
+
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+# Arquivos com hash no nome (gerados pelo build) nunca mudam de conteúdo
+IMMUTABLE_PREFIX = "dist/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# URLs sem hash (/static/Kure.png): cache longo, revalidado por ETag
+DEFAULT_CACHE = "public, max-age=604800, stale-while-revalidate=86400"
+
+# Ordem de preferência quando o cliente aceita mais de um formato
+IMAGE_PREFERENCE = ("image/avif", "image/webp")
+ENCODING_PREFERENCE = ("br", "gzip")
+
+VARIANTS_MANIFEST = os.path.join("dist", "variants.json")
+
+
+def _accepts(header: str, token: str) -> bool:
+    for part in header.split(","):
+        value, *params = [p.strip() for p in part.split(";")]
+        if value.lower() != token:
+            continue
+        for param in params:
+            if param.startswith("q="):
+                # "q=0" significa recusado explicitamente
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles com política de cache e negociação de variantes geradas por
+    scripts/build_assets.py: imagens AVIF/WebP redimensionadas conforme o
+    Accept e cópias br/gzip de CSS/JS conforme o Accept-Encoding.
+    """
+
+    # Manifesto recarregado quando o mtime muda: o build pode rodar com o
+    # servidor já no ar (ou depois dele) sem exigir restart
+    _manifest: dict = {}
+    _manifest_mtime: float | None = None
+
+    def _variants(self) -> dict:
+        path = os.path.join(str(self.directory), VARIANTS_MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._manifest, self._manifest_mtime = {}, None
+            return self._manifest
+        if mtime != self._manifest_mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _choose_variant(self, path: str, headers: Headers) -> tuple[str, dict]:
+        entry = self._variants().get(path.replace("\\", "/"))
+        if not entry:
+            return path, {}
+
+        if "types" in entry:
+            accept = headers.get("accept", "").lower()
+            for media_type in IMAGE_PREFERENCE:
+                if media_type in entry["types"] and _accepts(accept, media_type):
+                    return entry["types"][media_type], {"vary": "Accept", "content-type": media_type}
+            fallback = entry.get("fallback")
+            if fallback:
+                return fallback, {"vary": "Accept"}
+            return path, {"vary": "Accept"}
+
+        if "encodings" in entry:
+            accept_encoding = headers.get("accept-encoding", "").lower()
+            for encoding in ENCODING_PREFERENCE:
+                if encoding in entry["encodings"] and _accepts(accept_encoding, encoding):
+                    return entry["encodings"][encoding], {
+                        "vary": "Accept-Encoding",
+                        "content-encoding": encoding,
+                        "content-type": entry["content_type"],
+                    }
+            return path, {"vary": "Accept-Encoding"}
+
+        return path, {}
+
+    async def get_response(self, path: str, scope):
+        variant, extra_headers = self._choose_variant(path, Headers(scope=scope))
+        response = await super().get_response(variant, scope)
+        if response.status_code in (200, 206, 304):
+            for name, value in extra_headers.items():
+                response.headers[name] = value
+            if path.replace("\\", "/").startswith(IMMUTABLE_PREFIX):
+                response.headers["cache-control"] = IMMUTABLE_CACHE
+            else:
+                response.headers.setdefault("cache-control", DEFAULT_CACHE)
+        return response
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import (
+    ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound
+)
+
+APP_DIR = os.path.dirname(__file__)
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+# Saída de scripts/build_assets.py (templates com JS/CSS extraídos)
+BUILD_TEMPLATES_DIR = os.path.join(APP_DIR, "build", "templates")
+# Hash de cada original no momento do build (gravado pelo mesmo script)
+BUILD_FONTES_PATH = os.path.join(APP_DIR, "build", "fontes.json")
+
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+PRODUCTION = APP_ENV == "production"
+
+JINJA_CACHE_DIR = os.getenv(
+    "JINJA_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "sistemanps-jinja")
+)
+
+
+def hash_fonte(caminho: str) -> str:
+    with open(caminho, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _templates_do_build() -> set[str]:
+    """Templates do build cujo original não mudou desde o build.
+
+    O build não é versionado: um build velho (deploy sem o passo de build,
+    edição depois do build) esconderia as alterações nos originais.
+    """
+    try:
+        with open(BUILD_FONTES_PATH, encoding="utf-8") as f:
+            fontes = json.load(f)
+    except (OSError, ValueError):
+        if os.path.isdir(BUILD_TEMPLATES_DIR):
+            print(f"AVISO: {BUILD_FONTES_PATH} ausente; build ignorado, rode scripts/build_assets.py")
+        return set()
+
+    atuais, desatualizados = set(), []
+    for nome, digest in fontes.items():
+        original = os.path.join(TEMPLATES_DIR, nome)
+        if os.path.exists(original) and hash_fonte(original) == digest:
+            atuais.add(nome)
+        else:
+            desatualizados.append(nome)
+    if desatualizados:
+        print(
+            "AVISO: templates alterados depois do build (usando os originais): "
+            f"{', '.join(sorted(desatualizados))}. Rode scripts/build_assets.py"
+        )
+    return atuais
+
+
+class _BuildLoader(FileSystemLoader):
+    """Só entrega templates do build ainda iguais ao original; os demais
+    caem no próximo loader (app/templates)."""
+
+    def __init__(self, atuais: set[str]):
+        super().__init__(BUILD_TEMPLATES_DIR)
+        self.atuais = atuais
+
+    def get_source(self, environment, template):
+        if template not in self.atuais:
+            raise TemplateNotFound(template)
+        return super().get_source(environment, template)
+
+
+def _create_env() -> Environment:
+    if not PRODUCTION:
+        return Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            autoescape=True,
+            auto_reload=True,
+        )
+
+    # Produção: sem stat dos arquivos a cada render e com bytecode em disco
+    # compartilhado entre workers. Templates do build têm prioridade; se o
+    # build não foi executado, ou o original mudou depois dele, cai nos originais.
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    return Environment(
+        loader=ChoiceLoader([
+            _BuildLoader(_templates_do_build()),
+            FileSystemLoader(TEMPLATES_DIR),
+        ]),
+        autoescape=True,
+        auto_reload=False,
+        cache_size=-1,
+        bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    )
+
+
+# Ambiente Jinja único, compartilhado por todos os routers
+templates = Jinja2Templates(env=_create_env())
@@ -0,0 +1,271 @@
+"""
+Micro-benchmarks dos renderizadores de PDF.
+
+Uso (a partir da pasta SistemaNPS):
+
+    python -m benchmarks.bench_render                  # compara com o baseline
+    python -m benchmarks.bench_render --rapido         # matriz reduzida
+    python -m benchmarks.bench_render --atualizar-baseline
+
+Mede tempo, pico de memória (tracemalloc) e tamanho do PDF gerado por
+renderizador e cenário. Sai com código 1 se algum cenário regredir além da
+tolerância em relação a benchmarks/baseline.json, se o baseline não existir
+ou se nenhum cenário executado estiver nele.
+
+Tempo e memória são passadas separadas: primeiro todos os cenários são
+cronometrados (sem tracemalloc e sem GC durante as repetições), depois cada
+um roda uma vez sob tracemalloc. O tempo é o mínimo das repetições, que
+varia bem menos entre execuções que a mediana. Um cenário acima da
+tolerância de tempo é cronometrado de novo (até CONFIRMACOES vezes) antes
+de contar como regressão: picos de ruído da máquina não se repetem, uma
+regressão de verdade sim.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from app.routers.nps import gerar_pdf_nps, mesclar_pdfs
+from app.routers.ressalvas import gerar_pdf_ressalvas
+from app.routers.termo import gerar_pdf_termo
+from app.services import text_layout
+from app.services.pdf_layout import draw_header_footer
+from benchmarks import payloads
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Tolerâncias relativas e piso absoluto de tempo (ruído de medição).
+# Tempo: em uma VM de 1 vCPU o mínimo de 7 repetições do mesmo código
+# variou 15-20% entre medições fora dos picos de ruído (que chegam a +80%,
+# isolados); 25% fica acima dessa faixa e os picos são descartados pelas
+# medições de confirmação.
+TOLERANCIA_TEMPO = 0.25
+CONFIRMACOES = 2
+TOLERANCIA_MEMORIA = 0.25
+TOLERANCIA_TAMANHO = 0.10
+PISO_TEMPO_S = 0.005
+# Cenários rápidos repetem até somar este tempo: o mínimo de poucas
+# repetições de ~10 ms cai inteiro dentro de um pico de ruído
+TEMPO_MINIMO_S = 1.0
+MAX_REPETICOES = 1000
+
+
+def _tamanho(resultado) -> int:
+    if isinstance(resultado, BytesIO):
+        return len(resultado.getbuffer())
+    if isinstance(resultado, (bytes, bytearray)):
+        return len(resultado)
+    return 0
+
+
+def _header_footer() -> BytesIO:
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    for _ in range(20):
+        draw_header_footer(c, width, height)
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def _casos(rapida: bool, filtro: str = ""):
+    # Cenários fora do --filtro nem são montados (o merge renderiza os PDFs)
+    def quer(renderer: str, cenario: str) -> bool:
+        return not filtro or filtro in f"{renderer}|{cenario}"
+
+    if quer("header_footer", "20 paginas"):
+        yield "header_footer", "20 paginas", _header_footer
+
+    for texto_nome, texto in payloads.TEXTOS.items():
+        if not quer("wrap_text", f"texto={texto_nome}"):
+            continue
+        corpo = payloads.texto_livre(texto * 10)
+        yield "wrap_text", f"texto={texto_nome}", (
+            lambda corpo=corpo: text_layout.wrap(corpo, 515, "Helvetica", 11)
+        )
+
+    for nome, p in payloads.matriz(rapida):
+        if not any(quer(r, nome) for r in ("termo", "ressalvas", "nps", "merge")):
+            continue
+        termo = payloads.termo_payload(**p)
+        ressalvas = payloads.ressalvas_payload(**p)
+        nps = payloads.nps_payload(p["texto"], p["campos"])
+
+        if quer("termo", nome):
+            yield "termo", nome, lambda termo=termo: gerar_pdf_termo(termo)
+        if quer("ressalvas", nome):
+            yield "ressalvas", nome, lambda r=ressalvas: gerar_pdf_ressalvas(
+                processo_codigo=r.processo_id,
+                responsavel=r.responsavel,
+                observacoes=r.observacoes,
+                imagens=r.imagens,
+            )
+        if quer("nps", nome):
+            yield "nps", nome, lambda nps=nps: gerar_pdf_nps(nps)
+
+        if not quer("merge", nome):
+            continue
+        # Merge usa os PDFs já renderizados (mede só o PyPDF2)
+        partes = (
+            gerar_pdf_termo(termo).getvalue(),
+            gerar_pdf_ressalvas(
+                processo_codigo=ressalvas.processo_id,
+                responsavel=ressalvas.responsavel,
+                observacoes=ressalvas.observacoes,
+                imagens=ressalvas.imagens,
+            ).getvalue(),
+            gerar_pdf_nps(nps).getvalue(),
+        )
+        yield "merge", nome, lambda partes=partes: mesclar_pdfs(*partes)
+
+
+def medir_tempo(func, repeticoes: int) -> dict:
+    resultado = func()  # aquecimento (fontes, logos, imports)
+
+    tempos = []
+    gc.collect()
+    gc.disable()
+    try:
+        while len(tempos) < repeticoes or (
+            sum(tempos) < TEMPO_MINIMO_S and len(tempos) < MAX_REPETICOES
+        ):
+            inicio = time.perf_counter()
+            func()
+            tempos.append(time.perf_counter() - inicio)
+    finally:
+        gc.enable()
+
+    minimo = min(tempos)
+    return {
+        "tempo_s": round(minimo, 6),
+        "dispersao": round(statistics.median(tempos) / minimo - 1, 4) if minimo else 0.0,
+        "tamanho_bytes": _tamanho(resultado),
+    }
+
+
+def medir_memoria(func) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pico
+
+
+def _limite_tempo(base: dict) -> float:
+    return max(base["tempo_s"] * (1 + TOLERANCIA_TEMPO), base["tempo_s"] + PISO_TEMPO_S)
+
+
+def _confirmar_tempo(func, repeticoes: int, atual: dict, base: dict) -> None:
+    """Acima do limite: mede de novo e fica com o menor mínimo."""
+    for _ in range(CONFIRMACOES):
+        if atual["tempo_s"] <= _limite_tempo(base):
+            return
+        nova = medir_tempo(func, repeticoes)
+        if nova["tempo_s"] < atual["tempo_s"]:
+            atual["tempo_s"], atual["dispersao"] = nova["tempo_s"], nova["dispersao"]
+
+
+def _regressoes(chave: str, atual: dict, base: dict) -> list[str]:
+    problemas = []
+    if atual["tempo_s"] > _limite_tempo(base):
+        problemas.append(f"{chave}: tempo {atual['tempo_s']:.4f}s > {base['tempo_s']:.4f}s")
+    if atual["pico_mem_bytes"] > base["pico_mem_bytes"] * (1 + TOLERANCIA_MEMORIA):
+        problemas.append(
+            f"{chave}: memória {atual['pico_mem_bytes']} > {base['pico_mem_bytes']} bytes"
+        )
+    if base["tamanho_bytes"] and atual["tamanho_bytes"] > base["tamanho_bytes"] * (1 + TOLERANCIA_TAMANHO):
+        problemas.append(
+            f"{chave}: tamanho {atual['tamanho_bytes']} > {base['tamanho_bytes']} bytes"
+        )
+    return problemas
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks dos renderizadores de PDF")
+    parser.add_argument("--rapido", action="store_true", help="matriz reduzida")
+    parser.add_argument("--repeticoes", type=int, default=7, help="mínimo de repetições")
+    parser.add_argument("--filtro", default="", help="executa só chaves que contêm o texto")
+    parser.add_argument("--atualizar-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("resultados", {})
+    elif not args.atualizar_baseline:
+        # Sem baseline não há com o que comparar: falhar em vez de passar sempre
+        print(f"Baseline não encontrado em {args.baseline} (gere com --atualizar-baseline)")
+        return 1
+
+    casos = [
+        (f"{renderer}|{cenario}", func)
+        for renderer, cenario, func in _casos(args.rapido, args.filtro)
+    ]
+    resultados = {}
+    for i, (chave, func) in enumerate(casos, 1):
+        print(f"[tempo {i}/{len(casos)}] {chave}", file=sys.stderr, flush=True)
+        resultados[chave] = medir_tempo(func, args.repeticoes)
+        if not args.atualizar_baseline and chave in baseline:
+            _confirmar_tempo(func, args.repeticoes, resultados[chave], baseline[chave])
+    for i, (chave, func) in enumerate(casos, 1):
+        print(f"[memória {i}/{len(casos)}] {chave}", file=sys.stderr, flush=True)
+        resultados[chave]["pico_mem_bytes"] = medir_memoria(func)
+
+    problemas = []
+    sem_baseline = []
+    for chave, atual in resultados.items():
+        status = ""
+        if args.atualizar_baseline:
+            pass
+        elif chave in baseline:
+            erros = _regressoes(chave, atual, baseline[chave])
+            problemas.extend(erros)
+            status = "REGRESSAO" if erros else "ok"
+        else:
+            sem_baseline.append(chave)
+            status = "SEM BASELINE"
+        print(
+            f"{chave:<70} {atual['tempo_s'] * 1000:9.1f} ms "
+            f"(mediana +{atual['dispersao'] * 100:3.0f}%) "
+            f"{atual['pico_mem_bytes'] / 1024:10.0f} KiB "
+            f"{atual['tamanho_bytes'] / 1024:9.0f} KiB  {status}"
+        )
+
+    if args.atualizar_baseline:
+        # Preserva cenários que não rodaram nesta execução (ex.: --rapido)
+        baseline.update(resultados)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"versao": 2, "resultados": baseline}, f, indent=2, sort_keys=True)
+        print(f"Baseline gravado em {args.baseline} ({len(resultados)} cenários)")
+        return 0
+
+    if sem_baseline:
+        print(f"\n{len(sem_baseline)} cenários sem baseline (não comparados)")
+    if resultados and len(sem_baseline) == len(resultados):
+        print("Nenhum cenário comparado: gere o baseline com --atualizar-baseline")
+        return 1
+
+    if problemas:
+        print("\nRegressões encontradas:")
+        for p in problemas:
+            print(f"  - {p}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Payloads sintéticos para os benchmarks dos renderizadores.
+
+Cada cenário da matriz combina quantidade de fotos, tamanho dos textos
+livres, quantidade de campos extras e resolução das imagens.
+"""
+import base64
+import itertools
+import random
+from datetime import date
+from io import BytesIO
+
+from PIL import Image
+
+from app.routers.nps import NPSRequest
+from app.routers.ressalvas import ImagemRessalva, RessalvasRequest
+from app.routers.termo import TermoRequest
+
+FOTOS = (0, 1, 6, 12, 30)
+# Até aqui as fotos entram em todas as combinações de texto/campos/imagem
+FOTOS_COMBINADAS = 6
+TEXTOS = {"curto": 40, "longo": 4000}
+CAMPOS_EXTRAS = (0, 40)
+IMAGENS = {"vga": (640, 480), "hd": (1280, 720), "fullhd": (1920, 1080)}
+
+REGIOES = (
+    "frontal", "traseira", "lateral-esquerda",
+    "lateral-direita", "superior", "inferior",
+)
+
+_PALAVRAS = (
+    "entrega unidade móvel arranhão lateral porta traseira pintura "
+    "vidro farol pneu estepe documentação cliente conferido aprovado "
+    "pendente ajuste revisão acabamento interno externo"
+).split()
+
+_cache_imagens: dict[tuple, str] = {}
+
+
+def _texto(rng: random.Random, tamanho: int) -> str:
+    palavras = []
+    total = 0
+    while total < tamanho:
+        p = rng.choice(_PALAVRAS)
+        palavras.append(p)
+        total += len(p) + 1
+    return " ".join(palavras)
+
+
+def texto_livre(tamanho: int, seed: int = 3) -> str:
+    """Texto corrido de ~`tamanho` caracteres (determinístico pela seed)."""
+    return _texto(random.Random(seed), tamanho)
+
+
+def imagem_base64(largura: int, altura: int, seed: int = 0) -> str:
+    """PNG com gradiente + ruído (comprime como uma foto, não como cor sólida)."""
+    chave = (largura, altura, seed)
+    if chave not in _cache_imagens:
+        ruido = Image.effect_noise((largura, altura), 48).convert("RGB")
+        gradiente = Image.linear_gradient("L").resize((largura, altura)).convert("RGB")
+        img = Image.blend(gradiente, ruido, 0.35 + (seed % 5) * 0.05)
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        _cache_imagens[chave] = (
+            "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+        )
+    return _cache_imagens[chave]
+
+
+def termo_payload(fotos: int, texto: int, campos: int, imagem: tuple, seed: int = 1) -> TermoRequest:
+    rng = random.Random(seed)
+    campos_dict = {
+        "NOME DO CLIENTE": "CLIENTE BENCHMARK",
+        "EMPRESA": "EMPRESA BENCHMARK LTDA",
+        "PRODUTO E CÓDIGO DA ENTREGA": _texto(rng, texto),
+        "RESPONSÁVEL PELA ENTREGA": "TÉCNICO",
+        "QUEM REALIZOU O ATENDIMENTO?": "ATENDENTE",
+        "LOCAL DA ENTREGA": _texto(rng, texto),
+    }
+    for i in range(campos):
+        campos_dict[f"CAMPO EXTRA {i + 1}"] = _texto(rng, min(texto, 300))
+
+    return TermoRequest(
+        cpf="12345678909",
+        nome_cliente="CLIENTE BENCHMARK",
+        empresa="EMPRESA BENCHMARK LTDA",
+        status_entrega="concluido_com_ressalva",
+        imagens=[
+            {
+                "item": i + 1,
+                "regiao_foto": REGIOES[i % len(REGIOES)],
+                "imagem_base64": imagem_base64(*imagem, seed=i),
+            }
+            for i in range(fotos)
+        ],
+        termo_dados={
+            "data": {"dia": "01", "mes": "02", "ano": "2026"},
+            "campos": campos_dict,
+            "assinaturas": {
+                "comprador": {"nome": "COMPRADOR", "cpf": "123.456.789-09"},
+                "representante": {"nome": "REPRESENTANTE", "cpf": "987.654.321-00"},
+            },
+        },
+    )
+
+
+def ressalvas_payload(fotos: int, texto: int, campos: int, imagem: tuple, seed: int = 1) -> RessalvasRequest:
+    rng = random.Random(seed)
+    # Para ressalvas, "campos" extras viram itens sem foto
+    itens = [
+        ImagemRessalva(
+            item=f"{i + 1}",
+            descricao=_texto(rng, texto),
+            prazo=date(2026, 3, 1),
+            responsavel="TÉCNICO",
+            regiao_foto=REGIOES[i % len(REGIOES)],
+            aprovacao=bool(i % 2),
+            imagem_base64=imagem_base64(*imagem, seed=i),
+        )
+        for i in range(fotos)
+    ]
+    itens += [
+        ImagemRessalva(item=f"X{i + 1}", descricao=_texto(rng, min(texto, 300)))
+        for i in range(campos)
+    ]
+    return RessalvasRequest(
+        processo_id="BENCH_000_2026-01-01_XXXX",
+        responsavel="RESPONSÁVEL BENCHMARK",
+        cpf="12345678909",
+        observacoes=_texto(rng, texto),
+        imagens=itens,
+    )
+
+
+def nps_payload(texto: int, campos: int, seed: int = 1) -> NPSRequest:
+    rng = random.Random(seed)
+    avaliacoes = {f"pergunta_{i + 1}": rng.randint(0, 10) for i in range(5 + campos)}
+    feedback = {
+        "elogios": _texto(rng, texto),
+        "sugestoes": "\n".join(_texto(rng, max(texto // 4, 10)) for _ in range(4)),
+    }
+    return NPSRequest(
+        processo_id="BENCH_000_2026-01-01_XXXX",
+        nps=rng.randint(0, 10),
+        avaliacoes=avaliacoes,
+        feedback=feedback,
+    )
+
+
+def matriz(rapida: bool = False):
+    """Gera (nome_do_cenario, parametros) para a matriz completa ou reduzida.
+
+    Acima de FOTOS_COMBINADAS fotos só entra a combinação mais leve (vga,
+    texto curto, sem campos extras): 12 fotos full HD já levam ~15 s por
+    render e minutos sob tracemalloc, e a matriz inteira não terminaria.
+    """
+    fotos = (0, 6) if rapida else FOTOS
+    textos = {"curto": TEXTOS["curto"]} if rapida else TEXTOS
+    extras = (0,) if rapida else CAMPOS_EXTRAS
+    imagens = {"vga": IMAGENS["vga"]} if rapida else IMAGENS
+
+    for n_fotos, (n_texto, texto), n_campos, (n_img, img) in itertools.product(
+        fotos, textos.items(), extras, imagens.items()
+    ):
+        # Resolução não importa sem fotos: evita cenários duplicados
+        if n_fotos == 0 and n_img != next(iter(imagens)):
+            continue
+        if n_fotos > FOTOS_COMBINADAS and (n_img, n_texto, n_campos) != ("vga", "curto", 0):
+            continue
+        nome = f"fotos={n_fotos},texto={n_texto},campos={n_campos},img={n_img if n_fotos else '-'}"
+        yield nome, {"fotos": n_fotos, "texto": texto, "campos": n_campos, "imagem": img}
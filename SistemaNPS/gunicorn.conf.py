@@ -0,0 +1,20 @@
+# Modo preload/fork:
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# O app é importado e aquecido uma vez no master (app.preload.warm); os
+# workers nascem por fork já com ReportLab, fontes, logos e templates
+# carregados. O cliente Supabase é criado de forma preguiçosa em cada worker.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    from app.preload import warm
+
+    server.log.info("Preload concluído em %.3fs", warm())
@@ -0,0 +1,240 @@
+"""
+Teste de carga ponta a ponta do fluxo de entrega.
+
+Cada "fluxo" executa, em sequência:
+    termo/salvar -> ressalvas/salvar -> nps/finalizar -> /admin -> /pdf/final
+
+Por padrão roda a aplicação no próprio processo com o Supabase falso
+(SUPABASE_BACKEND=fake), então nada toca o projeto real; busca, réplica e
+storage local ficam em uma pasta temporária, fora de data/. O lifespan da
+aplicação roda em volta da carga (pool HTTP, réplica, índice de busca),
+como no servidor. Com --url o alvo passa a ser um servidor já em execução
+(suba-o com o backend fake).
+
+O teste inteiro tem um prazo (--prazo, padrão duração + timeout + 30s):
+uma execução travada despeja as pilhas das threads e sai com erro em vez
+de ficar parada.
+
+Uso (a partir da pasta SistemaNPS):
+
+    python -m loadtest.run --taxa 2 --duracao 30
+    FAKE_SUPABASE_LATENCIA_DB_MS=10-40 FAKE_SUPABASE_LATENCIA_STORAGE_MS=50 \\
+        python -m loadtest.run --taxa 5 --duracao 60 --fotos 6
+"""
+import argparse
+import asyncio
+import contextlib
+import faulthandler
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ETAPAS = ("termo", "ressalvas", "nps", "admin", "pdf_final")
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[idx]
+
+
+class Resultado:
+    def __init__(self):
+        self.latencias: dict[str, list[float]] = defaultdict(list)
+        self.erros: dict[str, int] = defaultdict(int)
+        self.fluxos_ok = 0
+        self.fluxos_erro = 0
+        self.duracao = 0.0
+
+    def registrar(self, etapa: str, inicio: float, resp: httpx.Response | None) -> bool:
+        self.latencias[etapa].append(time.perf_counter() - inicio)
+        if resp is None or resp.status_code >= 400:
+            self.erros[etapa] += 1
+            return False
+        return True
+
+    def relatorio(self, duracao: float) -> str:
+        total = sum(len(v) for v in self.latencias.values())
+        linhas = [
+            f"Duração: {duracao:.1f}s  requisições: {total}  "
+            f"throughput: {total / duracao:.2f} req/s  "
+            f"fluxos ok/erro: {self.fluxos_ok}/{self.fluxos_erro}",
+            "",
+            f"{'etapa':<12}{'n':>6}{'erros':>7}{'req/s':>8}"
+            f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+        ]
+        for etapa in ETAPAS:
+            lat = self.latencias.get(etapa, [])
+            if not lat:
+                continue
+            linhas.append(
+                f"{etapa:<12}{len(lat):>6}{self.erros.get(etapa, 0):>7}"
+                f"{len(lat) / duracao:>8.2f}"
+                f"{statistics.median(lat) * 1000:>10.1f}"
+                f"{_percentil(lat, 90) * 1000:>10.1f}"
+                f"{_percentil(lat, 99) * 1000:>10.1f}"
+                f"{max(lat) * 1000:>10.1f}"
+            )
+        return "\n".join(linhas)
+
+
+async def _post(client: httpx.AsyncClient, resultado: Resultado, etapa: str, url: str, json: dict):
+    inicio = time.perf_counter()
+    try:
+        resp = await client.post(url, json=json)
+    except httpx.HTTPError:
+        resp = None
+    return resp if resultado.registrar(etapa, inicio, resp) else None
+
+
+async def _get(client: httpx.AsyncClient, resultado: Resultado, etapa: str, url: str):
+    inicio = time.perf_counter()
+    try:
+        resp = await client.get(url)
+    except httpx.HTTPError:
+        resp = None
+    return resp if resultado.registrar(etapa, inicio, resp) else None
+
+
+async def fluxo(client: httpx.AsyncClient, resultado: Resultado, payloads: dict) -> None:
+    resp = await _post(client, resultado, "termo", "/termo/salvar", payloads["termo"])
+    if resp is None:
+        resultado.fluxos_erro += 1
+        return
+    codigo = resp.json()["processo_id"]
+
+    ressalvas = dict(payloads["ressalvas"], processo_id=codigo)
+    if await _post(client, resultado, "ressalvas", "/ressalvas/salvar", ressalvas) is None:
+        resultado.fluxos_erro += 1
+        return
+
+    nps = dict(payloads["nps"], processo_id=codigo)
+    if await _post(client, resultado, "nps", "/nps/finalizar", nps) is None:
+        resultado.fluxos_erro += 1
+        return
+
+    admin = await _get(client, resultado, "admin", "/admin")
+    pdf = await _get(client, resultado, "pdf_final", f"/pdf/final/{codigo}")
+    if admin is None or pdf is None:
+        resultado.fluxos_erro += 1
+        return
+    resultado.fluxos_ok += 1
+
+
+def _payloads(args) -> dict:
+    from benchmarks import payloads
+
+    params = {
+        "fotos": args.fotos,
+        "texto": args.texto,
+        "campos": 0,
+        "imagem": payloads.IMAGENS[args.imagem],
+    }
+    return {
+        "termo": payloads.termo_payload(**params).model_dump(mode="json"),
+        "ressalvas": payloads.ressalvas_payload(**params).model_dump(mode="json"),
+        "nps": payloads.nps_payload(args.texto, 0).model_dump(mode="json"),
+    }
+
+
+def _isolar_dados() -> str:
+    """Arquivos locais da aplicação (busca, réplica, storage local) em uma
+    pasta temporária: os processos falsos não podem ir para data/."""
+    pasta = tempfile.mkdtemp(prefix="sistemanps-loadtest-")
+    os.environ["SEARCH_DB_PATH"] = os.path.join(pasta, "search.sqlite3")
+    os.environ["REPLICA_DB_PATH"] = os.path.join(pasta, "replica.sqlite3")
+    os.environ["STORAGE_LOCAL_DIR"] = os.path.join(pasta, "storage")
+    os.environ["PROFILE_DIR"] = os.path.join(pasta, "profiles")
+    # Um único processo: qualquer segredo serve para os ids offline
+    os.environ.setdefault("CLIENT_ID_SECRET", secrets.token_hex(32))
+    return pasta
+
+
+async def executar(args) -> Resultado:
+    # Os payloads reaproveitam os models dos routers; o backend falso evita
+    # criar um cliente real só para importá-los.
+    os.environ.setdefault("SUPABASE_BACKEND", "fake")
+
+    if args.url:
+        transport = None
+        base_url = args.url
+        ciclo = contextlib.nullcontext()
+    else:
+        if os.environ["SUPABASE_BACKEND"] == "fake":
+            # Antes de importar app.main: os caminhos são lidos no import
+            print(f"Dados locais do teste em {_isolar_dados()}")
+        from app.main import app
+
+        # ASGITransport não dispara o lifespan: roda-o aqui
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+        ciclo = app.router.lifespan_context(app)
+
+    resultado = Resultado()
+    async with ciclo:
+        await _carga(args, transport, base_url, resultado)
+    return resultado
+
+
+async def _carga(args, transport, base_url: str, resultado: Resultado) -> None:
+    payloads = _payloads(args)
+    limite = asyncio.Semaphore(args.max_concorrencia)
+
+    async def disparar():
+        async with limite:
+            await fluxo(client, resultado, payloads)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url, timeout=args.timeout
+    ) as client:
+        tarefas = []
+        intervalo = 1.0 / args.taxa
+        inicio = time.perf_counter()
+        proximo = inicio
+        # Carga em malha aberta: os fluxos partem na taxa alvo,
+        # independentemente de os anteriores terem terminado.
+        while time.perf_counter() - inicio < args.duracao:
+            tarefas.append(asyncio.create_task(disparar()))
+            proximo += intervalo
+            await asyncio.sleep(max(0.0, proximo - time.perf_counter()))
+        try:
+            await asyncio.gather(*tarefas)
+        finally:
+            resultado.duracao = time.perf_counter() - inicio
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga do fluxo de entrega")
+    parser.add_argument("--url", help="servidor alvo (padrão: app em processo + Supabase falso)")
+    parser.add_argument("--taxa", type=float, default=1.0, help="fluxos iniciados por segundo")
+    parser.add_argument("--duracao", type=float, default=10.0, help="segundos de carga")
+    parser.add_argument("--max-concorrencia", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120.0, help="por requisição")
+    parser.add_argument("--prazo", type=float, help="segundos para o teste inteiro")
+    parser.add_argument("--fotos", type=int, default=6)
+    parser.add_argument("--texto", type=int, default=200)
+    parser.add_argument("--imagem", choices=("vga", "hd", "fullhd"), default="vga")
+    args = parser.parse_args(argv)
+
+    # Cancelar a corrotina não basta: uma thread travada segura o shutdown
+    # do pool. Estourado o prazo, despeja as pilhas e sai com código 1.
+    prazo = args.prazo or args.duracao + args.timeout + 30
+    faulthandler.dump_traceback_later(prazo, exit=True)
+    try:
+        resultado = asyncio.run(executar(args))
+    finally:
+        faulthandler.cancel_dump_traceback_later()
+    print(resultado.relatorio(resultado.duracao))
+    return 1 if resultado.fluxos_erro else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
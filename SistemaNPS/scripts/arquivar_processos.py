@@ -0,0 +1,60 @@
+"""
+Move os JSONs pesados de processos finalizados antigos para o storage
+(zstd), deixando um ponteiro na coluna (app/services/archive.py).
+
+Uso (a partir da pasta SistemaNPS):
+
+    python scripts/arquivar_processos.py --dry-run
+    python scripts/arquivar_processos.py --dias 180
+
+Pode ser executado de novo a qualquer momento: colunas já arquivadas são
+puladas.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def main() -> int:
+    from app.services import archive
+
+    parser = argparse.ArgumentParser(description="Arquiva JSONs de processos finalizados")
+    parser.add_argument("--dias", type=int, default=archive.ARCHIVE_DIAS,
+                        help="finalizados há mais de N dias (padrão: ARCHIVE_DIAS)")
+    parser.add_argument("--limite", type=int, help="no máximo N processos")
+    parser.add_argument("--dry-run", action="store_true", help="só calcula o que seria arquivado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+
+    def progresso(r):
+        print(f"  {r.processos} processos lidos, {r.arquivados} arquivados, {len(r.erros)} erros")
+
+    resultado = archive.executar(
+        dias=args.dias,
+        limite=args.limite,
+        dry_run=args.dry_run,
+        progresso=progresso,
+    )
+
+    acao = "a arquivar" if args.dry_run else "arquivados"
+    print(
+        f"{resultado.processos} processos em {time.perf_counter() - inicio:.1f}s: "
+        f"{resultado.arquivados} {acao} ({resultado.colunas} colunas), "
+        f"{_mb(resultado.bytes_antes)} -> {_mb(resultado.bytes_depois)} no storage, "
+        f"{len(resultado.erros)} erros"
+    )
+    for erro in resultado.erros[:20]:
+        print(f"  ERRO {erro}")
+    return 1 if resultado.erros else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
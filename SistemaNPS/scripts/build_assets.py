@@ -0,0 +1,229 @@
+"""
+Build de produção dos templates.
+
+Extrai os blocos <style> e <script> inline de app/templates/*.html para
+arquivos com hash no nome em app/static/dist/ e grava os templates
+reescritos em app/build/templates/, com o hash de cada original em
+app/build/fontes.json. Com APP_ENV=production o Jinja carrega esses
+templates primeiro, enquanto o original não mudar; os arquivos em
+/static/dist/ são servidos com Cache-Control immutable, então visitas
+seguintes baixam só o HTML.
+
+Blocos que contêm sintaxe Jinja ({{ }}, {% %}) ficam inline, pois dependem
+do contexto de cada requisição.
+
+Também gera as variantes servidas por app.staticfiles.CachedStaticFiles
+(índice em app/static/dist/variants.json):
+  - imagens de app/static redimensionadas em AVIF, WebP e no formato original;
+  - cópias .br e .gz de todo CSS/JS.
+
+Uso (a partir da pasta SistemaNPS):
+
+    python scripts/build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES_DIR = os.path.join(ROOT, "app", "templates")
+BUILD_DIR = os.path.join(ROOT, "app", "build", "templates")
+FONTES_PATH = os.path.join(ROOT, "app", "build", "fontes.json")
+STATIC_DIR = os.path.join(ROOT, "app", "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+DIST_URL = "/static/dist"
+
+# Maior lado das imagens servidas (as originais chegam a 6000px)
+IMG_MAX_LADO = 1600
+IMG_FORMATOS = (
+    ("image/avif", "AVIF", "avif", {"quality": 60, "speed": 6}),
+    ("image/webp", "WEBP", "webp", {"quality": 82, "method": 6}),
+)
+TEXTO_TIPOS = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+}
+
+_BLOCO = re.compile(
+    r"<(?P<tag>style|script)(?P<attrs>[^>]*)>(?P<corpo>.*?)</(?P=tag)>",
+    re.IGNORECASE | re.DOTALL,
+)
+_JINJA = re.compile(r"{{|{%|{#")
+
+
+def _fingerprint(conteudo: str | bytes) -> str:
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    return hashlib.sha256(conteudo).hexdigest()[:12]
+
+
+def _gravar_dist(relativo: str, dados: bytes) -> str:
+    destino = os.path.join(DIST_DIR, relativo)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "wb") as f:
+        f.write(dados)
+    return f"dist/{relativo}"
+
+
+def _tem_codigo(tag: str, corpo: str) -> bool:
+    # Blocos só com comentários não valem uma requisição extra
+    sem_comentarios = re.sub(r"/\*.*?\*/", "", corpo, flags=re.DOTALL)
+    if tag == "script":
+        sem_comentarios = re.sub(r"^\s*//.*$", "", sem_comentarios, flags=re.MULTILINE)
+    return bool(sem_comentarios.strip())
+
+
+def _extrair(nome: str, html: str, manifest: dict) -> str:
+    base = os.path.splitext(nome)[0].lower()
+    contador = {"style": 0, "script": 0}
+
+    def substituir(m: re.Match) -> str:
+        tag = m.group("tag").lower()
+        attrs = m.group("attrs")
+        corpo = m.group("corpo")
+
+        # Scripts externos, tipos não-JS e blocos com Jinja ficam como estão
+        if tag == "script" and re.search(r"\bsrc\s*=", attrs, re.IGNORECASE):
+            return m.group(0)
+        if tag == "script" and re.search(r"\btype\s*=\s*['\"](?!text/javascript|module)", attrs, re.IGNORECASE):
+            return m.group(0)
+        if _JINJA.search(corpo) or not _tem_codigo(tag, corpo):
+            return m.group(0)
+
+        contador[tag] += 1
+        ext = "css" if tag == "style" else "js"
+        arquivo = f"{base}.{contador[tag]}.{_fingerprint(corpo)}.{ext}"
+        with open(os.path.join(DIST_DIR, arquivo), "w", encoding="utf-8") as f:
+            f.write(corpo.strip() + "\n")
+        manifest[f"{nome}#{tag}{contador[tag]}"] = f"{DIST_URL}/{arquivo}"
+
+        if tag == "style":
+            return f'<link rel="stylesheet" href="{DIST_URL}/{arquivo}">'
+        return f'<script{attrs} src="{DIST_URL}/{arquivo}"></script>'
+
+    return _BLOCO.sub(substituir, html)
+
+
+def otimizar_imagens(variants: dict) -> None:
+    from PIL import Image
+
+    for nome in sorted(os.listdir(STATIC_DIR)):
+        stem, ext = os.path.splitext(nome)
+        if ext.lower() not in (".png", ".jpg", ".jpeg"):
+            continue
+        origem = os.path.join(STATIC_DIR, nome)
+        tamanho_original = os.path.getsize(origem)
+
+        with Image.open(origem) as img:
+            img.load()
+            formato_original = img.format
+            if max(img.size) > IMG_MAX_LADO:
+                img.thumbnail((IMG_MAX_LADO, IMG_MAX_LADO), Image.LANCZOS)
+
+            tipos = {}
+            for media_type, formato, extensao, opcoes in IMG_FORMATOS:
+                buf = BytesIO()
+                img.save(buf, format=formato, **opcoes)
+                dados = buf.getvalue()
+                # Só vale a pena se for menor que o arquivo original
+                if len(dados) < tamanho_original:
+                    tipos[media_type] = _gravar_dist(
+                        f"img/{stem}.{_fingerprint(dados)}.{extensao}", dados
+                    )
+
+            buf = BytesIO()
+            img.save(buf, format=formato_original, optimize=True)
+            dados = buf.getvalue()
+            fallback = None
+            if len(dados) < tamanho_original:
+                fallback = _gravar_dist(
+                    f"img/{stem}.{_fingerprint(dados)}{ext.lower()}", dados
+                )
+
+        if tipos or fallback:
+            variants[nome] = {"types": tipos, "fallback": fallback}
+
+
+def precomprimir(variants: dict) -> None:
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli não instalado: gerando apenas .gz")
+
+    for pasta, _, arquivos in os.walk(STATIC_DIR):
+        for nome in sorted(arquivos):
+            ext = os.path.splitext(nome)[1].lower()
+            if ext not in TEXTO_TIPOS:
+                continue
+            caminho = os.path.join(pasta, nome)
+            relativo = os.path.relpath(caminho, STATIC_DIR).replace(os.sep, "/")
+            with open(caminho, "rb") as f:
+                dados = f.read()
+
+            encodings = {}
+            gz = gzip.compress(dados, compresslevel=9, mtime=0)
+            if len(gz) < len(dados):
+                encodings["gzip"] = _gravar_dist(f"pre/{relativo}.gz", gz)
+            if brotli is not None:
+                br = brotli.compress(dados, quality=11)
+                if len(br) < len(dados):
+                    encodings["br"] = _gravar_dist(f"pre/{relativo}.br", br)
+
+            if encodings:
+                variants[relativo] = {
+                    "encodings": encodings,
+                    "content_type": TEXTO_TIPOS[ext],
+                }
+
+
+def build() -> dict:
+    # Limpa saídas antigas: hashes mudam a cada alteração
+    for pasta in (BUILD_DIR, DIST_DIR):
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.makedirs(pasta, exist_ok=True)
+
+    manifest: dict[str, str] = {}
+    fontes: dict[str, str] = {}
+    for nome in sorted(os.listdir(TEMPLATES_DIR)):
+        if not nome.endswith(".html"):
+            continue
+        caminho = os.path.join(TEMPLATES_DIR, nome)
+        with open(caminho, "rb") as f:
+            fontes[nome] = hashlib.sha256(f.read()).hexdigest()
+        with open(caminho, "r", encoding="utf-8") as f:
+            html = f.read()
+        saida = _extrair(nome, html, manifest)
+        with open(os.path.join(BUILD_DIR, nome), "w", encoding="utf-8") as f:
+            f.write(saida)
+    # O app compara com os originais no startup (app/templating.py)
+    with open(FONTES_PATH, "w", encoding="utf-8") as f:
+        json.dump(fontes, f, indent=2, sort_keys=True)
+
+    with open(os.path.join(DIST_DIR, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    variants: dict[str, dict] = {}
+    otimizar_imagens(variants)
+    precomprimir(variants)
+    with open(os.path.join(DIST_DIR, "variants.json"), "w", encoding="utf-8") as f:
+        json.dump(variants, f, indent=2, sort_keys=True)
+    print(f"{len(variants)} arquivos com variantes otimizadas")
+    return manifest
+
+
+def main() -> int:
+    manifest = build()
+    print(f"{len(manifest)} blocos extraídos para {DIST_DIR}")
+    for chave, url in sorted(manifest.items()):
+        print(f"  {chave:<32} {url}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
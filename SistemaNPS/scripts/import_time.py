@@ -0,0 +1,62 @@
+"""
+Mede o custo de importação de app.main com `python -X importtime`.
+
+Uso (a partir da pasta SistemaNPS):
+
+    python scripts/import_time.py              # total + 15 módulos mais caros
+    python scripts/import_time.py --limite-ms 400
+
+Com --limite-ms, sai com código 1 se o import passar do limite.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+def medir(modulo: str) -> list[tuple[str, int, int]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+
+    linhas = []
+    for linha in proc.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, dados = linha.split(":", 1)
+        proprio, cumulativo, nome = (p.strip() for p in dados.split("|", 2))
+        if not proprio.isdigit():
+            continue  # cabeçalho
+        linhas.append((nome, int(proprio), int(cumulativo)))
+    return linhas
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tempo de importação do app")
+    parser.add_argument("--modulo", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--limite-ms", type=float)
+    args = parser.parse_args(argv)
+
+    linhas = medir(args.modulo)
+    total_us = next((c for n, _, c in linhas if n == args.modulo), 0)
+
+    print(f"{args.modulo}: {total_us / 1000:.1f} ms (cumulativo)\n")
+    print(f"{'módulo':<60}{'próprio ms':>12}{'cumulativo ms':>15}")
+    for nome, proprio, cumulativo in sorted(linhas, key=lambda x: -x[2])[1:args.top + 1]:
+        print(f"{nome.strip():<60}{proprio / 1000:>12.1f}{cumulativo / 1000:>15.1f}")
+
+    if args.limite_ms is not None and total_us / 1000 > args.limite_ms:
+        print(f"\nImport acima do limite ({args.limite_ms} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
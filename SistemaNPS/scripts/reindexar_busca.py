@@ -0,0 +1,25 @@
+"""
+Reconstrói o índice de busca textual (app/services/search.py) a partir do banco.
+
+Uso (a partir da pasta SistemaNPS):
+
+    python scripts/reindexar_busca.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> int:
+    from app.services import search
+
+    inicio = time.perf_counter()
+    total = search.reindexar(progresso=lambda n: print(f"  {n} processos lidos"))
+    print(f"{total} processos indexados em {time.perf_counter() - inicio:.1f}s ({search.SEARCH_DB_PATH})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+"""
+Regera os PDFs de termo e ressalvas com o layout atual (app/services/rerender.py).
+
+Uso (a partir da pasta SistemaNPS), depois de alterar pdf_layout.py e
+incrementar LAYOUT_VERSION:
+
+    python scripts/rerender_pdfs.py --dry-run
+    python scripts/rerender_pdfs.py --empresa "ACME" --desde 2026-01-01 --taxa 5
+
+Interrompido, continua do checkpoint na execução seguinte (mesmos filtros).
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> int:
+    from app.services import rerender
+
+    parser = argparse.ArgumentParser(description="Regera PDFs de termo/ressalvas")
+    parser.add_argument("--empresa", help="só processos desta empresa")
+    parser.add_argument("--desde", type=date.fromisoformat, help="criado_em a partir de (AAAA-MM-DD)")
+    parser.add_argument("--ate", type=date.fromisoformat, help="criado_em até (inclusivo)")
+    parser.add_argument("--tipo", choices=("termo", "ressalvas"), action="append",
+                        help="documentos a regerar (padrão: ambos)")
+    parser.add_argument("--limite", type=int, help="no máximo N processos")
+    parser.add_argument("--processos", type=int, help="pool de render (padrão: núcleos)")
+    parser.add_argument("--concorrencia", type=int, default=4, help="uploads simultâneos")
+    parser.add_argument("--taxa", type=float, default=5.0, help="gravações por segundo (0 = sem limite)")
+    parser.add_argument("--checkpoint", default=rerender.CHECKPOINT_PATH)
+    parser.add_argument("--recomecar", action="store_true", help="ignora o checkpoint existente")
+    parser.add_argument("--remover-antigos", action="store_true",
+                        help="apaga do storage o PDF substituído (e a miniatura)")
+    parser.add_argument("--dry-run", action="store_true", help="só conta o que seria regerado")
+    args = parser.parse_args()
+
+    if args.recomecar and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    filtros = rerender.Filtros(
+        empresa=args.empresa,
+        desde=args.desde,
+        ate=args.ate,
+        tipos=tuple(args.tipo or ("termo", "ressalvas")),
+        limite=args.limite,
+    )
+
+    inicio = time.perf_counter()
+
+    def progresso(r):
+        print(f"  {r.processos} processos, {r.renderizados} regerados, {r.em_dia} em dia, {r.alterados} alterados, {len(r.erros)} erros")
+
+    resultado = rerender.executar(
+        filtros,
+        processos=args.processos,
+        concorrencia=args.concorrencia,
+        taxa=args.taxa,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run,
+        remover_antigos=args.remover_antigos,
+        progresso=progresso,
+    )
+
+    acao = "a regerar" if args.dry_run else "regerados"
+    print(
+        f"{resultado.processos} processos em {time.perf_counter() - inicio:.1f}s: "
+        f"{resultado.renderizados} PDFs {acao}, {resultado.em_dia} já no layout atual, "
+        f"{resultado.alterados} alterados durante o job, "
+        f"{len(resultado.erros)} erros"
+    )
+    for erro in resultado.erros[:20]:
+        print(f"  ERRO {erro}")
+    return 1 if resultado.erros else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+-- Envio idempotente do /termo/salvar (modo offline, app/services/client_ids.py).
+-- Sem esta coluna o servidor ignora o client_id: continua salvando, só não
+-- reconhece reenvios da fila offline.
+alter table processos add column if not exists client_id text;
+create unique index if not exists processos_client_id_key on processos (client_id);